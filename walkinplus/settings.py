@@ -46,14 +46,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Health probes return before sessions/auth/CSRF (keep this first)
+    'walkinplus_app.middleware.HealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Token-authenticated kiosk check-ins skip sessions/CSRF/messages
+    'walkinplus_app.middleware.KioskCheckinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'walkinplus_app.middleware.TenantShardMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'walkinplus_app.middleware.PinPrimaryAfterWriteMiddleware',
+    'walkinplus_app.middleware.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'walkinplus.urls'
@@ -82,15 +89,134 @@ WSGI_APPLICATION = 'walkinplus.wsgi.application'
 import dj_database_url
 import os
 
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+# Optional read replica for dashboards / reports / exports. Locally this can
+# be a second SQLite file (a copy of the primary), e.g.
+#   DATABASE_URL=sqlite:///db.sqlite3 REPLICA_DATABASE_URL=sqlite:///replica.sqlite3
+REPLICA_DATABASE_URL = os.environ.get("REPLICA_DATABASE_URL")
+
 DATABASES = {
     'default': dj_database_url.config(
-        default=os.environ.get("DATABASE_URL"),
+        default=DATABASE_URL,
         conn_max_age=600,
-        ssl_require=True
+        ssl_require=not (DATABASE_URL or "").startswith("sqlite")
     )
 }
 
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(
+        REPLICA_DATABASE_URL,
+        conn_max_age=600,
+        ssl_require=not REPLICA_DATABASE_URL.startswith("sqlite")
+    )
+    # Tests use the primary for both aliases
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+# Extra databases for tenant shards, as comma-separated "alias=url" pairs, e.g.
+#   SHARD_DATABASE_URLS=shard1=sqlite:///shard1.sqlite3,shard2=sqlite:///shard2.sqlite3
+# Owners are placed on a shard with `python manage.py move_tenant`.
+SHARD_DATABASES = []
+for _entry in filter(None, os.environ.get("SHARD_DATABASE_URLS", "").split(",")):
+    _alias, _url = (part.strip() for part in _entry.split("=", 1))
+    DATABASES[_alias] = dj_database_url.parse(
+        _url,
+        conn_max_age=600,
+        ssl_require=not _url.startswith("sqlite")
+    )
+    SHARD_DATABASES.append(_alias)
+
+# Ids per tenant database: the n-th database in [primary, *SHARD_DATABASES]
+# allocates ids from n * SHARD_ID_BLOCK, so moved tenants keep their ids.
+# Only append to SHARD_DATABASE_URLS; reordering it changes the blocks.
+SHARD_ID_BLOCK = int(os.environ.get("SHARD_ID_BLOCK", 100_000_000))
+
+# How long each process caches an owner's shard (seconds)
+SHARD_MAP_CACHE_SECONDS = int(os.environ.get("SHARD_MAP_CACHE_SECONDS", 30))
+
+DATABASE_ROUTERS = [
+    'walkinplus_app.routers.OwnerShardRouter',
+    'walkinplus_app.routers.PrimaryReplicaRouter',
+]
 
+# After a write, the client reads from the primary for this many seconds
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 10))
+
+
+# Walk-ins older than this many days are moved to the archive table by
+# `python manage.py archive_walkins` (run it from a scheduled job).
+WALKIN_ARCHIVE_AFTER_DAYS = int(os.environ.get("WALKIN_ARCHIVE_AFTER_DAYS", 365))
+
+# Background CSV exports (Reports tab): worker threads per process, how
+# many exports one owner may have pending/running at a time, and how many
+# of those may run at once (the rest wait their turn, leaving workers free
+# for other owners).
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+EXPORT_JOBS_PER_OWNER = int(os.environ.get("EXPORT_JOBS_PER_OWNER", 2))
+EXPORT_RUNNING_PER_OWNER = int(os.environ.get("EXPORT_RUNNING_PER_OWNER", 1))
+# A running export renews its lease well within this many seconds; jobs
+# whose lease ran out (worker gone) can be requeued by run_export_jobs
+EXPORT_LEASE_SECONDS = int(os.environ.get("EXPORT_LEASE_SECONDS", 300))
+
+# On-demand request profiles (?_profile=1, staff only; &_profile_as=<owner
+# id> runs a GET as that owner) are written here; each staff user may take
+# this many per hour.
+REQUEST_PROFILE_DIR = os.environ.get("REQUEST_PROFILE_DIR", str(BASE_DIR / "profiles"))
+REQUEST_PROFILE_RATE = int(os.environ.get("REQUEST_PROFILE_RATE", 10))
+
+# Largest batch a reception desk may push to /patient-dashboard/sync/
+SYNC_MAX_EVENTS = int(os.environ.get("SYNC_MAX_EVENTS", 500))
+
+# Delta exports (?export=delta) stop this many seconds short of now, so
+# changes whose transaction is still committing land in the next pull
+DELTA_EXPORT_SETTLE_SECONDS = int(os.environ.get("DELTA_EXPORT_SETTLE_SECONDS", 60))
+
+# Weight of the newest visit in the live wait-time estimate (0–1)
+WAIT_ESTIMATE_ALPHA = float(os.environ.get("WAIT_ESTIMATE_ALPHA", 0.2))
+
+# How long the "all businesses" overview figures are cached (seconds)
+OVERVIEW_CACHE_SECONDS = int(os.environ.get("OVERVIEW_CACHE_SECONDS", 60))
+
+# Self check-in kiosks: check-ins arriving within KIOSK_BATCH_WAIT_MS of
+# each other are inserted together (up to KIOSK_BATCH_SIZE per INSERT);
+# a check-in with nobody else queued does not wait.
+KIOSK_BATCH_SIZE = int(os.environ.get("KIOSK_BATCH_SIZE", 200))
+KIOSK_BATCH_WAIT_MS = int(os.environ.get("KIOSK_BATCH_WAIT_MS", 2))
+KIOSK_MAX_BODY_BYTES = int(os.environ.get("KIOSK_MAX_BODY_BYTES", 4096))
+KIOSK_TOKEN_CACHE_SECONDS = int(os.environ.get("KIOSK_TOKEN_CACHE_SECONDS", 60))
+
+# Purpose suggestions on the walk-in form: how many, and how long the
+# per-business list is cached (seconds)
+PURPOSE_SUGGESTIONS = int(os.environ.get("PURPOSE_SUGGESTIONS", 8))
+PURPOSE_CACHE_SECONDS = int(os.environ.get("PURPOSE_CACHE_SECONDS", 3600))
+
+# Walk-in trend charts: most points per series (buckets widen from day to
+# week / month / year to stay under it) and how long a series is cached.
+SERIES_MAX_POINTS = int(os.environ.get("SERIES_MAX_POINTS", 250))
+SERIES_CACHE_SECONDS = int(os.environ.get("SERIES_CACHE_SECONDS", 600))
+
+
+# Outbound webhooks for walk-in events: WEBHOOK_URLS="sms=https://...,billing=https://..."
+# Each endpoint gets batches of up to WEBHOOK_BATCH_SIZE events, at most
+# WEBHOOK_CONCURRENCY_PER_ENDPOINT at a time, signed with WEBHOOK_SECRET.
+WEBHOOK_ENDPOINTS = {}
+for _entry in filter(None, os.environ.get("WEBHOOK_URLS", "").split(",")):
+    _name, _url = (part.strip() for part in _entry.split("=", 1))
+    WEBHOOK_ENDPOINTS[_name] = _url
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", SECRET_KEY)
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", 4))
+WEBHOOK_CONCURRENCY_PER_ENDPOINT = int(os.environ.get("WEBHOOK_CONCURRENCY_PER_ENDPOINT", 2))
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", 50))
+WEBHOOK_TIMEOUT_SECONDS = float(os.environ.get("WEBHOOK_TIMEOUT_SECONDS", 5))
+# Retries wait WEBHOOK_RETRY_BASE_SECONDS, then twice as long each time (max 1h)
+WEBHOOK_RETRY_BASE_SECONDS = int(os.environ.get("WEBHOOK_RETRY_BASE_SECONDS", 10))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", 10))
+
+# Uploaded business logos (needs Pillow): largest accepted upload, and the
+# thumbnail sizes in pixels. The first size is the display size; the others
+# are served to high-density screens.
+LOGO_MAX_UPLOAD_BYTES = int(os.environ.get("LOGO_MAX_UPLOAD_BYTES", 2 * 1024 * 1024))
+LOGO_SIZES = [int(size) for size in os.environ.get("LOGO_SIZES", "64,128").split(",")]
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -25,5 +25,10 @@ urlpatterns = [
     path('signup/', views.signup_page, name='signuppage'),
     path('home/', views.home, name='home'),
     path('patient-dashboard/', views.patient_dashboard, name='patient_dashboard'),
+    path('patient-dashboard/sync/', views.patient_dashboard_sync, name='patient_dashboard_sync'),
     path('management-dashboard/', views.management_dashboard, name='management_dashboard'),
+    path('management-dashboard/all-businesses/', views.businesses_overview, name='businesses_overview'),
+    path('management-dashboard/trends/', views.walkin_trends, name='walkin_trends'),
+    path('exports/<int:job_id>/download/', views.export_download, name='export_download'),
+    path('logos/<str:name>', views.logo_file, name='logo_file'),
 ]
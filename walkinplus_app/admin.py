@@ -1,8 +1,15 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.urls import reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
 
-from .models import UserDetails, BusinessDetails, CustomerDetails
+from .models import UserDetails, BusinessDetails, CustomerDetails, ArchivedCustomerDetails, VisitPurpose
 
 
 # ---------- USER DETAILS AS SEPARATE MODEL IN ADMIN ----------
@@ -42,21 +49,229 @@ class BusinessDetailsAdmin(admin.ModelAdmin):
 
 # ---------- CUSTOMER DETAILS ADMIN ----------
 
+class EstimatedCountPaginator(Paginator):
+    """
+    On Postgres, use the planner's row estimate for the unfiltered
+    changelist instead of COUNT(*) over millions of rows. Filtered and
+    small tables still get an exact count.
+    """
+
+    # Below this many (estimated) rows an exact count is cheap enough
+    EXACT_COUNT_BELOW = 100000
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        connection = connections[qs.db]
+
+        if connection.vendor == "postgresql" and not qs.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                    [qs.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= self.EXACT_COUNT_BELOW:
+                return int(row[0])
+
+        return super().count
+
+
+class WalkinDatesQuerySet(models.QuerySet):
+    """
+    dates() for the date hierarchy: DISTINCT walk-in dates read off the
+    cust_walkin_date / (business, cust_walkin_date) indexes, bucketed into
+    years/months in Python. The stock dates() truncates every row in SQL,
+    which no index can answer.
+    """
+
+    TRUNCATE = {
+        "year": lambda day: day.replace(month=1, day=1),
+        "month": lambda day: day.replace(day=1),
+        "day": lambda day: day,
+    }
+
+    def dates(self, field_name, kind, order="ASC"):
+        if kind not in self.TRUNCATE:
+            return super().dates(field_name, kind, order)
+        days = self.order_by().values_list(field_name, flat=True).distinct()
+        truncate = self.TRUNCATE[kind]
+        return sorted({truncate(day) for day in days if day is not None}, reverse=order == "DESC")
+
+
+class BusinessAutocompleteFilter(admin.SimpleListFilter):
+    """
+    Business filter with a searchable select (the admin's own autocomplete
+    view over BusinessDetailsAdmin.search_fields), so the sidebar never
+    lists every business. ?business=<id> (the Business column link) works
+    too.
+    """
+
+    title = "business"
+    parameter_name = "business"
+    template = "admin/autocomplete_filter.html"
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.admin_site = model_admin.admin_site
+
+    def lookups(self, request, model_admin):
+        # Choices come from the autocomplete view, not from here
+        return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        value = self.value() if (self.value() or "").isdigit() else None
+        field = forms.ModelChoiceField(
+            BusinessDetails.objects.all(),
+            widget=AutocompleteSelect(CustomerDetails._meta.get_field("business"), self.admin_site),
+        )
+        yield {
+            "selected": value is None,
+            "query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            "display": "All",
+        }
+        yield {
+            "widget": field.widget.render(self.parameter_name, value, attrs={"id": "business-filter"}),
+            # The picked id replaces __id__ (other filters are kept)
+            "query_string": changelist.get_query_string({self.parameter_name: "__id__"}),
+        }
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(business_id=value)
+        return queryset
+
+
+class SelectedPurposeFilter(admin.SimpleListFilter):
+    """
+    Purpose filter on the catalog key (an integer comparison), picked via
+    the Purpose column link (or ?purpose=<id>).
+    """
+
+    title = "purpose"
+    parameter_name = "purpose"
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not value or not value.isdigit():
+            return []
+        purpose = VisitPurpose.objects.filter(pk=value).first()
+        return [(value, str(purpose))] if purpose else []
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(purpose_id=value)
+        return queryset
+
+
+@admin.register(VisitPurpose)
+class VisitPurposeAdmin(admin.ModelAdmin):
+    list_display = ("name", "key", "business", "created_at")
+    list_select_related = ("business",)
+    search_fields = ("name", "key")
+    autocomplete_fields = ("business",)
+    readonly_fields = ("created_at",)
+
+
 @admin.register(CustomerDetails)
 class CustomerDetailsAdmin(admin.ModelAdmin):
     list_display = (
         "cust_id",
+        "cust_token",
         "cust_name",
-        "business",
+        "business_link",
         "cust_contact_number",
-        "cust_visit_purpose",
+        "purpose_link",
         "cust_walkin_date",
         "cust_clockin",
         "cust_clockout",
     )
-    list_filter = ("business", "cust_visit_purpose", "cust_walkin_date")
+    # One JOIN instead of one business query per row
+    list_select_related = ("business",)
+
+    # No DISTINCT over purposes; businesses are searched, purposes picked from the list itself
+    list_filter = (BusinessAutocompleteFilter, SelectedPurposeFilter)
+
+    # Year → month → day drill-down over the walk-in date index
+    date_hierarchy = "cust_walkin_date"
+
     search_fields = ("cust_name", "cust_contact_number", "business__business_name")
-    readonly_fields = ("created_at",)
+    readonly_fields = ("created_at", "updated_at")
+
+    # Searchable selects instead of loading every user/business into a <select>
+    autocomplete_fields = ("user", "business", "purpose")
+
+    # No exact COUNT(*) over the whole table on every page load
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        return WalkinDatesQuerySet(qs.model, query=qs.query, using=qs._db, hints=qs._hints)
+
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            # A LIKE search scans the table anyway; let the stock dates() share that scan
+            # rather than walk the date index and fetch every row
+            queryset = models.QuerySet(queryset.model, query=queryset.query, using=queryset._db, hints=queryset._hints)
+        return queryset, may_have_duplicates
+
+    @property
+    def media(self):
+        # select2 + autocomplete.js for the business filter on the changelist
+        widget = AutocompleteSelect(CustomerDetails._meta.get_field("business"), self.admin_site)
+        return super().media + widget.media
+
+    @admin.display(description="Business", ordering="business__business_name")
+    def business_link(self, obj):
+        # Filter the changelist by this business (uses the business/date index)
+        url = reverse("admin:walkinplus_app_customerdetails_changelist")
+        return format_html(
+            '<a href="{}?business={}">{}</a>',
+            url,
+            obj.business_id,
+            obj.business,
+        )
+
+    @admin.display(description="Purpose", ordering="cust_visit_purpose")
+    def purpose_link(self, obj):
+        if obj.purpose_id is None:
+            return obj.cust_visit_purpose
+        url = reverse("admin:walkinplus_app_customerdetails_changelist")
+        return format_html(
+            '<a href="{}?purpose={}">{}</a>',
+            url,
+            obj.purpose_id,
+            obj.cust_visit_purpose,
+        )
+
+
+# ---------- ARCHIVED CUSTOMER DETAILS ADMIN (READ-ONLY) ----------
+
+@admin.register(ArchivedCustomerDetails)
+class ArchivedCustomerDetailsAdmin(admin.ModelAdmin):
+    list_display = (
+        "cust_id",
+        "cust_name",
+        "business",
+        "cust_visit_purpose",
+        "cust_walkin_date",
+        "archived_at",
+    )
+    search_fields = ("cust_name", "cust_contact_number")
+
+    # Archive rows are only written by the archive_walkins command
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 # ---------- INLINE USER DETAILS UNDER DJANGO USER ----------
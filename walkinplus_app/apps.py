@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class WalkinplusAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'walkinplus_app'
+
+    def ready(self):
+        from .sharding import reserve_shard_id_blocks
+
+        post_migrate.connect(reserve_shard_id_blocks, sender=self)
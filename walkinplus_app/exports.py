@@ -0,0 +1,238 @@
+"""
+Background export jobs: a database job table (ExportJob) worked by a
+small in-process thread pool. Files are written under MEDIA_ROOT/exports/.
+
+A worker claims a job with a lease (ExportJob.claim / lease_until) that it
+renews while writing; run_export_jobs --requeue-running only resets jobs
+whose lease ran out. A worker that finds its lease taken over stops, and
+only the worker holding the lease moves its file into place.
+"""
+import csv
+import gzip
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import BusinessDetails, ExportJob, ExportOwnerLock
+from .routers import reading_from_replica, tenant_database, tenant_db
+from .reports import CSV_HEADER, csv_row, iter_report_rows, parse_report_filters, report_querysets
+
+logger = logging.getLogger(__name__)
+
+# How often (in rows) progress is written back to the job row
+PROGRESS_EVERY = 5000
+
+ACTIVE_STATUSES = (ExportJob.STATUS_PENDING, ExportJob.STATUS_RUNNING)
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=settings.EXPORT_WORKERS,
+            thread_name_prefix="walkinplus-export",
+        )
+    return _pool
+
+
+class LeaseLost(Exception):
+    """The job was requeued (lease expired) and may be running elsewhere."""
+
+
+def _lock_owner(owner_id):
+    """
+    Serialise export bookkeeping of one owner (call inside a transaction)
+    by locking their ExportOwnerLock row, created on first use.
+    """
+    locked = ExportOwnerLock.objects.select_for_update().filter(owner_id=owner_id)
+    if not list(locked.values_list("pk", flat=True)):
+        ExportOwnerLock.objects.bulk_create([ExportOwnerLock(owner_id=owner_id)], ignore_conflicts=True)
+        list(locked.values_list("pk", flat=True))
+
+
+def _lease_end():
+    return timezone.now() + timedelta(seconds=settings.EXPORT_LEASE_SECONDS)
+
+
+def _renew_lease(job_id, claim):
+    renewed = ExportJob.objects.filter(
+        pk=job_id, status=ExportJob.STATUS_RUNNING, claim=claim
+    ).update(lease_until=_lease_end())
+    if not renewed:
+        raise LeaseLost(f"Export job {job_id} was requeued")
+
+
+def enqueue_export(owner, business, filters, file_format):
+    """
+    Create an ExportJob for the given parsed Reports filters and hand it to
+    the worker pool once the transaction commits. Returns None instead when
+    the owner already has EXPORT_JOBS_PER_OWNER exports pending/running, so
+    one clinic cannot fill the job table.
+    """
+    database = tenant_db()
+    with transaction.atomic(using=database):
+        # Count and insert under the lock: concurrent requests take turns
+        _lock_owner(owner.pk)
+        active = ExportJob.objects.filter(owner=owner, status__in=ACTIVE_STATUSES).count()
+        if active >= settings.EXPORT_JOBS_PER_OWNER:
+            return None
+
+        job = ExportJob.objects.create(
+            owner=owner,
+            business=business,
+            filters=filters,
+            file_format=file_format,
+        )
+        # Worker threads don't inherit the request's tenant; pass the shard along
+        transaction.on_commit(
+            lambda: _get_pool().submit(run_export_job, job.pk, database),
+            using=database,
+        )
+    return job
+
+
+def run_export_job(job_id, database=None, start_next=True):
+    """
+    Render one job to disk. Safe to call from a worker thread or from the
+    run_export_jobs management command; a job is only ever claimed once.
+    `database` is the tenant shard holding the job (default: primary).
+    With start_next, the owner's next waiting job goes to the pool once
+    this one is done.
+    """
+    with tenant_database(database):
+        _run_export_job(job_id, database, start_next)
+
+
+def _claim(job_id):
+    """
+    Pending -> running, unless the job's owner already has
+    EXPORT_RUNNING_PER_OWNER jobs running (it then stays pending and is
+    started when one of those finishes). Returns (owner id, claim), or
+    None.
+    """
+    owner_id = (
+        ExportJob.objects.filter(pk=job_id, status=ExportJob.STATUS_PENDING)
+        .values_list("owner_id", flat=True)
+        .first()
+    )
+    if owner_id is None:
+        return None
+
+    with transaction.atomic(using=tenant_db()):
+        _lock_owner(owner_id)
+        running = ExportJob.objects.filter(owner_id=owner_id, status=ExportJob.STATUS_RUNNING).count()
+        if running >= settings.EXPORT_RUNNING_PER_OWNER:
+            return None
+        # Conditional: two workers never run a job twice
+        claim = uuid.uuid4().hex
+        claimed = ExportJob.objects.filter(
+            pk=job_id, status=ExportJob.STATUS_PENDING
+        ).update(status=ExportJob.STATUS_RUNNING, claim=claim, lease_until=_lease_end())
+    return (owner_id, claim) if claimed else None
+
+
+def _start_next(owner_id, database):
+    next_id = (
+        ExportJob.objects.filter(owner_id=owner_id, status=ExportJob.STATUS_PENDING)
+        .order_by("created_at", "pk")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if next_id is not None:
+        _get_pool().submit(run_export_job, next_id, database)
+
+
+def _run_export_job(job_id, database, start_next):
+    try:
+        claimed = _claim(job_id)
+        if claimed is None:
+            return
+        owner_id, claim = claimed
+
+        job = ExportJob.objects.select_related("business").get(pk=job_id)
+        try:
+            _write_export(job, claim)
+        except LeaseLost:
+            logger.warning("Export job %s was requeued while running; stopped", job_id)
+        except Exception as exc:
+            logger.exception("Export job %s failed", job_id)
+            ExportJob.objects.filter(pk=job_id, claim=claim).update(
+                status=ExportJob.STATUS_FAILED,
+                error=str(exc)[:1000],
+                finished_at=timezone.now(),
+            )
+            BusinessDetails.mark_changed(pk=job.business_id)
+        if start_next:
+            _start_next(owner_id, database)
+    finally:
+        # Worker threads keep their own DB connections; don't leak them
+        close_old_connections()
+
+
+def _write_export(job, claim):
+    filters = parse_report_filters(job.filters)
+    # Renew well before the lease runs out
+    renew_every = settings.EXPORT_LEASE_SECONDS / 3
+
+    # The report itself is read from the replica; job progress is written to the primary
+    with reading_from_replica():
+        qs, archived_qs = report_querysets(job.owner_id, job.business, filters)
+        total = qs.count() + (archived_qs.count() if archived_qs is not None else 0)
+    _renew_lease(job.pk, claim)
+    renewed_at = time.monotonic()
+    ExportJob.objects.filter(pk=job.pk).update(total_rows=total)
+
+    file_name = f"exports/{job.owner_id}/walkins-{job.business_id}-{job.pk}.{job.file_format}"
+    path = Path(settings.MEDIA_ROOT) / file_name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Each claim writes its own file: a worker that lost its lease can't
+    # write into the file of the one that took over
+    part = path.with_name(f"{path.name}.{claim}.part")
+
+    if job.file_format == ExportJob.FORMAT_CSV_GZ:
+        fh = gzip.open(part, "wt", newline="", encoding="utf-8")
+    else:
+        fh = open(part, "w", newline="", encoding="utf-8")
+
+    written = 0
+    try:
+        with fh, reading_from_replica():
+            writer = csv.writer(fh)
+            writer.writerow(CSV_HEADER)
+            for r in iter_report_rows(qs, archived_qs):
+                writer.writerow(csv_row(r))
+                written += 1
+                if written % PROGRESS_EVERY == 0:
+                    ExportJob.objects.filter(pk=job.pk, claim=claim).update(rows_written=written)
+                    # Progress is shown on the Reports tab
+                    BusinessDetails.mark_changed(pk=job.business_id)
+                if time.monotonic() - renewed_at >= renew_every:
+                    _renew_lease(job.pk, claim)
+                    renewed_at = time.monotonic()
+
+        with transaction.atomic(using=tenant_db()):
+            finished = ExportJob.objects.filter(
+                pk=job.pk, status=ExportJob.STATUS_RUNNING, claim=claim
+            ).update(
+                status=ExportJob.STATUS_DONE,
+                rows_written=written,
+                file_name=file_name,
+                finished_at=timezone.now(),
+                lease_until=None,
+            )
+            if not finished:
+                raise LeaseLost(f"Export job {job.pk} was requeued")
+            os.replace(part, path)
+    finally:
+        part.unlink(missing_ok=True)
+    BusinessDetails.mark_changed(pk=job.business_id)
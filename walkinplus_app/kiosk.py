@@ -0,0 +1,276 @@
+"""
+Self check-in kiosks: a tablet at the door posts walk-ins as JSON with a
+per-business token (see middleware.KioskCheckinMiddleware).
+
+Concurrent check-ins are group-committed: the first request to arrive
+becomes the leader, waits KIOSK_BATCH_WAIT_MS for others to queue up
+(unless it is alone), then inserts the whole batch with one bulk_create
+and hands every caller its own visit id. Whoever is queued first when a
+batch finishes leads the next one, so no request waits behind more than
+one batch. If a batch fails, its check-ins are retried one by one so a
+single bad row only fails its own request.
+
+Batches only form with several requests in one process at once: run
+gunicorn with threads (see the Dockerfile).
+"""
+import hashlib
+import json
+import secrets
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from .models import BusinessDetails, CustomerDetails, TenantShard, WebhookEvent
+from .purposes import purpose_ids, purpose_key
+from .queue_tokens import assign_tokens
+from .routers import tenant_database
+from .sharding import shard_for_owner, tenant_database_aliases
+from .sync import parse_walkin_fields
+from .usage import count_walkins
+from .waittime import record_walkins
+from .webhooks import enqueue_events
+
+
+# ---------- TOKENS ----------
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _token_cache_key(token_hash):
+    return f"kiosk-token:{token_hash}"
+
+
+def new_kiosk_token(business):
+    """
+    Issue a new token for the business (the old one stops working).
+    Returns the token; only its hash is stored.
+    """
+    if business.kiosk_token_hash:
+        cache.delete(_token_cache_key(business.kiosk_token_hash))
+    token = secrets.token_urlsafe(24)
+    business.kiosk_token_hash = hash_token(token)
+    business.save(update_fields=["kiosk_token_hash"])
+    return token
+
+
+def resolve_kiosk_token(token):
+    """
+    (business id, owner id) for a valid token of an active business, else
+    None. Cached for KIOSK_TOKEN_CACHE_SECONDS.
+    """
+    token_hash = hash_token(token)
+    key = _token_cache_key(token_hash)
+    entry = cache.get(key)
+    if entry is None:
+        entry = ()
+        # The business lives on its owner's shard, which we don't know yet;
+        # tokens are unguessable, so try each
+        for alias in tenant_database_aliases():
+            row = (
+                BusinessDetails.objects.using(alias)
+                .filter(kiosk_token_hash=token_hash, is_active=True)
+                .values_list("pk", "owner_id")
+                .first()
+            )
+            if row:
+                entry = row
+                break
+        cache.set(key, entry, settings.KIOSK_TOKEN_CACHE_SECONDS)
+    return entry or None
+
+
+# ---------- GROUP COMMIT ----------
+
+class _Checkin:
+    __slots__ = ("alias", "business_id", "owner_id", "fields", "visit_id", "token", "error", "leader", "wake")
+
+    def __init__(self, alias, business_id, owner_id, fields):
+        self.alias = alias
+        self.business_id = business_id
+        self.owner_id = owner_id
+        self.fields = fields
+        self.visit_id = None
+        self.token = None
+        self.error = None
+        self.leader = False
+        self.wake = threading.Event()
+
+
+class CheckinBatcher:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._leading = False
+
+    def submit(self, alias, business_id, owner_id, fields):
+        """
+        Queue one check-in and block until it is committed; returns
+        (visit id, queue token).
+        """
+        item = _Checkin(alias, business_id, owner_id, fields)
+        with self._lock:
+            self._pending.append(item)
+            if not self._leading:
+                self._leading = item.leader = True
+
+        if not item.leader:
+            # Woken when our batch is committed, or to lead the next batch
+            item.wake.wait()
+        if item.leader:
+            self._lead()
+
+        if item.error is not None:
+            raise item.error
+        return item.visit_id, item.token
+
+    def _lead(self):
+        with self._lock:
+            alone = len(self._pending) == 1
+        # A lone check-in goes straight in; company only gathers while a
+        # batch is being inserted, so the next leader is rarely alone
+        wait_ms = settings.KIOSK_BATCH_WAIT_MS
+        if wait_ms > 0 and not alone:
+            time.sleep(wait_ms / 1000)
+
+        with self._lock:
+            batch = self._pending[:settings.KIOSK_BATCH_SIZE]
+            del self._pending[:len(batch)]
+
+        try:
+            _save_checkins(batch)
+        finally:
+            with self._lock:
+                if self._pending:
+                    nxt = self._pending[0]
+                    nxt.leader = True
+                    nxt.wake.set()
+                else:
+                    self._leading = False
+            for item in batch:
+                item.wake.set()
+
+
+def _save_checkins(batch):
+    by_alias = defaultdict(list)
+    for item in batch:
+        by_alias[item.alias].append(item)
+
+    for alias, items in by_alias.items():
+        error = _try_insert(alias, items)
+        if error is None:
+            continue
+        if len(items) == 1:
+            items[0].error = error
+            continue
+        # One bad check-in must not fail the rest: retry them one at a time
+        for item in items:
+            item.error = _try_insert(alias, [item])
+
+
+def _try_insert(alias, items):
+    """
+    Insert the check-ins in one transaction; returns the exception if it
+    was rolled back, else None.
+    """
+    try:
+        with tenant_database(alias), transaction.atomic(using=alias):
+            _insert(items)
+    except Exception as exc:
+        return exc
+    return None
+
+
+def _insert(items):
+    by_business = defaultdict(list)
+    for item in items:
+        by_business[item.business_id].append(item)
+
+    pairs = []  # (item, unsaved visit)
+    for business_id, business_items in by_business.items():
+        catalog = purpose_ids(business_id, [i.fields["cust_visit_purpose"] for i in business_items])
+        business_pairs = [
+            (item, CustomerDetails(
+                user_id=item.owner_id,
+                business_id=business_id,
+                purpose_id=catalog.get(purpose_key(item.fields["cust_visit_purpose"])),
+                **item.fields,
+            ))
+            for item in business_items
+        ]
+        # Tokens in arrival order; one counter update for the whole batch
+        assign_tokens(business_id, [visit for _, visit in business_pairs])
+        pairs.extend(business_pairs)
+
+    visits = CustomerDetails.objects.bulk_create([visit for _, visit in pairs])
+    visits_by_business = defaultdict(list)
+    for (item, _), visit in zip(pairs, visits):
+        item.visit_id = visit.pk
+        item.token = visit.cust_token
+        visits_by_business[item.business_id].append(visit)
+
+    # One estimator update (and outbox insert) per business, not per visit
+    for business_id, business_items in by_business.items():
+        record_walkins(business_id, [i.fields["cust_visit_purpose"] for i in business_items])
+        enqueue_events(business_id, WebhookEvent.TYPE_WALKIN_CREATED, visits_by_business[business_id])
+        count_walkins(business_id, visits_by_business[business_id])
+    BusinessDetails.mark_changed(pk__in=by_business)
+
+
+batcher = CheckinBatcher()
+
+
+# ---------- REQUEST HANDLER ----------
+
+def handle_checkin(request):
+    """
+    POST JSON {"phone": ..., "first_name": ..., "last_name", "purpose", ...}
+    with "Authorization: Bearer <kiosk token>". Returns 201
+    {"visit_id": n, "token": queue number for today}.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "POST only."}, status=405)
+
+    auth = request.META.get("HTTP_AUTHORIZATION", "")
+    scheme, _, token = auth.partition(" ")
+    entry = resolve_kiosk_token(token.strip()) if scheme.lower() == "bearer" and token else None
+    if entry is None:
+        return JsonResponse({"error": "Invalid kiosk token."}, status=401)
+
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    if length > settings.KIOSK_MAX_BODY_BYTES:
+        return JsonResponse({"error": "Request too large."}, status=413)
+
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+
+    now = timezone.localtime()
+    try:
+        fields = parse_walkin_fields(data, now.date(), now.time())
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    # Kiosk check-ins are always "now"
+    fields["cust_walkin_date"] = now.date()
+    fields["cust_clockin"] = now.time()
+
+    business_id, owner_id = entry
+    alias, status = shard_for_owner(owner_id)
+    if status == TenantShard.STATUS_MOVING:
+        response = JsonResponse({"error": "Check-ins are paused briefly, try again."}, status=503)
+        response["Retry-After"] = str(settings.SHARD_MAP_CACHE_SECONDS)
+        return response
+    visit_id, queue_token = batcher.submit(alias, business_id, owner_id, fields)
+    return JsonResponse({"visit_id": visit_id, "token": queue_token}, status=201)
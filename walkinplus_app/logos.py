@@ -0,0 +1,156 @@
+"""
+Uploaded business logos.
+
+An upload is checked and stored once under MEDIA_ROOT/logos/originals/,
+then turned into thumbnails at LOGO_SIZES: AVIF and WebP where Pillow
+supports them, PNG for every browser. Each thumbnail is named after a
+hash of its content, so a URL never changes meaning and views.logo_file
+serves it with an immutable Cache-Control header.
+
+Uploads need Pillow; without it the rest of the app works and the upload
+field is hidden.
+"""
+import hashlib
+import io
+import os
+import re
+import tempfile
+import warnings
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import reverse
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+LOGO_DIR = "logos"
+
+# (file extension, content type, Pillow format, save options), best first:
+# each browser takes the first <picture> source it understands
+FORMATS = [
+    ("avif", "image/avif", "AVIF", {"quality": 60}),
+    ("webp", "image/webp", "WEBP", {"quality": 80, "method": 6}),
+    ("png", "image/png", "PNG", {"optimize": True}),
+]
+CONTENT_TYPES = {ext: content_type for ext, content_type, _, _ in FORMATS}
+
+# Names handed out by _store(); anything else is not a thumbnail
+THUMBNAIL_NAME = re.compile(r"^[0-9a-f]{20}\.(avif|webp|png)$")
+
+# What we accept as an upload (Pillow reads many more, e.g. via Ghostscript)
+UPLOAD_FORMATS = {"PNG": "png", "JPEG": "jpg", "GIF": "gif", "WEBP": "webp"}
+
+
+class LogoError(ValueError):
+    """The upload can't be used as a logo; the message is shown to the owner."""
+
+
+def uploads_enabled():
+    return Image is not None
+
+
+def _thumbnail_formats():
+    with warnings.catch_warnings():
+        # Older Pillow warns about feature names it doesn't know (e.g. "avif")
+        warnings.simplefilter("ignore")
+        return [f for f in FORMATS if f[0] == "png" or features.check(f[0])]
+
+
+def _store(data, ext, subdir=""):
+    """
+    Write bytes under a name made from their hash (once); returns the name.
+    """
+    name = f"{hashlib.sha256(data).hexdigest()[:20]}.{ext}"
+    directory = Path(settings.MEDIA_ROOT) / LOGO_DIR / subdir
+    path = directory / name
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        # Readers never see a half-written file
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    return name
+
+
+def _open_upload(data):
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            probe.verify()
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise LogoError("That file is not an image we can read.")
+    if image.format not in UPLOAD_FORMATS:
+        raise LogoError("Please upload a PNG, JPEG, GIF or WebP image.")
+    return image
+
+
+def save_logo(business, upload):
+    """
+    Store an uploaded logo (a Django UploadedFile) for the business and
+    generate its thumbnails. Raises LogoError for unusable uploads.
+    """
+    if Image is None:
+        raise LogoError("Logo uploads are not available on this server.")
+    if upload.size > settings.LOGO_MAX_UPLOAD_BYTES:
+        raise LogoError(f"The logo must be smaller than {settings.LOGO_MAX_UPLOAD_BYTES // 1024} KB.")
+
+    data = upload.read()
+    image = _open_upload(data)
+    original = f"{LOGO_DIR}/originals/" + _store(data, UPLOAD_FORMATS[image.format], "originals")
+
+    # Camera photos carry their rotation in EXIF; keep transparency
+    image = ImageOps.exif_transpose(image).convert("RGBA")
+    files = {}
+    for size in settings.LOGO_SIZES:
+        thumb = ImageOps.contain(image, (size, size), Image.Resampling.LANCZOS)
+        if size == settings.LOGO_SIZES[0]:
+            width, height = thumb.size
+        for ext, _, pil_format, options in _thumbnail_formats():
+            out = io.BytesIO()
+            thumb.save(out, pil_format, **options)
+            files.setdefault(ext, {})[str(size)] = _store(out.getvalue(), ext)
+
+    business.logo_original = original
+    business.logo_variants = {
+        "sizes": settings.LOGO_SIZES,
+        "width": width,
+        "height": height,
+        "files": files,
+    }
+    business.save(update_fields=["logo_original", "logo_variants"])
+
+
+def clear_logo(business):
+    # Files stay: thumbnails are shared by content and cached by browsers
+    business.logo_original = ""
+    business.logo_variants = {}
+    business.save(update_fields=["logo_original", "logo_variants"])
+
+
+def logo_picture(variants):
+    """
+    Template data for a <picture> of an uploaded logo (logo_variants), or
+    None: {"sources": [(content type, srcset)], "src", "width", "height"}.
+    """
+    if not variants:
+        return None
+    sizes = variants["sizes"]
+
+    def srcset(files):
+        return ", ".join(
+            f"{reverse('logo_file', args=[files[str(size)]])} {size / sizes[0]:g}x" for size in sizes
+        )
+
+    files = variants["files"]
+    return {
+        "sources": [(CONTENT_TYPES[ext], srcset(files[ext])) for ext in files if ext != "png"],
+        "src": reverse("logo_file", args=[files["png"][str(sizes[0])]]),
+        "srcset": srcset(files["png"]),
+        "width": variants["width"],
+        "height": variants["height"],
+    }
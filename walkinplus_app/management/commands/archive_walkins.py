@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from walkinplus_app.models import BusinessDetails, CustomerDetails, ArchivedCustomerDetails
+from walkinplus_app.sharding import each_tenant_database
+
+
+def archivable(cutoff):
+    """
+    Closed visits from before cutoff. Open ones still count towards the
+    wait-time queue depth, so they stay until they are clocked out.
+    """
+    return CustomerDetails.objects.filter(cust_walkin_date__lt=cutoff, cust_clockout__isnull=False)
+
+
+class Command(BaseCommand):
+    help = (
+        "Move walk-ins older than the archive horizon from customer_details "
+        "into customer_details_archive, in small batches. Visits still open "
+        "are left for close_stale_visits to close first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.WALKIN_ARCHIVE_AFTER_DAYS,
+            help="Archive visits whose walk-in date is older than this many days.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows moved per transaction (keeps each lock short).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many rows would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        days = options["days"]
+        batch_size = options["batch_size"]
+        cutoff = timezone.localdate() - timedelta(days=days)
+
+        if options["dry_run"]:
+            count = sum(
+                archivable(cutoff).count()
+                for _database in each_tenant_database()
+            )
+            self.stdout.write(f"{count} walk-ins before {cutoff} would be archived.")
+            return
+
+        moved = 0
+        for database in each_tenant_database():
+            moved += self.archive(database, cutoff, batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} walk-ins older than {cutoff}."
+        ))
+
+    def archive(self, database, cutoff, batch_size):
+        """
+        Archive old walk-ins on one tenant database.
+        """
+        old_qs = archivable(cutoff)
+
+        # Only copy columns the archive table actually has
+        fields = [
+            f.attname
+            for f in ArchivedCustomerDetails._meta.concrete_fields
+            if f.attname != "archived_at"
+        ]
+
+        moved = 0
+        while True:
+            # Walk the date index in primary key order, one short transaction per batch
+            with transaction.atomic(using=database):
+                rows = list(
+                    old_qs.order_by("pk").values(*fields)[:batch_size]
+                )
+                if not rows:
+                    break
+
+                ArchivedCustomerDetails.objects.bulk_create(
+                    [ArchivedCustomerDetails(**row) for row in rows],
+                    ignore_conflicts=True,  # safe to re-run after a crash mid-batch
+                )
+                CustomerDetails.objects.filter(
+                    pk__in=[row["cust_id"] for row in rows]
+                ).delete()
+                BusinessDetails.mark_changed(pk__in={row["business_id"] for row in rows})
+
+            moved += len(rows)
+            self.stdout.write(f"Archived {moved} walk-ins so far...")
+
+        return moved
@@ -0,0 +1,105 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from walkinplus_app.models import BusinessDetails, CustomerDetails
+
+
+BENCH_USERNAME = "admin_benchmark"
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a benchmark business with N walk-ins (default 1M) and time the "
+        "CustomerDetails admin changelist. Run against a local/dev database only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000000)
+        parser.add_argument("--batch-size", type=int, default=10000)
+        parser.add_argument(
+            "--skip-seed",
+            action="store_true",
+            help="Reuse rows seeded by a previous run.",
+        )
+        parser.add_argument(
+            "--cleanup",
+            action="store_true",
+            help="Delete the benchmark user and all its data, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            User.objects.filter(username=BENCH_USERNAME).delete()
+            self.stdout.write(self.style.SUCCESS("Benchmark data removed."))
+            return
+
+        user, created = User.objects.get_or_create(
+            username=BENCH_USERNAME,
+            defaults={"is_staff": True, "is_superuser": True},
+        )
+        if not created and not user.is_superuser:
+            raise CommandError(f"User {BENCH_USERNAME!r} exists and is not a benchmark superuser.")
+
+        business, _ = BusinessDetails.objects.get_or_create(
+            owner=user,
+            business_name="Benchmark Clinic",
+            defaults={"business_location": "Benchmark"},
+        )
+
+        if not options["skip_seed"]:
+            self._seed(user, business, options["rows"], options["batch_size"])
+
+        # The test client's default host ("testserver") is not in ALLOWED_HOSTS
+        client = Client(HTTP_HOST="localhost")
+        client.force_login(user)
+
+        pages = [
+            ("changelist", ""),
+            ("page 50", "?p=50"),
+            ("business filter", f"?business={business.pk}"),
+            ("date drill-down", f"?cust_walkin_date__year={timezone.localdate().year}"),
+            ("search", "?q=Patient+42"),
+        ]
+        base = "/admin/walkinplus_app/customerdetails/"
+
+        with override_settings(DEBUG=True):
+            for label, query in pages:
+                reset_queries()
+                started = time.perf_counter()
+                response = client.get(base + query)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if response.status_code != 200:
+                    # Timing an error page would give meaningless numbers
+                    raise CommandError(f"{label}: {base + query} returned {response.status_code}.")
+                self.stdout.write(
+                    f"{label:<16} status={response.status_code} "
+                    f"queries={len(connection.queries):<3} time={elapsed_ms:.0f} ms"
+                )
+
+    def _seed(self, user, business, rows, batch_size):
+        existing = CustomerDetails.objects.filter(business=business).count()
+        today = timezone.localdate()
+        now_time = timezone.localtime().time()
+
+        for start in range(existing, rows, batch_size):
+            end = min(start + batch_size, rows)
+            CustomerDetails.objects.bulk_create([
+                CustomerDetails(
+                    user=user,
+                    business=business,
+                    cust_name=f"Patient {i}",
+                    cust_contact_number=f"9{i:09d}",
+                    cust_visit_purpose=("Fever", "Checkup", "Follow-up")[i % 3],
+                    cust_walkin_date=today - timedelta(days=i % 1500),
+                    cust_clockin=now_time,
+                )
+                for i in range(start, end)
+            ])
+            self.stdout.write(f"Seeded {end}/{rows} walk-ins...")
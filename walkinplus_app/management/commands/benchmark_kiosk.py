@@ -0,0 +1,137 @@
+import json
+import multiprocessing
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+
+from walkinplus_app.kiosk import new_kiosk_token
+from walkinplus_app.models import BusinessDetails, CustomerDetails
+
+
+BENCH_USERNAME = "kiosk_benchmark"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the kiosk check-in endpoint: N check-ins from T concurrent "
+        "clients through the full middleware stack, reporting check-ins per "
+        "second and latency. Run against a local/dev database only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checkins", type=int, default=5000)
+        parser.add_argument("--concurrency", type=int, default=32, help="Clients per process.")
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Worker processes (like web workers), each with --concurrency clients.",
+        )
+        parser.add_argument(
+            "--cleanup",
+            action="store_true",
+            help="Delete the benchmark user and all its data, then exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            User.objects.filter(username=BENCH_USERNAME).delete()
+            self.stdout.write(self.style.SUCCESS("Benchmark data removed."))
+            return
+
+        user, created = User.objects.get_or_create(username=BENCH_USERNAME)
+        if not created and user.has_usable_password():
+            raise CommandError(f"User {BENCH_USERNAME!r} exists and is not the benchmark user.")
+        if created:
+            user.set_unusable_password()
+            user.save()
+
+        business, _ = BusinessDetails.objects.get_or_create(
+            owner=user,
+            business_name="Kiosk Benchmark Clinic",
+            defaults={"business_location": "Benchmark"},
+        )
+        token = new_kiosk_token(business)
+        before = CustomerDetails.objects.filter(business=business).count()
+
+        total = options["checkins"]
+        clients = options["concurrency"] * options["processes"]
+
+        # Each process gets its own connections; don't share the parent's
+        connections.close_all()
+        fork = multiprocessing.get_context("fork")
+        results = fork.Queue()
+        processes = [
+            fork.Process(
+                target=run_clients,
+                args=(token, total, clients, range(n, clients, options["processes"]), results),
+            )
+            for n in range(options["processes"])
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        latencies, failures = [], 0
+        for _ in processes:
+            process_latencies, process_failures = results.get()
+            latencies.extend(process_latencies)
+            failures += process_failures
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        created_rows = CustomerDetails.objects.filter(business=business).count() - before
+        latencies.sort()
+        self.stdout.write(
+            f"{total} check-ins, {clients} clients in {options['processes']} process(es): {total / elapsed:.0f}/s, "
+            f"p50={statistics.median(latencies):.1f} ms "
+            f"p99={latencies[int(len(latencies) * 0.99) - 1]:.1f} ms, "
+            f"rows created={created_rows}, failed={failures}"
+        )
+
+
+def run_clients(token, total, clients, offsets, results):
+    """
+    One worker process: a thread per client offset, each posting every
+    `clients`-th check-in. Puts (latencies in ms, failures) on results.
+    """
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def client_loop(offset):
+        client = Client(
+            raise_request_exception=False,
+            HTTP_HOST="localhost",  # "testserver" is not in ALLOWED_HOSTS
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+        mine, bad = [], 0
+        try:
+            for i in range(offset, total, clients):
+                body = json.dumps({
+                    "phone": f"9{i:09d}",
+                    "first_name": f"Kiosk {i}",
+                    "purpose": ("Fever", "Checkup", "Follow-up")[i % 3],
+                })
+                started = time.perf_counter()
+                response = client.post("/kiosk/checkin/", body, content_type="application/json")
+                mine.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 201:
+                    bad += 1
+        finally:
+            connections.close_all()
+        with lock:
+            latencies.extend(mine)
+            failures.append(bad)
+
+    threads = [threading.Thread(target=client_loop, args=(offset,)) for offset in offsets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, sum(failures)))
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_time
+
+from walkinplus_app.models import BusinessDetails, CustomerDetails, WebhookEvent
+from walkinplus_app.routers import tenant_db
+from walkinplus_app.sharding import each_tenant_database
+from walkinplus_app.waittime import resync_queue_depths
+from walkinplus_app.webhooks import enqueue_events
+
+
+class Command(BaseCommand):
+    help = (
+        "Clock out walk-ins that were never closed on their walk-in day, "
+        "across all businesses, in set-based batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=0,
+            help="Only close visits older than this many days (0 = anything before today).",
+        )
+        parser.add_argument(
+            "--clockout-time",
+            default="23:59",
+            help="Clock-out time written on the closed visits (HH:MM).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Visits closed per UPDATE statement.",
+        )
+
+    def handle(self, *args, **options):
+        clockout_time = parse_time(options["clockout_time"])
+        if clockout_time is None:
+            raise CommandError("--clockout-time must look like HH:MM.")
+
+        cutoff = timezone.localdate() - timedelta(days=options["days"])
+        batch_size = options["batch_size"]
+
+        closed = 0
+        for _database in each_tenant_database():
+            closed += self.close_stale(cutoff, clockout_time, batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Closed {closed} stale open visits from before {cutoff}."
+        ))
+
+    def close_stale(self, cutoff, clockout_time, batch_size):
+        """
+        Close stale visits on the current tenant database.
+        """
+        stale_qs = CustomerDetails.objects.filter(
+            cust_walkin_date__lt=cutoff,
+            cust_clockout__isnull=True,
+        )
+
+        closed = 0
+        touched_businesses = set()
+        while True:
+            batch_ids = list(stale_qs.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not batch_ids:
+                break
+
+            with transaction.atomic(using=tenant_db()):
+                # Re-check the open condition so a visit closed meanwhile is left alone
+                batch_qs = CustomerDetails.objects.filter(
+                    pk__in=batch_ids,
+                    cust_clockout__isnull=True,
+                )
+                closing = list(batch_qs.select_for_update().values(
+                    "pk", "business_id", "cust_name", "cust_contact_number",
+                    "cust_visit_purpose", "cust_walkin_date", "cust_clockin",
+                ))
+                closed += batch_qs.update(cust_clockout=clockout_time, updated_at=timezone.now())
+
+                # Webhook consumers see these closures like any other clock-out
+                by_business = defaultdict(list)
+                for visit in closing:
+                    by_business[visit["business_id"]].append({**visit, "cust_clockout": clockout_time})
+                for business_id, visits in by_business.items():
+                    enqueue_events(business_id, WebhookEvent.TYPE_WALKIN_CLOCKED_OUT, visits)
+
+                BusinessDetails.mark_changed(pk__in=by_business)
+            touched_businesses |= set(by_business)
+
+        # Closed visits no longer count as waiting
+        resync_queue_depths(touched_businesses)
+
+        return closed
@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from walkinplus_app.models import WebhookEvent
+from walkinplus_app.sharding import each_tenant_database
+from walkinplus_app.webhooks import get_dispatcher
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver due webhook events: retries after a failure and events left "
+        "behind when a web worker restarted. Runs until stopped, or drains "
+        "once with --once (e.g. from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Deliver what is due now, report, and exit.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds between scans for due events.",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="First give events that ran out of attempts a fresh set of retries.",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.WEBHOOK_ENDPOINTS:
+            self.stdout.write("No webhook endpoints configured (WEBHOOK_URLS).")
+            return
+
+        if options["retry_failed"]:
+            for database in each_tenant_database():
+                WebhookEvent.objects.filter(status=WebhookEvent.STATUS_FAILED).update(
+                    status=WebhookEvent.STATUS_PENDING, attempts=0
+                )
+
+        dispatcher = get_dispatcher()
+        while True:
+            dispatcher.kick()
+            dispatcher.wait_idle()
+            if options["once"]:
+                break
+            time.sleep(options["interval"])
+
+        counts = {}
+        for database in each_tenant_database():
+            for row in WebhookEvent.objects.exclude(status=WebhookEvent.STATUS_DELIVERED).values(
+                "endpoint", "status"
+            ).annotate(n=Count("pk")):
+                key = (row["endpoint"], row["status"])
+                counts[key] = counts.get(key, 0) + row["n"]
+        for endpoint in settings.WEBHOOK_ENDPOINTS:
+            self.stdout.write(
+                f"{endpoint}: {counts.get((endpoint, WebhookEvent.STATUS_PENDING), 0)} pending, "
+                f"{counts.get((endpoint, WebhookEvent.STATUS_FAILED), 0)} failed"
+            )
@@ -0,0 +1,331 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.db.models import Q
+
+from walkinplus_app.models import (
+    ArchivedCustomerDetails,
+    BusinessDetails,
+    CustomerDetails,
+    DailyTokenCounter,
+    ExportJob,
+    ExportOwnerLock,
+    MoveTombstone,
+    SyncEvent,
+    TenantShard,
+    UsageCounter,
+    VisitPurpose,
+    WaitTimeEstimate,
+    WebhookEvent,
+)
+from walkinplus_app.sharding import set_shard, shard_for_owner, tenant_database_aliases
+
+# Parents before children, so foreign keys always point at copied rows
+COPY_ORDER = [
+    BusinessDetails,
+    VisitPurpose,
+    CustomerDetails,
+    ArchivedCustomerDetails,
+    ExportJob,
+    ExportOwnerLock,
+    WaitTimeEstimate,
+    DailyTokenCounter,
+    UsageCounter,
+    SyncEvent,
+    WebhookEvent,
+]
+
+# A handful of rows per tenant that change in place: re-copied in full
+# during the freeze. The big tables only get new rows + still-open visits.
+SMALL_MODELS = {
+    BusinessDetails, VisitPurpose, ExportJob, ExportOwnerLock, WaitTimeEstimate, DailyTokenCounter, UsageCounter,
+}
+
+# Rows of the big tables that still change in place until they are done
+# (filter for "not done yet"); the ones open when the bulk copy starts are
+# re-copied during the freeze.
+OPEN_ROWS = {
+    CustomerDetails: {"cust_clockout__isnull": True},
+    WebhookEvent: {"status": WebhookEvent.STATUS_PENDING},
+}
+
+
+def tenant_filter(model, owner_id):
+    if model in (BusinessDetails, ExportOwnerLock):
+        return Q(owner_id=owner_id)
+    return Q(business__owner_id=owner_id)
+
+
+def tenant_rows(model, database, owner_id):
+    return model.objects.using(database).filter(tenant_filter(model, owner_id))
+
+
+def tombstone_trigger(model):
+    return f"{model._meta.db_table}_move_tombstone"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move one owner's businesses and walk-ins to another tenant database "
+        "while the app keeps serving them. Rows are bulk-copied online (with "
+        "triggers on the old database recording deletes meanwhile), then "
+        "writes are refused for a short freeze while the remaining changes "
+        "are copied and the shard map is switched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("owner", help="Username or user id of the owner to move.")
+        parser.add_argument("database", help="Target database alias (see SHARD_DATABASE_URLS).")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Rows copied / deleted per statement.",
+        )
+        parser.add_argument(
+            "--wait-seconds",
+            type=int,
+            default=settings.SHARD_MAP_CACHE_SECONDS,
+            help="How long every process needs to see a shard map change "
+                 "(defaults to SHARD_MAP_CACHE_SECONDS).",
+        )
+        parser.add_argument(
+            "--keep-source",
+            action="store_true",
+            help="Leave the copied rows on the old database.",
+        )
+
+    def handle(self, *args, **options):
+        owner = self.get_owner(options["owner"])
+        target = options["database"]
+        self.batch_size = options["batch_size"]
+
+        if target not in tenant_database_aliases():
+            raise CommandError(f"Unknown tenant database {target!r}; choose from {tenant_database_aliases()}.")
+
+        existing = TenantShard.objects.filter(owner=owner).values_list("database", "status").first()
+        if existing and existing[1] in (TenantShard.STATUS_COPYING, TenantShard.STATUS_MOVING):
+            raise CommandError(f"{owner} is already being moved.")
+        source = existing[0] if existing else shard_for_owner(owner.pk)[0]
+        if source == target:
+            raise CommandError(f"{owner} is already on {target!r}.")
+
+        self.check_id_conflicts(owner, source, target)
+
+        # Foreign keys on the target point at auth_user: keep a copy of the owner there
+        if not User.objects.using(target).filter(pk=owner.pk).exists():
+            owner.save(using=target, force_insert=True)
+
+        # Deletes on the source are recorded from here on (see MoveTombstone)
+        set_shard(owner.pk, source, TenantShard.STATUS_COPYING)
+        try:
+            self.install_tombstone_triggers(source)
+
+            # ---------- 1. Bulk copy while the tenant stays live ----------
+            # Snapshot first: rows still open now may be finished at any point
+            # during the copy (even after their own table was copied), so all
+            # of them are re-copied during the freeze
+            high_water = {
+                model: max(
+                    tenant_rows(model, source, owner.pk).values_list("pk", flat=True).order_by("-pk")[:1],
+                    default=0,
+                )
+                for model in COPY_ORDER
+            }
+            open_rows = {
+                model: list(
+                    tenant_rows(model, source, owner.pk)
+                    .filter(pk__lte=high_water[model], **open_filter)
+                    .values_list("pk", flat=True)
+                )
+                for model, open_filter in OPEN_ROWS.items()
+            }
+            for model in COPY_ORDER:
+                qs = tenant_rows(model, source, owner.pk).filter(pk__lte=high_water[model])
+                copied = self.copy_rows(model, qs, target)
+                self.stdout.write(f"Copied {copied} {model._meta.db_table} rows...")
+
+            # ---------- 2. Freeze writes, copy what changed, switch ----------
+            set_shard(owner.pk, source, TenantShard.STATUS_MOVING)
+            self.wait(options["wait_seconds"], "for every process to stop writing")
+            if not self.tombstone_triggers_installed(source):
+                raise CommandError(f"Delete triggers on {source!r} were dropped during the copy; run the move again.")
+            for model in COPY_ORDER:
+                self.catch_up(model, owner, source, target, high_water[model], open_rows.get(model, []))
+            set_shard(owner.pk, target)
+        except BaseException:
+            set_shard(owner.pk, source)
+            raise
+        finally:
+            self.remove_tombstone_triggers(source)
+
+        # ---------- 3. Clean up the old database ----------
+        if not options["keep_source"]:
+            self.wait(options["wait_seconds"], "for readers to leave the old database")
+            for model in reversed(COPY_ORDER):
+                self.delete_rows(tenant_rows(model, source, owner.pk))
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {owner} from {source!r} to {target!r}."))
+
+    def get_owner(self, value):
+        lookup = {"pk": int(value)} if value.isdigit() else {"username": value}
+        try:
+            return User.objects.get(**lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"No user {value!r}.")
+
+    def check_id_conflicts(self, owner, source, target):
+        """
+        Rows keep their primary keys (URLs and exports refer to them), so
+        the target must not already use any of them for another tenant.
+        Each shard allocates ids from its own block (SHARD_ID_BLOCK), so
+        this normally finds nothing; ids are checked a batch at a time.
+        """
+        for model in COPY_ORDER:
+            theirs = model.objects.using(target).exclude(tenant_filter(model, owner.pk))
+            if not theirs.exists():
+                continue
+            ours = tenant_rows(model, source, owner.pk).order_by("pk").values_list("pk", flat=True)
+            last_pk = None
+            while True:
+                batch_qs = ours if last_pk is None else ours.filter(pk__gt=last_pk)
+                pks = list(batch_qs[:self.batch_size])
+                if not pks:
+                    break
+                if theirs.filter(pk__in=pks).exists():
+                    raise CommandError(
+                        f"{model._meta.db_table} ids of {owner} are already used on {target!r}; "
+                        "check that every shard has its own SHARD_ID_BLOCK range."
+                    )
+                last_pk = pks[-1]
+
+    def copy_rows(self, model, qs, target):
+        """
+        Upsert rows from qs into target in primary key order.
+        """
+        fields = [f.attname for f in model._meta.concrete_fields]
+        pk_name = model._meta.pk.attname
+        copied = 0
+        last_pk = None
+        while True:
+            batch_qs = qs.order_by("pk")
+            if last_pk is not None:
+                batch_qs = batch_qs.filter(pk__gt=last_pk)
+            rows = list(batch_qs.values(*fields)[:self.batch_size])
+            if not rows:
+                return copied
+            model.objects.using(target).bulk_create(
+                [model(**row) for row in rows],
+                update_conflicts=True,
+                unique_fields=[pk_name],
+                update_fields=[f for f in fields if f != pk_name],
+            )
+            copied += len(rows)
+            last_pk = rows[-1][pk_name]
+
+    def catch_up(self, model, owner, source, target, high_water, open_pks):
+        source_qs = tenant_rows(model, source, owner.pk)
+        with transaction.atomic(using=target):
+            # Rows deleted (or archived) since the copy started; first, as a
+            # deleted row's id may be in use again (ExportOwnerLock)
+            tombstones = MoveTombstone.objects.using(source).filter(table_name=model._meta.db_table).order_by("pk")
+            last_pk = 0
+            while True:
+                batch = list(tombstones.filter(pk__gt=last_pk).values_list("pk", "row_id")[:self.batch_size])
+                if not batch:
+                    break
+                tenant_rows(model, target, owner.pk).filter(pk__in=[row_id for _, row_id in batch]).delete()
+                last_pk = batch[-1][0]
+
+            if model in SMALL_MODELS:
+                self.copy_rows(model, source_qs, target)
+            else:
+                self.copy_rows(model, source_qs.filter(pk__gt=high_water), target)
+            # Rows finished during the bulk copy (visits clocked out, events delivered)
+            for i in range(0, len(open_pks), self.batch_size):
+                self.copy_rows(model, source_qs.filter(pk__in=open_pks[i:i + self.batch_size]), target)
+
+    def install_tombstone_triggers(self, database):
+        """
+        Record every row deleted from the tenant tables on `database` in
+        move_tombstones until remove_tombstone_triggers().
+        """
+        connection = connections[database]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute(
+                    "CREATE OR REPLACE FUNCTION move_tombstone() RETURNS trigger LANGUAGE plpgsql AS $$ "
+                    "BEGIN "
+                    "INSERT INTO move_tombstones (table_name, row_id) "
+                    "VALUES (TG_TABLE_NAME, (to_jsonb(OLD) ->> TG_ARGV[0])::bigint); "
+                    "RETURN NULL; "
+                    "END $$"
+                )
+            for model in COPY_ORDER:
+                table = model._meta.db_table
+                if connection.vendor == "sqlite":
+                    cursor.execute(
+                        f"CREATE TRIGGER IF NOT EXISTS {quote(tombstone_trigger(model))} AFTER DELETE ON {quote(table)} "
+                        f"BEGIN INSERT INTO move_tombstones (table_name, row_id) "
+                        f"VALUES ('{table}', OLD.{quote(model._meta.pk.column)}); END"
+                    )
+                elif connection.vendor == "postgresql":
+                    cursor.execute(
+                        f"CREATE OR REPLACE TRIGGER {quote(tombstone_trigger(model))} AFTER DELETE ON {quote(table)} "
+                        f"FOR EACH ROW EXECUTE FUNCTION move_tombstone('{model._meta.pk.column}')"
+                    )
+                else:
+                    raise CommandError(f"move_tenant does not support {connection.vendor} databases.")
+
+    def tombstone_triggers_installed(self, database):
+        connection = connections[database]
+        names = [tombstone_trigger(model) for model in COPY_ORDER]
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(
+                    "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+                    % ", ".join(["%s"] * len(names)),
+                    names,
+                )
+            else:
+                cursor.execute("SELECT COUNT(DISTINCT tgname) FROM pg_trigger WHERE tgname = ANY(%s)", [names])
+            return cursor.fetchone()[0] == len(names)
+
+    def remove_tombstone_triggers(self, database):
+        """
+        Drop the triggers and tombstones, unless another tenant is still
+        being moved off the same database.
+        """
+        still_moving = TenantShard.objects.filter(
+            database=database,
+            status__in=(TenantShard.STATUS_COPYING, TenantShard.STATUS_MOVING),
+        )
+        if still_moving.exists():
+            return
+        connection = connections[database]
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            for model in COPY_ORDER:
+                if connection.vendor == "sqlite":
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {quote(tombstone_trigger(model))}")
+                else:
+                    cursor.execute(
+                        f"DROP TRIGGER IF EXISTS {quote(tombstone_trigger(model))} ON {quote(model._meta.db_table)}"
+                    )
+        MoveTombstone.objects.using(database).all().delete()
+
+    def delete_rows(self, qs):
+        while True:
+            pks = list(qs.values_list("pk", flat=True)[:self.batch_size])
+            if not pks:
+                return
+            qs.model.objects.using(qs.db).filter(pk__in=pks).delete()
+
+    def wait(self, seconds, reason):
+        if seconds > 0:
+            self.stdout.write(f"Waiting {seconds}s {reason}...")
+            time.sleep(seconds)
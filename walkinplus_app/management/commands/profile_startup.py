@@ -0,0 +1,159 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter (python -X importtime) so nothing is warm.
+# Prints one JSON line with the phase timings on stdout.
+CHILD_SCRIPT = r"""
+import json, time
+t_start = time.perf_counter()
+
+import django
+from django.db.backends.signals import connection_created
+
+db_connections = []
+connection_created.connect(
+    lambda sender, connection, **kwargs: db_connections.append(connection.alias),
+    weak=False,
+)
+
+t_import = time.perf_counter()
+django.setup()
+t_setup = time.perf_counter()
+
+from django.urls import get_resolver
+get_resolver().url_patterns  # imports ROOT_URLCONF and every view module
+t_urls = time.perf_counter()
+
+from django.core.handlers.wsgi import WSGIHandler
+application = WSGIHandler()  # loads MIDDLEWARE
+t_wsgi = time.perf_counter()
+import_time_connections = list(db_connections)
+
+from wsgiref.util import setup_testing_defaults
+environ = {"PATH_INFO": PATH, "HTTP_HOST": "localhost"}
+setup_testing_defaults(environ)
+statuses = []
+body = b"".join(application(environ, lambda status, headers: statuses.append(status)))
+t_first = time.perf_counter()
+
+ms = lambda a, b: round((b - a) * 1000, 1)
+print(json.dumps({
+    "django_import_ms": ms(t_start, t_import),
+    "app_registry_ms": ms(t_import, t_setup),
+    "url_loading_ms": ms(t_setup, t_urls),
+    "middleware_ms": ms(t_urls, t_wsgi),
+    "first_response_ms": ms(t_wsgi, t_first),
+    "first_response_status": statuses[0] if statuses else None,
+    "import_time_db_connections": import_time_connections,
+    "db_connections_after_first_response": db_connections,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure cold start in a fresh interpreter: import time per module, "
+        "app registry setup, URL loading, middleware loading, DB connections "
+        "opened at import time, and time to the first response."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default="/healthz/",
+            help="URL requested as the first response (default: /healthz/).",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=20,
+            help="How many of the slowest modules to list.",
+        )
+        parser.add_argument(
+            "--output",
+            help="Append the result as one JSON line to this file (to track over time).",
+        )
+        parser.add_argument(
+            "--budget-ms",
+            type=float,
+            help="Exit with an error if cold start to first response exceeds this.",
+        )
+
+    def handle(self, *args, **options):
+        script = f"PATH = {options['path']!r}\n" + CHILD_SCRIPT
+        env = dict(os.environ)
+        env.setdefault("DJANGO_SETTINGS_MODULE", "walkinplus.settings")
+
+        started = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            capture_output=True,
+            text=True,
+            env=env,
+        )
+        wall_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        if proc.returncode != 0:
+            raise CommandError(f"Startup probe failed:\n{proc.stderr[-2000:]}")
+
+        phases = json.loads(proc.stdout.strip().splitlines()[-1])
+        modules = self._parse_importtime(proc.stderr)
+
+        self.stdout.write(f"Cold start to first response: {wall_ms} ms (wall clock, incl. interpreter)")
+        for key in ("django_import_ms", "app_registry_ms", "url_loading_ms", "middleware_ms", "first_response_ms"):
+            self.stdout.write(f"  {key:<22} {phases[key]:>8} ms")
+        self.stdout.write(f"  first response status   {phases['first_response_status']}")
+
+        if phases["import_time_db_connections"]:
+            self.stdout.write(self.style.WARNING(
+                "DB connections opened during startup: "
+                + ", ".join(phases["import_time_db_connections"])
+            ))
+        else:
+            self.stdout.write("No DB connections opened during startup.")
+
+        self.stdout.write(f"\nSlowest {options['top']} imports (cumulative ms / self ms):")
+        for name, self_us, cumulative_us in modules[:options["top"]]:
+            self.stdout.write(f"  {cumulative_us / 1000:>8.1f} {self_us / 1000:>8.1f}  {name}")
+
+        if options["output"]:
+            record = {
+                "measured_at": datetime.now(dt_timezone.utc).isoformat(),
+                "cold_start_ms": wall_ms,
+                **phases,
+                "slowest_imports": [
+                    {"module": name, "cumulative_ms": round(cum / 1000, 1)}
+                    for name, _, cum in modules[:options["top"]]
+                ],
+            }
+            with open(options["output"], "a", encoding="utf-8") as fh:
+                fh.write(json.dumps(record) + "\n")
+
+        if options["budget_ms"] is not None and wall_ms > options["budget_ms"]:
+            raise CommandError(
+                f"Cold start {wall_ms} ms is over the {options['budget_ms']} ms budget."
+            )
+
+    def _parse_importtime(self, stderr):
+        """
+        Parse `-X importtime` lines ("import time: self | cumulative | name"),
+        slowest cumulative first.
+        """
+        modules = []
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "[us]" in line:
+                continue
+            try:
+                self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+                modules.append((name.strip(), int(self_us), int(cumulative_us)))
+            except ValueError:
+                continue
+        modules.sort(key=lambda m: m[2], reverse=True)
+        return modules
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from walkinplus_app.models import BusinessDetails, UsageCounter
+from walkinplus_app.routers import tenant_db
+from walkinplus_app.sharding import each_tenant_database
+from walkinplus_app.usage import walkin_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the monthly walk-in usage counters from customer_details "
+        "(and the archive), a batch of businesses at a time. Export counts "
+        "are left as they are."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Businesses recounted per transaction.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many counters are off.",
+        )
+
+    def handle(self, *args, **options):
+        fixed = 0
+        for _database in each_tenant_database():
+            business_ids = list(BusinessDetails.objects.order_by("pk").values_list("pk", flat=True))
+            for i in range(0, len(business_ids), options["batch_size"]):
+                fixed += self.reconcile(business_ids[i:i + options["batch_size"]], options["dry_run"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"{fixed} usage counters are off.")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} usage counters."))
+
+    def reconcile(self, business_ids, dry_run):
+        """
+        Recount walk-ins of some businesses on the current tenant database;
+        returns the number of counters that were off.
+        """
+        if not dry_run:
+            # Counter rows must exist before they can be locked below
+            UsageCounter.objects.bulk_create(
+                [UsageCounter(business_id=b, month=m) for b, m in walkin_counts(business_ids)],
+                ignore_conflicts=True,
+            )
+
+        with transaction.atomic(using=tenant_db()):
+            # Walk-ins bump their counter in the transaction that inserts
+            # them: with the counters locked, every visit is either in the
+            # count below or bumps the counter after we are done
+            counters = list(
+                UsageCounter.objects.select_for_update().filter(business_id__in=business_ids).order_by("pk")
+            )
+            counts = walkin_counts(business_ids)
+
+            stale = []
+            for counter in counters:
+                walkins = counts.get((counter.business_id, counter.month), 0)
+                if counter.walkins != walkins:
+                    counter.walkins = walkins
+                    stale.append(counter)
+            if not dry_run:
+                UsageCounter.objects.bulk_update(stale, ["walkins"])
+
+        # Only in a dry run: months with walk-ins but no counter yet
+        missing = set(counts) - {(counter.business_id, counter.month) for counter in counters}
+        return len(stale) + len(missing)
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from walkinplus_app.exports import run_export_job
+from walkinplus_app.models import ExportJob
+from walkinplus_app.sharding import each_tenant_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Run pending background export jobs in this process, e.g. jobs left "
+        "behind when a web worker restarted before finishing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requeue-running",
+            action="store_true",
+            help="Also reset 'running' jobs whose lease expired (their worker "
+                 "is gone) back to pending first. Jobs still being worked on "
+                 "renew their lease and are left alone.",
+        )
+
+    def handle(self, *args, **options):
+        ran = done = 0
+        for database in each_tenant_database():
+            if options["requeue_running"]:
+                ExportJob.objects.filter(
+                    Q(lease_until__lt=timezone.now()) | Q(lease_until__isnull=True),
+                    status=ExportJob.STATUS_RUNNING,
+                ).update(status=ExportJob.STATUS_PENDING, rows_written=0, claim="", lease_until=None)
+
+            job_ids = list(
+                ExportJob.objects.filter(status=ExportJob.STATUS_PENDING)
+                .order_by("created_at")
+                .values_list("pk", flat=True)
+            )
+            for job_id in job_ids:
+                # One after the other here; don't hand the owner's next job to a pool
+                run_export_job(job_id, database, start_next=False)
+
+            ran += len(job_ids)
+            done += ExportJob.objects.filter(pk__in=job_ids, status=ExportJob.STATUS_DONE).count()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ran {ran} export jobs ({done} finished successfully)."
+        ))
@@ -0,0 +1,205 @@
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .profiling import QueryRecorder, StackSampler, redacted_path
+from .kiosk import handle_checkin
+from .models import TenantShard
+from .routers import PIN_PRIMARY_COOKIE, replica_configured, tenant_database
+from .sharding import shard_for_owner, sharding_enabled
+
+
+class PinPrimaryAfterWriteMiddleware:
+    """
+    After any non-GET request, pin this client to the primary database for
+    REPLICA_PIN_SECONDS so the redirect that follows a POST does not read
+    from a replica that has not caught up yet.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if request.method not in ("GET", "HEAD", "OPTIONS") and replica_configured():
+            response.set_cookie(
+                PIN_PRIMARY_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class TenantShardMiddleware:
+    """
+    Runs each request against the signed-in owner's shard. While the owner
+    is being moved (move_tenant) reads continue from the old shard and
+    writes are refused with 503 + Retry-After. No-op without shards.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not sharding_enabled() or not request.user.is_authenticated:
+            return self.get_response(request)
+
+        alias, status = shard_for_owner(request.user.pk)
+        if status == TenantShard.STATUS_MOVING and request.method not in ("GET", "HEAD", "OPTIONS"):
+            response = HttpResponse("Your account is being moved. Please retry in a minute.", status=503)
+            response["Retry-After"] = str(settings.SHARD_MAP_CACHE_SECONDS)
+            return response
+
+        with tenant_database(alias):
+            return self.get_response(request)
+
+
+class KioskCheckinMiddleware:
+    """
+    Answers /kiosk/checkin/ (token-authenticated JSON walk-ins, see
+    kiosk.py) before the session, CSRF, auth and message middleware: a
+    kiosk has no session, so none of that work is done per check-in.
+    """
+
+    PATHS = ("/kiosk/checkin", "/kiosk/checkin/")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path_info in self.PATHS:
+            return handle_checkin(request)
+        return self.get_response(request)
+
+
+class HealthCheckMiddleware:
+    """
+    Answers /healthz/ (liveness) and /healthz/ready/ (readiness, pings the
+    database) before any other middleware runs: no session, auth, CSRF or
+    message handling, and no host check, so platform probes stay cheap
+    and work during cold starts. Must be first in MIDDLEWARE.
+    """
+
+    LIVE_PATHS = ("/healthz", "/healthz/")
+    READY_PATHS = ("/healthz/ready", "/healthz/ready/")
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        path = request.path_info
+        if path in self.LIVE_PATHS:
+            return JsonResponse({"status": "ok"})
+        if path in self.READY_PATHS:
+            return self.readiness()
+        return self.get_response(request)
+
+    def readiness(self):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+        except Exception:
+            return JsonResponse({"status": "unavailable", "database": "error"}, status=503)
+        return JsonResponse({"status": "ok", "database": "ok"})
+
+
+class RequestProfilerMiddleware:
+    """
+    Staff-only switch to profile one request: add ?_profile=1 or the
+    header "X-WalkinPlus-Profile: 1". Views show the signed-in user's own
+    clinics, so to see a page as an owner does, staff add
+    &_profile_as=<owner id> (or "X-WalkinPlus-Profile-As"): that one
+    GET/HEAD runs as the owner, on the owner's shard. Only active,
+    non-staff accounts can be targeted.
+
+    The request runs under a sampling profiler; the folded stacks
+    (flame-graph input) and every SQL statement (parameter types only)
+    are written to REQUEST_PROFILE_DIR, and the response carries an
+    X-Profile-Id header naming the files.
+
+    When the switch is absent this is a dict lookup per request; staff
+    users are limited to REQUEST_PROFILE_RATE profiles per hour.
+    """
+
+    QUERY_PARAM = "_profile"
+    HEADER = "HTTP_X_WALKINPLUS_PROFILE"
+    AS_QUERY_PARAM = "_profile_as"
+    AS_HEADER = "HTTP_X_WALKINPLUS_PROFILE_AS"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (request.GET.get(self.QUERY_PARAM) or request.META.get(self.HEADER)):
+            return self.get_response(request)
+
+        user = getattr(request, "user", None)
+        if not (user and user.is_authenticated and user.is_staff):
+            return self.get_response(request)
+
+        owner = None
+        target = request.GET.get(self.AS_QUERY_PARAM) or request.META.get(self.AS_HEADER)
+        if target:
+            owner = self._owner(request, target)
+            if owner is None:
+                return HttpResponse("Can only profile a GET as an existing, non-staff owner.", status=400)
+
+        if not self._allow(user):
+            return self.get_response(request)
+        return self._profile(request, owner)
+
+    def _owner(self, request, target):
+        # Read-only requests only: profiling must never write as someone else
+        if request.method not in ("GET", "HEAD") or not target.isdigit():
+            return None
+        return User.objects.filter(pk=target, is_active=True, is_staff=False, is_superuser=False).first()
+
+    def _allow(self, user):
+        key = f"request-profiler:{user.pk}"
+        cache.add(key, 0, 3600)
+        try:
+            return cache.incr(key) <= settings.REQUEST_PROFILE_RATE
+        except ValueError:
+            # Counter expired between add() and incr()
+            return False
+
+    def _profile(self, request, owner=None):
+        who = f"user={request.user.pk}"
+        tenant = nullcontext()
+        if owner is not None:
+            who += f" as={owner.pk}"
+            request.user = owner
+            tenant = tenant_database(shard_for_owner(owner.pk)[0])
+
+        started = time.perf_counter()
+        with tenant, QueryRecorder(connections) as queries, StackSampler(threading.get_ident()) as sampler:
+            response = self.get_response(request)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        profile_id = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        out_dir = Path(settings.REQUEST_PROFILE_DIR)
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        (out_dir / f"{profile_id}.folded").write_text(sampler.folded(), encoding="utf-8")
+        (out_dir / f"{profile_id}.sql.txt").write_text(
+            f"{request.method} {redacted_path(request)}\n"
+            f"{who} status={response.status_code} time={elapsed_ms:.1f} ms\n\n"
+            + queries.report(),
+            encoding="utf-8",
+        )
+
+        response["X-Profile-Id"] = profile_id
+        return response
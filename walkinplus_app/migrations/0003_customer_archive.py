@@ -0,0 +1,59 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0002_businessdetails_is_active'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedCustomerDetails',
+            fields=[
+                ('cust_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('cust_name', models.CharField(max_length=150)),
+                ('cust_dob', models.DateField(blank=True, null=True)),
+                ('cust_contact_number', models.CharField(max_length=20)),
+                ('cust_companion', models.CharField(blank=True, max_length=150)),
+                ('cust_companion_relation', models.CharField(blank=True, max_length=100)),
+                ('cust_visit_purpose', models.CharField(max_length=200)),
+                ('cust_notes', models.TextField(blank=True)),
+                ('cust_walkin_date', models.DateField()),
+                ('cust_clockin', models.TimeField()),
+                ('cust_clockout', models.TimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'customer_details_archive',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='customerdetails',
+            index=models.Index(fields=['cust_walkin_date'], name='customer_walkin_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerdetails',
+            index=models.Index(fields=['business', 'cust_walkin_date'], name='customer_business_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='archivedcustomerdetails',
+            name='business',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_customers', to='walkinplus_app.businessdetails'),
+        ),
+        migrations.AddField(
+            model_name='archivedcustomerdetails',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_customers', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archivedcustomerdetails',
+            index=models.Index(fields=['business', 'cust_walkin_date'], name='archive_business_date_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:45
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0004_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='businessdetails',
+            name='data_changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='businessdetails',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
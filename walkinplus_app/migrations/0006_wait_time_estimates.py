@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0005_business_change_marker'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitTimeEstimate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('purpose', models.CharField(blank=True, max_length=100)),
+                ('queue_depth', models.PositiveIntegerField(default=0)),
+                ('avg_duration_seconds', models.FloatField(default=0)),
+                ('duration_samples', models.PositiveIntegerField(default=0)),
+                ('avg_gap_seconds', models.FloatField(default=0)),
+                ('last_clockout_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='wait_estimates', to='walkinplus_app.businessdetails')),
+            ],
+            options={
+                'db_table': 'wait_time_estimates',
+                'constraints': [models.UniqueConstraint(fields=('business', 'purpose'), name='wait_estimate_business_purpose_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0006_wait_time_estimates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('event_type', models.CharField(choices=[('walkin', 'Walk-in'), ('clockout', 'Clock-out')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_events', to='walkinplus_app.businessdetails')),
+                ('visit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sync_events', to='walkinplus_app.customerdetails')),
+            ],
+            options={
+                'db_table': 'sync_events',
+                'constraints': [models.UniqueConstraint(fields=('business', 'key'), name='sync_event_business_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0007_sync_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('database', models.CharField(default='default', max_length=50)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('moving', 'Moving')], default='active', max_length=10)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tenant_shard', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'tenant_shards',
+            },
+        ),
+    ]
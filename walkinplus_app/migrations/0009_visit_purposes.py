@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0008_tenant_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitPurpose',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100)),
+                ('name', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='purposes', to='walkinplus_app.businessdetails')),
+            ],
+            options={
+                'db_table': 'visit_purposes',
+            },
+        ),
+        migrations.AddField(
+            model_name='customerdetails',
+            name='purpose',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='visits', to='walkinplus_app.visitpurpose'),
+        ),
+        migrations.AddIndex(
+            model_name='customerdetails',
+            index=models.Index(fields=['business', 'purpose'], name='customer_business_purpose_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='visitpurpose',
+            constraint=models.UniqueConstraint(fields=('business', 'key'), name='visit_purpose_business_key_uniq'),
+        ),
+    ]
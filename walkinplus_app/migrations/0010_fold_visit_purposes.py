@@ -0,0 +1,69 @@
+# Generated by Django 5.2.8 on 2026-10-19 18:59
+
+from collections import defaultdict
+
+from django.db import migrations, transaction
+
+BATCH_SIZE = 5000
+
+
+def purpose_key(purpose):
+    # Same normalisation as walkinplus_app.purposes.purpose_key
+    return " ".join((purpose or "").lower().split())[:100]
+
+
+def fold_purposes(apps, schema_editor):
+    """
+    Point existing walk-ins at catalog rows, one short transaction per batch.
+    """
+    CustomerDetails = apps.get_model("walkinplus_app", "CustomerDetails")
+    VisitPurpose = apps.get_model("walkinplus_app", "VisitPurpose")
+    db = schema_editor.connection.alias
+
+    pending = CustomerDetails.objects.using(db).filter(purpose__isnull=True).exclude(cust_visit_purpose="")
+    last_pk = 0
+    while True:
+        rows = list(
+            pending.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "business_id", "cust_visit_purpose")[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+
+        visits_by_purpose = defaultdict(list)
+        names = {}
+        for pk, business_id, text in rows:
+            key = purpose_key(text)
+            if key:
+                visits_by_purpose[(business_id, key)].append(pk)
+                names.setdefault((business_id, key), text.strip())
+
+        with transaction.atomic(using=db):
+            VisitPurpose.objects.using(db).bulk_create(
+                [VisitPurpose(business_id=b, key=k, name=name) for (b, k), name in names.items()],
+                ignore_conflicts=True,
+            )
+            catalog = {
+                (p.business_id, p.key): p.pk
+                for p in VisitPurpose.objects.using(db).filter(
+                    business_id__in={b for b, _ in names},
+                    key__in={k for _, k in names},
+                )
+            }
+            for group, pks in visits_by_purpose.items():
+                CustomerDetails.objects.using(db).filter(pk__in=pks).update(purpose_id=catalog[group])
+
+
+class Migration(migrations.Migration):
+    # Each batch commits on its own so the table is never locked for long
+    atomic = False
+
+    dependencies = [
+        ('walkinplus_app', '0009_visit_purposes'),
+    ]
+
+    operations = [
+        migrations.RunPython(fold_purposes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0010_fold_visit_purposes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='businessdetails',
+            name='kiosk_token_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0011_kiosk_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(max_length=50)),
+                ('event_type', models.CharField(choices=[('walkin.created', 'Walk-in created'), ('walkin.clocked_out', 'Walk-in clocked out')], max_length=30)),
+                ('payload', models.JSONField(default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('delivered', 'Delivered'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claim', models.CharField(blank=True, max_length=32)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_events', to='walkinplus_app.businessdetails')),
+            ],
+            options={
+                'db_table': 'webhook_events',
+                'indexes': [models.Index(fields=['endpoint', 'status', 'next_attempt_at'], name='webhook_due_idx')],
+            },
+        ),
+    ]
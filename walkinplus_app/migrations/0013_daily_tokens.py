@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0012_webhook_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyTokenCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('last_token', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'daily_token_counters',
+            },
+        ),
+        migrations.AddField(
+            model_name='customerdetails',
+            name='cust_token',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='customerdetails',
+            constraint=models.UniqueConstraint(fields=('business', 'cust_walkin_date', 'cust_token'), name='customer_business_day_token_uniq'),
+        ),
+        migrations.AddField(
+            model_name='dailytokencounter',
+            name='business',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_counters', to='walkinplus_app.businessdetails'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailytokencounter',
+            constraint=models.UniqueConstraint(fields=('business', 'day'), name='token_counter_business_day_uniq'),
+        ),
+    ]
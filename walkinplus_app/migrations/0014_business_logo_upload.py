@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0013_daily_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='businessdetails',
+            name='logo_original',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='businessdetails',
+            name='logo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
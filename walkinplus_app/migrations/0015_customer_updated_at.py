@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0014_business_logo_upload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerdetails',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='customerdetails',
+            index=models.Index(fields=['business', 'updated_at'], name='customer_business_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0015_customer_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('walkins', models.PositiveIntegerField(default=0)),
+                ('exports', models.PositiveIntegerField(default=0)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage_counters', to='walkinplus_app.businessdetails')),
+            ],
+            options={
+                'db_table': 'usage_counters',
+                'constraints': [models.UniqueConstraint(fields=('business', 'month'), name='usage_counter_business_month_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 19:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0016_usage_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedcustomerdetails',
+            name='cust_token',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedcustomerdetails',
+            name='purpose',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_visits', to='walkinplus_app.visitpurpose'),
+        ),
+        migrations.AddField(
+            model_name='archivedcustomerdetails',
+            name='updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
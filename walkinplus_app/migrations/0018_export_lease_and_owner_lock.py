@@ -0,0 +1,35 @@
+# Generated by Django 5.2.8 on 2026-10-19 20:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('walkinplus_app', '0017_archive_token_purpose'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportOwnerLock',
+            fields=[
+                ('owner', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'export_owner_locks',
+            },
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='claim',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='exportjob',
+            name='lease_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 20:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('walkinplus_app', '0018_export_lease_and_owner_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoveTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=64)),
+                ('row_id', models.BigIntegerField()),
+            ],
+            options={
+                'db_table': 'move_tombstones',
+            },
+        ),
+        migrations.AlterField(
+            model_name='tenantshard',
+            name='status',
+            field=models.CharField(choices=[('active', 'Active'), ('copying', 'Copying'), ('moving', 'Moving')], default='active', max_length=10),
+        ),
+    ]
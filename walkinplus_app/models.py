@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class UserDetails(models.Model):
@@ -37,7 +38,9 @@ class BusinessDetails(models.Model):
     - business_name
     - business_location
     - business_logo (string path/url for now)
+    - logo_original, logo_variants (uploaded logo and its thumbnails, see logos.py)
     - is_active (to show/hide in dashboards)
+    - kiosk_token_hash (self check-in kiosk credential, SHA-256 of the token)
     """
 
     # Auto-increment, unique business id (primary key)
@@ -60,6 +63,11 @@ class BusinessDetails(models.Model):
         help_text="Optional logo filename or URL"
     )
 
+    # Uploaded logo: the original under MEDIA_ROOT, plus thumbnail file
+    # names per format and size (written once at upload by walkinplus_app.logos)
+    logo_original = models.CharField(max_length=255, blank=True)
+    logo_variants = models.JSONField(default=dict, blank=True)
+
     # Active/inactive flag used on Home page & dashboards
     is_active = models.BooleanField(
         default=True,
@@ -68,12 +76,59 @@ class BusinessDetails(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Change marker for HTTP validators (ETag / Last-Modified) on the
+    # dashboards: bumped whenever this business or its walk-ins change.
+    data_version = models.PositiveIntegerField(default=0)
+    data_changed_at = models.DateTimeField(default=timezone.now)
+
+    # Only the hash is stored; the token is shown to the owner once
+    kiosk_token_hash = models.CharField(max_length=64, blank=True, db_index=True)
+
     class Meta:
         db_table = "business_details"
 
     def __str__(self):
         return f"{self.business_name} ({self.business_location})"
 
+    @classmethod
+    def mark_changed(cls, **filters):
+        """
+        Bump the change marker of every business matching filters,
+        e.g. mark_changed(pk=5) or mark_changed(owner=user).
+        """
+        return cls.objects.filter(**filters).update(
+            data_version=models.F("data_version") + 1,
+            data_changed_at=timezone.now(),
+        )
+
+
+class VisitPurpose(models.Model):
+    """
+    Catalog of visit purposes per business.
+    visit_purposes table:
+    - business (FK)
+    - key (normalised purpose, unique per business: "Fever " and "fever" → "fever")
+    - name (purpose as first typed, for display)
+    """
+
+    business = models.ForeignKey(
+        BusinessDetails,
+        on_delete=models.CASCADE,
+        related_name="purposes"
+    )
+    key = models.CharField(max_length=100)
+    name = models.CharField(max_length=200)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "visit_purposes"
+        constraints = [
+            models.UniqueConstraint(fields=["business", "key"], name="visit_purpose_business_key_uniq"),
+        ]
+
+    def __str__(self):
+        return self.name
+
 
 class CustomerDetails(models.Model):
     """
@@ -83,6 +138,8 @@ class CustomerDetails(models.Model):
     - business (FK)
     - cust_id (auto, PK)
     - all the customer fields
+    - cust_token (daily queue number, from DailyTokenCounter)
+    - updated_at (last change; delta exports read changes since a watermark)
     """
 
     # Auto-increment, unique customer id
@@ -123,6 +180,15 @@ class CustomerDetails(models.Model):
         help_text="Purpose of visit (e.g., Fever, Checkup, Follow-up)"
     )
 
+    # Catalog entry for cust_visit_purpose (empty purpose → NULL)
+    purpose = models.ForeignKey(
+        VisitPurpose,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="visits"
+    )
+
     cust_notes = models.TextField(
         blank=True,
         help_text="Additional notes about the visit"
@@ -133,10 +199,450 @@ class CustomerDetails(models.Model):
     cust_clockin = models.TimeField()
     cust_clockout = models.TimeField(null=True, blank=True)
 
+    # Queue number called out at the desk: 1, 2, 3... per business and walk-in day
+    cust_token = models.PositiveIntegerField(null=True, blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Set by save(); queryset .update() calls must set it themselves
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         db_table = "customer_details"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["business", "cust_walkin_date", "cust_token"],
+                name="customer_business_day_token_uniq",
+            ),
+        ]
+        indexes = [
+            # Archival sweeps across all businesses by walk-in date
+            models.Index(fields=["cust_walkin_date"], name="customer_walkin_date_idx"),
+            # Dashboard stats / reports: one business, a date range
+            models.Index(fields=["business", "cust_walkin_date"], name="customer_business_date_idx"),
+            # Purpose counts / filters within one business
+            models.Index(fields=["business", "purpose"], name="customer_business_purpose_idx"),
+            # Delta exports: one business, changed since a watermark
+            models.Index(fields=["business", "updated_at"], name="customer_business_updated_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.cust_name} ({self.cust_contact_number})"
+
+
+class DailyTokenCounter(models.Model):
+    """
+    Last queue token handed out per business and day.
+    daily_token_counters table:
+    - business, day (unique together)
+    - last_token
+
+    Bumped with one upsert per walk-in batch by walkinplus_app.queue_tokens.
+    """
+
+    business = models.ForeignKey(
+        BusinessDetails,
+        on_delete=models.CASCADE,
+        related_name="token_counters"
+    )
+    day = models.DateField()
+    last_token = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "daily_token_counters"
+        constraints = [
+            models.UniqueConstraint(fields=["business", "day"], name="token_counter_business_day_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.business_id} {self.day}: {self.last_token}"
+
+
+class UsageCounter(models.Model):
+    """
+    Metered usage per business and calendar month, for billing.
+    usage_counters table:
+    - business, month (first day of the month; unique together)
+    - walkins (visits with a walk-in date in the month)
+    - exports (report downloads and background exports started)
+
+    Bumped with one upsert per metered action by walkinplus_app.usage;
+    `reconcile_usage` recounts walkins from the visit tables.
+    """
+
+    business = models.ForeignKey(
+        BusinessDetails,
+        on_delete=models.CASCADE,
+        related_name="usage_counters"
+    )
+    month = models.DateField()
+    walkins = models.PositiveIntegerField(default=0)
+    exports = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "usage_counters"
+        constraints = [
+            models.UniqueConstraint(fields=["business", "month"], name="usage_counter_business_month_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.business_id} {self.month:%Y-%m}: {self.walkins} walk-ins, {self.exports} exports"
+
+
+class ArchivedCustomerDetails(models.Model):
+    """
+    Cold storage for old walk-ins moved out of customer_details.
+    customer_details_archive table:
+    - same columns as customer_details (cust_id is kept as-is)
+    - archived_at (when the row was moved)
+
+    purpose, cust_token and updated_at are empty on rows archived before
+    they were copied.
+
+    Rows are moved here by the `archive_walkins` management command.
+    """
+
+    cust_id = models.IntegerField(primary_key=True)
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="archived_customers"
+    )
+
+    business = models.ForeignKey(
+        BusinessDetails,
+        on_delete=models.CASCADE,
+        related_name="archived_customers"
+    )
+
+    cust_name = models.CharField(max_length=150)
+    cust_dob = models.DateField(null=True, blank=True)
+    cust_contact_number = models.CharField(max_length=20)
+    cust_companion = models.CharField(max_length=150, blank=True)
+    cust_companion_relation = models.CharField(max_length=100, blank=True)
+    cust_visit_purpose = models.CharField(max_length=200)
+    purpose = models.ForeignKey(
+        VisitPurpose,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="archived_visits"
+    )
+    cust_notes = models.TextField(blank=True)
+
+    cust_walkin_date = models.DateField()
+    cust_clockin = models.TimeField()
+    cust_clockout = models.TimeField(null=True, blank=True)
+    cust_token = models.PositiveIntegerField(null=True, blank=True)
+
+    created_at = models.DateTimeField()
+    # Copied from the live row (no auto_now: archiving is not a change)
+    updated_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "customer_details_archive"
+        indexes = [
+            models.Index(fields=["business", "cust_walkin_date"], name="archive_business_date_idx"),
+        ]
 
     def __str__(self):
         return f"{self.cust_name} ({self.cust_contact_number})"
+
+
+class ExportJob(models.Model):
+    """
+    Background CSV export of the Reports tab for one business.
+    export_jobs table:
+    - owner, business
+    - filters (raw Reports filter strings, JSON)
+    - file_format (csv / csv.gz)
+    - status, rows_written / total_rows (progress)
+    - file_name (relative to MEDIA_ROOT once done)
+    - claim, lease_until (the worker running the job and until when it
+      holds it; renewed while it runs, so only abandoned jobs are requeued)
+    """
+
+    FORMAT_CSV = "csv"
+    FORMAT_CSV_GZ = "csv.gz"
+    FORMAT_CHOICES = [
+        (FORMAT_CSV, "CSV"),
+        (FORMAT_CSV_GZ, "CSV (gzip)"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    owner = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="export_jobs"
+    )
+    business = models.ForeignKey(
+        BusinessDetails,
+        on_delete=models.CASCADE,
+        related_name="export_jobs"
+    )
+
+    filters = models.JSONField(default=dict, blank=True)
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default=FORMAT_CSV)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    total_rows = models.PositiveIntegerField(default=0)
+    rows_written = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    claim = models.CharField(max_length=32, blank=True)
+    lease_until = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "export_jobs"
+        indexes = [
+            models.Index(fields=["owner", "status"], name="export_owner_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"Export #{self.pk} ({self.business.business_name}, {self.status})"
+
+
+class ExportOwnerLock(models.Model):
+    """
+    Row locked to take turns at counting and claiming one owner's exports.
+    export_owner_locks table:
+    - owner (primary key)
+
+    Created with the owner's first export. Nothing else writes it, so
+    queuing an export never waits for walk-ins or dashboard writes.
+    """
+
+    owner = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="+"
+    )
+
+    class Meta:
+        db_table = "export_owner_locks"
+
+    def __str__(self):
+        return f"Export lock of {self.owner_id}"
+
+    @property
+    def progress_percent(self):
+        if self.status == self.STATUS_DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(100, int(self.rows_written * 100 / self.total_rows))
+
+
+class WaitTimeEstimate(models.Model):
+    """
+    Running wait-time statistics, one row per business and visit purpose.
+    wait_time_estimates table:
+    - business, purpose ("" = all purposes of the business)
+    - queue_depth (visits currently open)
+    - avg_duration_seconds (exponentially weighted clock-in → clock-out time)
+    - avg_gap_seconds (exponentially weighted time between clock-outs while
+      patients were waiting, i.e. how fast the queue moves)
+
+    Updated in O(1) per walk-in / clock-out by walkinplus_app.waittime.
+    """
+
+    business = models.ForeignKey(
+        BusinessDetails,
+        on_delete=models.CASCADE,
+        related_name="wait_estimates"
+    )
+    purpose = models.CharField(max_length=100, blank=True)
+
+    queue_depth = models.PositiveIntegerField(default=0)
+    avg_duration_seconds = models.FloatField(default=0)
+    duration_samples = models.PositiveIntegerField(default=0)
+    avg_gap_seconds = models.FloatField(default=0)
+    last_clockout_at = models.DateTimeField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "wait_time_estimates"
+        constraints = [
+            models.UniqueConstraint(fields=["business", "purpose"], name="wait_estimate_business_purpose_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.business_id}/{self.purpose or '*'}: {self.queue_depth} waiting"
+
+
+class SyncEvent(models.Model):
+    """
+    Idempotency record for events pushed by reception desks through the
+    batch sync endpoint.
+    sync_events table:
+    - business, key (client-generated idempotency key, unique per business)
+    - event_type (walkin / clockout)
+    - visit (the CustomerDetails row the event created or closed)
+    """
+
+    TYPE_WALKIN = "walkin"
+    TYPE_CLOCKOUT = "clockout"
+    TYPE_CHOICES = [
+        (TYPE_WALKIN, "Walk-in"),
+        (TYPE_CLOCKOUT, "Clock-out"),
+    ]
+
+    business = models.ForeignKey(
+        BusinessDetails,
+        on_delete=models.CASCADE,
+        related_name="sync_events"
+    )
+    key = models.CharField(max_length=64)
+    event_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    visit = models.ForeignKey(
+        CustomerDetails,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="sync_events"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "sync_events"
+        constraints = [
+            models.UniqueConstraint(fields=["business", "key"], name="sync_event_business_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} {self.key}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Outbox of walk-in events for our own systems (SMS reminders, billing).
+    Written in the same transaction as the walk-in change, one row per
+    configured endpoint, and delivered by walkinplus_app.webhooks.
+    webhook_events table:
+    - business, endpoint (name from settings.WEBHOOK_ENDPOINTS)
+    - event_type (walkin.created / walkin.clocked_out), payload (JSON)
+    - status (pending / delivered / failed), attempts, next_attempt_at
+    - claim (set by the dispatcher delivering the row), last_error
+    """
+
+    TYPE_WALKIN_CREATED = "walkin.created"
+    TYPE_WALKIN_CLOCKED_OUT = "walkin.clocked_out"
+    TYPE_CHOICES = [
+        (TYPE_WALKIN_CREATED, "Walk-in created"),
+        (TYPE_WALKIN_CLOCKED_OUT, "Walk-in clocked out"),
+    ]
+
+    STATUS_PENDING = "pending"
+    STATUS_DELIVERED = "delivered"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_DELIVERED, "Delivered"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    business = models.ForeignKey(
+        BusinessDetails,
+        on_delete=models.CASCADE,
+        related_name="webhook_events"
+    )
+    endpoint = models.CharField(max_length=50)
+    event_type = models.CharField(max_length=30, choices=TYPE_CHOICES)
+    payload = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "webhook_events"
+        indexes = [
+            # The dispatcher's "due events for this endpoint" lookup
+            models.Index(fields=["endpoint", "status", "next_attempt_at"], name="webhook_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} -> {self.endpoint} ({self.status})"
+
+
+# ─────────────────────────────────────────────
+# Tenant shard map
+# ─────────────────────────────────────────────
+class TenantShard(models.Model):
+    """
+    Which database holds an owner's businesses and walk-ins. Owners without
+    a row live on the primary ("default"). Always stored on the primary.
+    tenant_shards table:
+    - owner (one row per owner)
+    - database (alias from settings.DATABASES)
+    - status (active / copying / moving; move_tenant copies rows while
+      the tenant stays live, then refuses writes while moving)
+    """
+
+    STATUS_ACTIVE = "active"
+    STATUS_COPYING = "copying"
+    STATUS_MOVING = "moving"
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, "Active"),
+        (STATUS_COPYING, "Copying"),
+        (STATUS_MOVING, "Moving"),
+    ]
+
+    owner = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name="tenant_shard"
+    )
+    database = models.CharField(max_length=50, default="default")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "tenant_shards"
+
+    def __str__(self):
+        return f"{self.owner} -> {self.database} ({self.status})"
+
+
+class MoveTombstone(models.Model):
+    """
+    A row deleted from a tenant table while move_tenant was copying from
+    this database, written by the delete triggers move_tenant installs for
+    the duration of the move. Lets the freeze remove just those rows from
+    the target instead of comparing every id.
+    move_tombstones table:
+    - table_name (db_table of the deleted row)
+    - row_id (its primary key)
+    """
+
+    table_name = models.CharField(max_length=64)
+    row_id = models.BigIntegerField()
+
+    class Meta:
+        db_table = "move_tombstones"
+
+    def __str__(self):
+        return f"{self.table_name} #{self.row_id}"
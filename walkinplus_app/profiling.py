@@ -0,0 +1,112 @@
+"""
+On-demand profiling of a single request (see RequestProfilerMiddleware).
+
+StackSampler is a small sampling profiler: a background thread snapshots
+the request thread's stack every few milliseconds and counts identical
+stacks. The result is written in the "folded" format understood by
+flamegraph.pl, speedscope and most flame-graph viewers.
+
+Profiles never contain SQL parameter values or query string values, as
+those hold patient details.
+"""
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+
+def redacted_path(request):
+    """
+    Request path with query string values left out (they can be patient
+    names or phone numbers): /x/?search=…&tab=…
+    """
+    if not request.GET:
+        return request.path
+    return request.path + "?" + "&".join(f"{key}=…" for key in sorted(request.GET))
+
+
+class StackSampler:
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="walkinplus-profiler", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+class QueryRecorder:
+    """
+    Records every SQL statement (all database aliases) with its duration.
+    Only the types of the parameters are kept, not their values.
+    """
+
+    def __init__(self, connections):
+        self.connections = connections
+        self.queries = []
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for connection in self.connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._record(connection.alias)))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def _record(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append((alias, (time.perf_counter() - started) * 1000, sql, _param_types(params, many)))
+        return wrapper
+
+    def report(self):
+        total_ms = sum(q[1] for q in self.queries)
+        lines = [f"{len(self.queries)} queries, {total_ms:.1f} ms total", ""]
+        for i, (alias, ms, sql, params) in enumerate(self.queries, start=1):
+            lines.append(f"{i}. [{alias}] {ms:.2f} ms")
+            lines.append(f"   {sql}")
+            if params:
+                lines.append(f"   params: {params}")
+        return "\n".join(lines) + "\n"
+
+
+def _param_types(params, many):
+    """
+    "(str, int, NoneType)" for the statement's parameters, or the row count
+    of an executemany(); never the values themselves.
+    """
+    if not params:
+        return ""
+    if many:
+        # May be a (by now consumed) generator
+        return f"{len(params)} rows" if hasattr(params, "__len__") else "several rows"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in params) + ")"
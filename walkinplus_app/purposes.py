@@ -0,0 +1,67 @@
+"""
+Per-business visit purpose catalog. The purpose typed at the desk stays on
+the visit as text; the visit also points at a VisitPurpose row (one per
+business and normalised key), so counting and filtering by purpose compare
+integers instead of scanning free text.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import CustomerDetails, VisitPurpose
+
+
+def purpose_key(purpose):
+    """
+    Free-text purpose → catalog / estimator key ("Fever ", "fever" → "fever").
+    """
+    return " ".join((purpose or "").lower().split())[:100]
+
+
+def purpose_ids(business_id, purposes):
+    """
+    {key: VisitPurpose id} for the given free-text purposes of one
+    business, adding catalog rows for purposes seen for the first time.
+    Empty purposes are left out.
+    """
+    names = {}
+    for purpose in purposes:
+        key = purpose_key(purpose)
+        if key:
+            names.setdefault(key, purpose.strip()[:200])
+    if not names:
+        return {}
+
+    catalog = VisitPurpose.objects.filter(business_id=business_id, key__in=names)
+    ids = dict(catalog.values_list("key", "pk"))
+    missing = names.keys() - ids.keys()
+    if missing:
+        VisitPurpose.objects.bulk_create(
+            [VisitPurpose(business_id=business_id, key=key, name=names[key]) for key in missing],
+            ignore_conflicts=True,  # another desk may add the same purpose concurrently
+        )
+        ids = dict(catalog.values_list("key", "pk"))
+    return ids
+
+
+def purpose_id(business_id, purpose):
+    return purpose_ids(business_id, [purpose]).get(purpose_key(purpose))
+
+
+def top_purposes(business_id):
+    """
+    The business's most common purposes (names, most used first) for the
+    walk-in form; grouped on the (business, purpose) index and cached.
+    """
+    cache_key = f"top_purposes:{business_id}"
+    names = cache.get(cache_key)
+    if names is None:
+        names = list(
+            CustomerDetails.objects.filter(business_id=business_id, purpose__isnull=False)
+            .values("purpose_id", "purpose__name")
+            .annotate(n=Count("pk"))
+            .order_by("-n", "purpose__name")
+            .values_list("purpose__name", flat=True)[:settings.PURPOSE_SUGGESTIONS]
+        )
+        cache.set(cache_key, names, settings.PURPOSE_CACHE_SECONDS)
+    return names
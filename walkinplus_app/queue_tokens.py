@@ -0,0 +1,56 @@
+"""
+Daily queue tokens: each walk-in gets the next number (1, 2, 3...) of its
+business and walk-in day.
+
+Tokens come from a counter row per business and day (DailyTokenCounter),
+bumped with a single upsert ... RETURNING: no MAX()+1 over the visits
+table and no table lock. The counter row stays locked until the
+surrounding transaction ends, so call assign_tokens() in the same
+transaction as the INSERT of the visits, as late as possible: if that
+transaction rolls back, so does the counter, and no numbers are skipped.
+"""
+from collections import defaultdict
+
+from django.db import connections
+
+from .models import DailyTokenCounter
+from .routers import tenant_db
+
+
+def _allocate_sql(connection):
+    table = connection.ops.quote_name(DailyTokenCounter._meta.db_table)
+    # The same statement works on PostgreSQL and SQLite (3.35+)
+    return (
+        f"INSERT INTO {table} (business_id, day, last_token) VALUES (%s, %s, %s) "
+        f"ON CONFLICT (business_id, day) "
+        f"DO UPDATE SET last_token = {table}.last_token + EXCLUDED.last_token "
+        f"RETURNING last_token"
+    )
+
+
+def allocate_tokens(business_id, day, count=1):
+    """
+    Reserve `count` consecutive tokens for one business and day; returns
+    them as a range. Must run inside a transaction.
+    """
+    connection = connections[tenant_db()]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _allocate_sql(connection),
+            [business_id, connection.ops.adapt_datefield_value(day), count],
+        )
+        last = cursor.fetchone()[0]
+    return range(last - count + 1, last + 1)
+
+
+def assign_tokens(business_id, visits):
+    """
+    Set cust_token on unsaved CustomerDetails of one business, in list
+    order; one counter update per walk-in day among them.
+    """
+    by_day = defaultdict(list)
+    for visit in visits:
+        by_day[visit.cust_walkin_date].append(visit)
+    for day, day_visits in by_day.items():
+        for visit, token in zip(day_visits, allocate_tokens(business_id, day, len(day_visits))):
+            visit.cust_token = token
@@ -0,0 +1,372 @@
+"""
+Shared helpers for the Reports tab: filter parsing, filtering and CSV rows.
+Used by the dashboard view, the CSV export and background export jobs.
+"""
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db.models import Count, DateField, F, Max, Min, Q
+from django.db.models.functions import Trunc
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+
+from .models import CustomerDetails, ArchivedCustomerDetails
+
+
+CSV_HEADER = [
+    "Customer Name",
+    "Customer DOB",
+    "Purpose",
+    "Walk-in Date",
+    "In Time",
+    "Out Time",
+    "Contact Number",
+    "Companion",
+    "Relation",
+    "Notes",
+]
+
+# Delta exports: the visit id to upsert on, then the usual columns
+DELTA_CSV_HEADER = ["Visit ID", *CSV_HEADER, "Token", "Updated At"]
+
+
+def parse_report_filters(params):
+    """
+    Read the Reports tab filters (date range, time window, search) from
+    request.GET. Raw strings are kept so the form can be re-filled.
+    """
+    from_date_str = params.get("from_date", "").strip()
+    to_date_str = params.get("to_date", "").strip()
+    time_from_str = params.get("time_from", "").strip()
+    time_to_str = params.get("time_to", "").strip()
+    search_query = params.get("search", "").strip()
+
+    from_date = parse_date(from_date_str) if from_date_str else None
+    to_date = parse_date(to_date_str) if to_date_str else None
+    time_from = parse_time(time_from_str) if time_from_str else None
+    time_to = parse_time(time_to_str) if time_to_str else None
+
+    # normalize dates – if only one provided, use it for both
+    if from_date and not to_date:
+        to_date = from_date
+    if to_date and not from_date:
+        from_date = to_date
+
+    return {
+        "from_date": from_date,
+        "to_date": to_date,
+        "time_from": time_from,
+        "time_to": time_to,
+        "search": search_query,
+        "from_date_str": from_date_str,
+        "to_date_str": to_date_str,
+        "time_from_str": time_from_str,
+        "time_to_str": time_to_str,
+    }
+
+
+def apply_report_filters(qs, filters):
+    """
+    Apply parsed Reports filters to a walk-in queryset.
+    Works for both CustomerDetails and ArchivedCustomerDetails.
+    """
+    from_date = filters["from_date"]
+    to_date = filters["to_date"]
+    time_from = filters["time_from"]
+    time_to = filters["time_to"]
+    search_query = filters["search"]
+
+    if from_date and to_date:
+        qs = qs.filter(
+            cust_walkin_date__gte=from_date,
+            cust_walkin_date__lte=to_date,
+        )
+
+        # Apply per-day time window if both time_from and time_to present
+        if time_from and time_to:
+            mid_days = Q(
+                cust_walkin_date__gt=from_date,
+                cust_walkin_date__lt=to_date
+            )
+            start_day = Q(
+                cust_walkin_date=from_date,
+                cust_clockin__gte=time_from
+            )
+            end_day = Q(
+                cust_walkin_date=to_date,
+                cust_clockin__lte=time_to
+            )
+            qs = qs.filter(mid_days | start_day | end_day)
+        elif time_from and from_date == to_date:
+            qs = qs.filter(cust_clockin__gte=time_from)
+        elif time_to and from_date == to_date:
+            qs = qs.filter(cust_clockin__lte=time_to)
+
+    # Search in name / number / purpose
+    if search_query:
+        qs = qs.filter(
+            Q(cust_name__icontains=search_query)
+            | Q(cust_contact_number__icontains=search_query)
+            | Q(cust_visit_purpose__icontains=search_query)
+        )
+
+    return qs
+
+
+def archive_covers(business, from_date):
+    """
+    True if a report starting at from_date (None = all history) needs rows
+    from the archive table for this business.
+    """
+    latest_archived = ArchivedCustomerDetails.objects.filter(
+        business=business
+    ).aggregate(latest=Max("cust_walkin_date"))["latest"]
+
+    if latest_archived is None:
+        return False
+    return from_date is None or from_date <= latest_archived
+
+
+def report_querysets(user, business, filters):
+    """
+    Filtered live walk-ins for one business, plus the archived ones when
+    the date range reaches into the archive (otherwise None).
+    """
+    qs = apply_report_filters(
+        CustomerDetails.objects.filter(user=user, business=business),
+        filters,
+    )
+
+    archived_qs = None
+    if archive_covers(business, filters["from_date"]):
+        archived_qs = apply_report_filters(
+            ArchivedCustomerDetails.objects.filter(user=user, business=business),
+            filters,
+        )
+
+    return qs, archived_qs
+
+
+def report_filter_params(filters):
+    """
+    Raw filter strings only (safe to store as JSON and re-parse later).
+    """
+    return {
+        "from_date": filters["from_date_str"],
+        "to_date": filters["to_date_str"],
+        "time_from": filters["time_from_str"],
+        "time_to": filters["time_to_str"],
+        "search": filters["search"],
+    }
+
+
+def iter_report_rows(qs, archived_qs=None):
+    """
+    Yield walk-ins oldest first: archived rows (if any), then live rows.
+    """
+    sources = [qs]
+    if archived_qs is not None:
+        sources.insert(0, archived_qs)
+
+    for source in sources:
+        yield from source.order_by("cust_walkin_date", "cust_clockin").iterator(chunk_size=2000)
+
+
+def csv_row(r):
+    return [
+        r.cust_name or "",
+        r.cust_dob or "",
+        r.cust_visit_purpose or "",
+        r.cust_walkin_date or "",
+        r.cust_clockin or "",
+        r.cust_clockout or "",
+        r.cust_contact_number or "",
+        r.cust_companion or "",
+        r.cust_companion_relation or "",
+        (r.cust_notes or "").replace("\n", " "),
+    ]
+
+
+def format_watermark(moment):
+    # UTC with a "Z": no "+" to be mangled in a query string
+    return moment.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def parse_watermark(value):
+    """
+    The datetime of a watermark from format_watermark(), or None if it
+    isn't one.
+    """
+    try:
+        moment = parse_datetime(value)
+    except ValueError:
+        return None
+    if moment is None or moment.tzinfo is None:
+        return None
+    return moment
+
+
+def iter_delta_rows(user, business, since, until):
+    """
+    Yield the business's live walk-ins changed after `since` (None: any
+    time) and up to `until`, oldest change first. Reads the
+    (business, updated_at) index, so the cost follows the number of
+    changes rather than the size of the business's history.
+    """
+    qs = CustomerDetails.objects.filter(user=user, business=business, updated_at__lte=until)
+    if since is not None:
+        qs = qs.filter(updated_at__gt=since)
+    yield from qs.order_by("updated_at", "pk").iterator(chunk_size=2000)
+
+
+def delta_csv_row(r):
+    return [r.pk, *csv_row(r), r.cust_token or "", format_watermark(r.updated_at)]
+
+
+def business_overview_rows(user, businesses, today):
+    """
+    Today / week / month / pending / 30-day-average figures for many
+    businesses at once, from a single grouped aggregate query.
+    Returns one dict per business, in the order given.
+    """
+    week_start = today - timedelta(days=today.weekday())
+    month_start = today.replace(day=1)
+    last_30_start = today - timedelta(days=29)
+
+    stats = (
+        CustomerDetails.objects.filter(
+            user=user,
+            business__in=businesses,
+            # Only the window any figure needs (uses the business/date index)
+            cust_walkin_date__gte=min(week_start, month_start, last_30_start),
+            cust_walkin_date__lte=today,
+        )
+        .values("business")
+        .annotate(
+            today=Count("pk", filter=Q(cust_walkin_date=today)),
+            week=Count("pk", filter=Q(cust_walkin_date__gte=week_start)),
+            month=Count("pk", filter=Q(cust_walkin_date__gte=month_start)),
+            pending=Count("pk", filter=Q(cust_walkin_date=today, cust_clockout__isnull=True)),
+            last_30=Count("pk", filter=Q(cust_walkin_date__gte=last_30_start)),
+        )
+    )
+    by_business = {row["business"]: row for row in stats}
+
+    rows = []
+    for b in businesses:
+        row = by_business.get(b.pk, {})
+        last_30 = row.get("last_30", 0)
+        rows.append({
+            "id": b.pk,
+            "name": b.business_name,
+            "location": b.business_location,
+            "is_active": b.is_active,
+            "today": row.get("today", 0),
+            "week": row.get("week", 0),
+            "month": row.get("month", 0),
+            "pending": row.get("pending", 0),
+            "avg_per_day": round(last_30 / 30, 1) if last_30 else 0,
+        })
+    return rows
+
+
+# ---------- TRENDS (chart series) ----------
+
+# Coarsest bucket last: it is used whatever the range
+SERIES_BUCKETS = ("day", "week", "month", "year")
+
+
+def _bucket_start(d, bucket):
+    if bucket == "week":
+        return d - timedelta(days=d.weekday())
+    if bucket == "month":
+        return d.replace(day=1)
+    if bucket == "year":
+        return d.replace(month=1, day=1)
+    return d
+
+
+def _next_bucket(d, bucket):
+    """
+    Start of the bucket after d's, or None past date.max.
+    """
+    try:
+        if bucket == "week":
+            return d + timedelta(days=7)
+        if bucket == "month":
+            return (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if bucket == "year":
+            return d.replace(year=d.year + 1)
+        return d + timedelta(days=1)
+    except (OverflowError, ValueError):
+        return None
+
+
+def choose_series_bucket(from_date, to_date, max_points):
+    """
+    Finest bucket (day, week, month, year) that covers the range in at
+    most max_points points. Raises ValueError if even yearly points are
+    too many.
+    """
+    for bucket in SERIES_BUCKETS:
+        start, end = _bucket_start(from_date, bucket), _bucket_start(to_date, bucket)
+        if bucket == "day":
+            points = (end - start).days + 1
+        elif bucket == "week":
+            points = (end - start).days // 7 + 1
+        elif bucket == "month":
+            points = (end.year - start.year) * 12 + end.month - start.month + 1
+        else:
+            points = end.year - start.year + 1
+        if points <= max_points:
+            return bucket
+    raise ValueError(f"Date range too long for a chart (at most {max_points} years).")
+
+
+def _bucket_counts(qs, bucket):
+    """
+    {bucket start: walk-ins}, grouped in the database.
+    """
+    if bucket == "day":
+        key = F("cust_walkin_date")
+    else:
+        key = Trunc("cust_walkin_date", bucket, output_field=DateField())
+    rows = qs.order_by().annotate(bucket=key).values("bucket").annotate(n=Count("pk"))
+    return {row["bucket"]: row["n"] for row in rows}
+
+
+def walkin_series(user, business, filters, today, max_points):
+    """
+    Walk-in counts per day / week / month / year for the Reports filters,
+    with empty buckets filled in. Without a date range the series covers
+    the business's whole history up to today. Raises ValueError if the
+    range is too long to chart.
+    """
+    qs, archived_qs = report_querysets(user, business, filters)
+
+    from_date, to_date = filters["from_date"], filters["to_date"]
+    if from_date is None:
+        firsts = [qs.aggregate(first=Min("cust_walkin_date"))["first"]]
+        if archived_qs is not None:
+            firsts.append(archived_qs.aggregate(first=Min("cust_walkin_date"))["first"])
+        firsts = [d for d in firsts if d is not None]
+        from_date, to_date = (min(firsts) if firsts else today), today
+    from_date, to_date = min(from_date, to_date), max(from_date, to_date)
+
+    bucket = choose_series_bucket(from_date, to_date, max_points)
+    counts = _bucket_counts(qs, bucket)
+    if archived_qs is not None:
+        for start, n in _bucket_counts(archived_qs, bucket).items():
+            counts[start] = counts.get(start, 0) + n
+
+    points = []
+    start = _bucket_start(from_date, bucket)
+    while start is not None and start <= to_date:
+        points.append({"start": start.isoformat(), "count": counts.get(start, 0)})
+        start = _next_bucket(start, bucket)
+
+    return {
+        "bucket": bucket,
+        "from_date": from_date.isoformat(),
+        "to_date": to_date.isoformat(),
+        "total": sum(p["count"] for p in points),
+        "points": points,
+    }
@@ -0,0 +1,150 @@
+"""
+Database routing.
+
+Replica: views opt in with @replica_reads (or code with
+`reading_from_replica()`) to send reads from read-only views to a replica.
+Writes always go to the primary ("default"). A client that has just
+written is pinned to the primary for a few seconds (see
+middleware.PinPrimaryAfterWriteMiddleware) so it never reads stale data.
+
+Tenant shards: each owner's businesses and everything hanging off them
+live in one database, chosen by the shard map (see sharding.py). Code runs
+"inside" a tenant with `tenant_database(alias)`; requests get this from
+middleware.TenantShardMiddleware. Users, profiles and the shard map itself
+always stay on the primary.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = "replica"
+
+# Cookie set after a write; while present, reads stay on the primary
+PIN_PRIMARY_COOKIE = "wp_pin_primary"
+
+_use_replica = ContextVar("walkinplus_use_replica", default=False)
+
+# Models stored on the owner's shard (model_name, app walkinplus_app)
+SHARDED_MODELS = frozenset({
+    "businessdetails",
+    "visitpurpose",
+    "customerdetails",
+    "archivedcustomerdetails",
+    "exportjob",
+    "exportownerlock",
+    "waittimeestimate",
+    "dailytokencounter",
+    "usagecounter",
+    "syncevent",
+    "webhookevent",
+})
+
+_tenant_db = ContextVar("walkinplus_tenant_db", default=DEFAULT_DB_ALIAS)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def reading_from_replica():
+    """
+    Route ORM reads inside this block to the replica (if one is configured).
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def tenant_database(alias):
+    """
+    Route sharded models inside this block to the given database alias.
+    """
+    token = _tenant_db.set(alias or DEFAULT_DB_ALIAS)
+    try:
+        yield
+    finally:
+        _tenant_db.reset(token)
+
+
+def tenant_db():
+    """
+    Alias holding the current tenant's data; pass it to transaction.atomic().
+    """
+    return _tenant_db.get()
+
+
+def is_sharded(model):
+    return model._meta.app_label == "walkinplus_app" and model._meta.model_name in SHARDED_MODELS
+
+
+def replica_reads(view):
+    """
+    View decorator: GET/HEAD requests read from the replica, unless the
+    client is pinned to the primary after a recent write.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD") or request.COOKIES.get(PIN_PRIMARY_COOKIE):
+            return view(request, *args, **kwargs)
+        with reading_from_replica():
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and replica_configured():
+            return REPLICA_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Objects read from the replica are still saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+
+class OwnerShardRouter:
+    """
+    Sends sharded models to the tenant's database. Must come before
+    PrimaryReplicaRouter: anything on the primary shard is left to it, so
+    replica reads keep working for tenants that were never moved.
+    """
+
+    def _shard(self, model, hints):
+        # __class__, not type(): request.user is a SimpleLazyObject
+        # Related lookups from a sharded object stay on that object's database
+        instance = hints.get("instance")
+        if instance is not None and is_sharded(instance.__class__) and instance._state.db:
+            # Replica rows belong to the primary shard
+            return DEFAULT_DB_ALIAS if instance._state.db == REPLICA_DB_ALIAS else instance._state.db
+        return _tenant_db.get()
+
+    def db_for_read(self, model, **hints):
+        if is_sharded(model):
+            alias = self._shard(model, hints)
+            return None if alias == DEFAULT_DB_ALIAS else alias
+        # e.g. customer.owner: users live on the primary, not the object's shard
+        instance = hints.get("instance")
+        if instance is not None and is_sharded(instance.__class__):
+            return PrimaryReplicaRouter().db_for_read(model) or DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        if is_sharded(model):
+            return self._shard(model, hints)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Owners (primary) are referenced from every shard
+        return True
@@ -0,0 +1,126 @@
+"""
+Tenant shard map: which database holds each owner's data.
+
+The map is the TenantShard table on the primary. Lookups are cached for
+SHARD_MAP_CACHE_SECONDS, so after the map changes every process sees the
+new value within that time (move_tenant waits this long between steps).
+"""
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import TenantShard
+from .routers import is_sharded, tenant_database
+
+
+def sharding_enabled():
+    return bool(settings.SHARD_DATABASES)
+
+
+def tenant_database_aliases():
+    """
+    Every database that can hold tenant data, primary first.
+    """
+    return [DEFAULT_DB_ALIAS, *settings.SHARD_DATABASES]
+
+
+def _cache_key(owner_id):
+    return f"tenant-shard:{owner_id}"
+
+
+def shard_for_owner(owner_id):
+    """
+    (database alias, status) for an owner; unmapped owners are on the primary.
+    """
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS, TenantShard.STATUS_ACTIVE
+
+    key = _cache_key(owner_id)
+    entry = cache.get(key)
+    if entry is None:
+        row = (
+            TenantShard.objects.using(DEFAULT_DB_ALIAS)
+            .filter(owner_id=owner_id)
+            .values_list("database", "status")
+            .first()
+        )
+        entry = row or (DEFAULT_DB_ALIAS, TenantShard.STATUS_ACTIVE)
+        cache.set(key, entry, settings.SHARD_MAP_CACHE_SECONDS)
+    return tuple(entry)
+
+
+def set_shard(owner_id, database, status=TenantShard.STATUS_ACTIVE):
+    TenantShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        owner_id=owner_id,
+        defaults={"database": database, "status": status},
+    )
+    cache.delete(_cache_key(owner_id))
+
+
+def owner_database(owner_id):
+    """
+    Context manager: run ORM code against this owner's shard.
+    """
+    return tenant_database(shard_for_owner(owner_id)[0])
+
+
+def each_tenant_database():
+    """
+    Iterate over all tenant databases, routing sharded models to each in turn.
+    For management commands that work across every business.
+    """
+    for alias in tenant_database_aliases():
+        with tenant_database(alias):
+            yield alias
+
+
+def reserve_id_block(alias):
+    """
+    Start the id sequences of the tenant tables on `alias` at its own block
+    (n * SHARD_ID_BLOCK for the n-th shard of tenant_database_aliases()),
+    so rows created on different shards never share a primary key and a
+    tenant keeps its ids when move_tenant moves it. Sequences already past
+    the block start are left alone.
+
+    On SQLite a new id is also always above the table's largest id, so a
+    shard that takes in a tenant from a later shard continues in that
+    shard's block; move_tenant still refuses moves whose ids collide.
+    """
+    floor = tenant_database_aliases().index(alias) * settings.SHARD_ID_BLOCK
+    if not floor:
+        return
+
+    connection = connections[alias]
+    tables = [
+        (model._meta.db_table, model._meta.auto_field.column)
+        for model in apps.get_app_config("walkinplus_app").get_models()
+        if is_sharded(model) and model._meta.auto_field
+    ]
+    with connection.cursor() as cursor:
+        for table, column in tables:
+            if connection.vendor == "sqlite":
+                cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s", [floor, table, floor])
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, floor, table],
+                )
+            elif connection.vendor == "postgresql":
+                cursor.execute("SELECT pg_get_serial_sequence(%s, %s)", [table, column])
+                sequence = cursor.fetchone()[0]
+                cursor.execute(f"SELECT last_value FROM {sequence}")
+                if cursor.fetchone()[0] < floor:
+                    cursor.execute("SELECT setval(%s::regclass, %s)", [sequence, floor])
+            else:
+                raise ImproperlyConfigured(f"Tenant shards are not supported on {connection.vendor}.")
+
+
+def reserve_shard_id_blocks(sender, using, **kwargs):
+    """
+    post_migrate: shard databases get their id block as soon as their
+    tables exist (and again after a flush).
+    """
+    if using in settings.SHARD_DATABASES:
+        reserve_id_block(using)
@@ -0,0 +1,207 @@
+"""
+Batch sync for reception desks: a list of client-generated walk-in and
+clock-out events (each with an idempotency key) applied in one
+transaction with bulk inserts and a single set-based clock-out UPDATE.
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Case, TimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from .models import BusinessDetails, CustomerDetails, SyncEvent, WebhookEvent
+from .purposes import purpose_ids, purpose_key
+from .queue_tokens import assign_tokens
+from .routers import tenant_db
+from .usage import count_walkins
+from .waittime import record_clockouts, record_walkins
+from .webhooks import enqueue_events
+
+MAX_KEY_LENGTH = 64
+
+
+class SyncError(ValueError):
+    """The batch as a whole is unusable (bad JSON shape, too many events)."""
+
+
+def _text(data, field, max_length):
+    return str(data.get(field) or "").strip()[:max_length]
+
+
+def parse_walkin_fields(data, today, now_time):
+    """
+    Walk-in data (phone, first_name, purpose, ...) → CustomerDetails
+    fields. Raises ValueError with a message for the client.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Walk-in data must be an object.")
+    phone = _text(data, "phone", 20)
+    first_name = _text(data, "first_name", 75)
+    if not phone or not first_name:
+        raise ValueError("Phone and first name are required.")
+
+    walkin_date = parse_date(str(data.get("walkin_date") or "")) or today
+    clockin = parse_time(str(data.get("clockin") or "")) or now_time
+    if walkin_date > today:
+        raise ValueError("Walk-in date is in the future.")
+
+    return {
+        "cust_name": f"{first_name} {_text(data, 'last_name', 74)}".strip(),
+        "cust_dob": parse_date(str(data.get("dob") or "")),
+        "cust_contact_number": phone,
+        "cust_companion": _text(data, "care_of", 150),
+        "cust_companion_relation": _text(data, "relation", 100),
+        "cust_visit_purpose": _text(data, "purpose", 200),
+        "cust_notes": str(data.get("notes") or "").strip(),
+        "cust_walkin_date": walkin_date,
+        "cust_clockin": clockin,
+    }
+
+
+def apply_sync_batch(user, business, events):
+    """
+    Apply events for one business. Returns a dict with applied /
+    duplicate keys, per-event errors and the walk-in key → visit id map.
+    Events whose key was already applied are skipped (safe to resend).
+    """
+    if not isinstance(events, list):
+        raise SyncError("events must be a list.")
+
+    now = timezone.localtime()
+    today, now_time = now.date(), now.time()
+
+    errors = []
+    walkins = []    # (key, fields)
+    clockouts = []  # (key, event)
+    seen_keys = set()
+
+    for event in events:
+        key = str((event or {}).get("key") or "")[:MAX_KEY_LENGTH] if isinstance(event, dict) else ""
+        if not key or key in seen_keys:
+            errors.append({"key": key, "error": "Missing or repeated idempotency key."})
+            continue
+        seen_keys.add(key)
+
+        event_type = event.get("type")
+        if event_type == SyncEvent.TYPE_WALKIN:
+            try:
+                walkins.append((key, parse_walkin_fields(event.get("data") or {}, today, now_time)))
+            except ValueError as exc:
+                errors.append({"key": key, "error": str(exc)})
+        elif event_type == SyncEvent.TYPE_CLOCKOUT:
+            clockouts.append((key, event))
+        else:
+            errors.append({"key": key, "error": "Unknown event type."})
+
+    with transaction.atomic(using=tenant_db()):
+        # Keys applied by an earlier (possibly half-acknowledged) push
+        already = dict(
+            SyncEvent.objects.filter(business=business, key__in=seen_keys).values_list("key", "visit_id")
+        )
+
+        # ---------- WALK-INS: one bulk INSERT ----------
+        new_walkins = [(key, fields) for key, fields in walkins if key not in already]
+        catalog = purpose_ids(business.pk, [fields["cust_visit_purpose"] for _, fields in new_walkins])
+        visits = [
+            CustomerDetails(
+                user=user,
+                business=business,
+                purpose_id=catalog.get(purpose_key(fields["cust_visit_purpose"])),
+                **fields,
+            )
+            for _, fields in new_walkins
+        ]
+        assign_tokens(business.pk, visits)
+        created = CustomerDetails.objects.bulk_create(visits)
+        visit_by_key = {key: visit_id for key, visit_id in already.items()}
+        visit_by_key.update({key: visit.pk for (key, _), visit in zip(new_walkins, created)})
+
+        if created:
+            record_walkins(business.pk, [visit.cust_visit_purpose for visit in created])
+            enqueue_events(business.pk, WebhookEvent.TYPE_WALKIN_CREATED, created)
+            count_walkins(business.pk, created)
+
+        # ---------- CLOCK-OUTS: one set-based UPDATE ----------
+        clockout_time_by_visit = {}
+        clockout_key_by_visit = {}
+        for key, event in clockouts:
+            if key in already:
+                continue
+            visit_id = event.get("visit_id") or visit_by_key.get(str(event.get("walkin_key") or ""))
+            if not str(visit_id or "").isdigit():
+                errors.append({"key": key, "error": "Unknown visit."})
+                continue
+            visit_id = int(visit_id)
+            if visit_id in clockout_key_by_visit:
+                errors.append({"key": key, "error": "Visit is clocked out by another event in this batch."})
+                continue
+            try:
+                # parse_time() raises ValueError on e.g. "25:00"
+                clockout_time = parse_time(str(event.get("clockout") or "")) or now_time
+            except ValueError:
+                errors.append({"key": key, "error": "Invalid clock-out time."})
+                continue
+            clockout_time_by_visit[visit_id] = clockout_time
+            clockout_key_by_visit[visit_id] = key
+
+        closed_ids = set()
+        if clockout_time_by_visit:
+            open_qs = CustomerDetails.objects.filter(
+                pk__in=clockout_time_by_visit,
+                user=user,
+                business=business,
+                cust_clockout__isnull=True,
+            )
+            closing = list(open_qs.select_for_update().values(
+                "pk", "cust_name", "cust_contact_number",
+                "cust_visit_purpose", "cust_walkin_date", "cust_clockin",
+            ))
+            closed_ids = {visit["pk"] for visit in closing}
+
+            if closed_ids:
+                CustomerDetails.objects.filter(pk__in=closed_ids).update(
+                    cust_clockout=Case(
+                        *[When(pk=pk, then=Value(clockout_time_by_visit[pk])) for pk in closed_ids],
+                        output_field=TimeField(),
+                    ),
+                    updated_at=timezone.now(),
+                )
+
+            for visit in closing:
+                visit["cust_clockout"] = clockout_time_by_visit[visit["pk"]]
+            record_clockouts(business.pk, [
+                (
+                    visit["cust_visit_purpose"],
+                    visit["cust_walkin_date"],
+                    visit["cust_clockin"],
+                    timezone.make_aware(datetime.combine(visit["cust_walkin_date"], visit["cust_clockout"])),
+                )
+                for visit in closing
+            ])
+            enqueue_events(business.pk, WebhookEvent.TYPE_WALKIN_CLOCKED_OUT, closing)
+
+            for visit_id, key in clockout_key_by_visit.items():
+                if visit_id not in closed_ids:
+                    errors.append({"key": key, "error": "Visit not found or already clocked out."})
+
+        # ---------- IDEMPOTENCY RECORDS: one bulk INSERT ----------
+        new_events = [
+            SyncEvent(business=business, key=key, event_type=SyncEvent.TYPE_WALKIN, visit_id=visit_by_key[key])
+            for key, _ in new_walkins
+        ] + [
+            SyncEvent(business=business, key=key, event_type=SyncEvent.TYPE_CLOCKOUT, visit_id=visit_id)
+            for visit_id, key in clockout_key_by_visit.items()
+            if visit_id in closed_ids
+        ]
+        SyncEvent.objects.bulk_create(new_events)
+
+        if new_events:
+            BusinessDetails.mark_changed(pk=business.pk)
+
+    return {
+        "applied": [event.key for event in new_events],
+        "duplicates": sorted(seen_keys & set(already)),
+        "errors": errors,
+        "visits": {key: visit_by_key[key] for key, _ in walkins if key in visit_by_key},
+    }
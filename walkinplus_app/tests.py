@@ -1,3 +1,1823 @@
-from django.test import TestCase
+"""
+Query-budget and latency regression tests.
 
-# Create your tests here.
+Every view in walkinplus/urls.py is exercised under each tab, filter and
+POST action with a pinned maximum number of SQL queries, so an N+1 or an
+accidental extra lookup fails the build. A second class seeds a medium
+dataset and checks response times stay under generous thresholds.
+
+Run with e.g.  DATABASE_URL=sqlite:///test.sqlite3 python manage.py test
+Scale latency thresholds on slow machines with WALKINPLUS_LATENCY_SCALE=2.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, time as dtime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from importlib import import_module
+from io import BytesIO, StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, connections, transaction
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    ArchivedCustomerDetails,
+    BusinessDetails,
+    CustomerDetails,
+    ExportJob,
+    ExportOwnerLock,
+    MoveTombstone,
+    TenantShard,
+    UsageCounter,
+    UserDetails,
+    VisitPurpose,
+    WaitTimeEstimate,
+    WebhookEvent,
+)
+from .admin import WalkinDatesQuerySet
+from .exports import run_export_job
+from .kiosk import _Checkin, _save_checkins, new_kiosk_token
+from .management.commands.move_tenant import Command as MoveTenantCommand
+from .logos import uploads_enabled
+from .purposes import purpose_ids, top_purposes
+from .reports import iter_report_rows
+from .queue_tokens import assign_tokens
+from .routers import (
+    PIN_PRIMARY_COOKIE,
+    REPLICA_DB_ALIAS,
+    PrimaryReplicaRouter,
+    reading_from_replica,
+    replica_configured,
+    replica_reads,
+    tenant_database,
+)
+from .sharding import set_shard, shard_for_owner
+from .sync import parse_walkin_fields
+from .waittime import estimated_wait, record_clockout, record_clockouts, record_walkins, resync_queue_depths
+from .webhooks import enqueue_events, get_dispatcher, sign
+
+
+PASSWORD = "pw123456"
+
+# A configured replica is a test mirror of the primary: classes that only
+# use the primary still declare it, since replica-reading views query it.
+PRIMARY_DATABASES = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS} if replica_configured() else {DEFAULT_DB_ALIAS}
+
+
+def setUpModule():
+    # The mirror's own connection would not see data a TestCase has not
+    # committed (and on SQLite finds its tables locked); read through the
+    # primary's connection instead, like a replica that has caught up.
+    if replica_configured():
+        connections[REPLICA_DB_ALIAS] = connections[DEFAULT_DB_ALIAS]
+
+
+def tearDownModule():
+    if replica_configured():
+        del connections[REPLICA_DB_ALIAS]
+
+
+class QueryBudgetMixin:
+    """
+    assertMaxQueries(n): like assertNumQueries, but only fails when the
+    budget is exceeded, and lists every SQL statement that ran.
+    Budgets are for a single database; with tenant shards configured a
+    request also looks up the shard map once (cold cache).
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        if settings.SHARD_DATABASES:
+            budget += 1
+        with CaptureQueriesContext(connections[using]) as ctx:
+            yield ctx
+
+        if len(ctx) > budget:
+            statements = "\n".join(
+                f"{i}. {q['sql']}" for i, q in enumerate(ctx.captured_queries, start=1)
+            )
+            self.fail(f"{len(ctx)} queries executed, budget is {budget}:\n{statements}")
+
+    def assertLatencyUnder(self, max_ms, func):
+        scale = float(os.environ.get("WALKINPLUS_LATENCY_SCALE", "1"))
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+            started = time.perf_counter()
+            response = func()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if elapsed_ms > max_ms * scale:
+            slowest = sorted(ctx.captured_queries, key=lambda q: float(q["time"]), reverse=True)[:5]
+            statements = "\n".join(f"{q['time']}s  {q['sql']}" for q in slowest)
+            self.fail(
+                f"Took {elapsed_ms:.0f} ms, threshold is {max_ms * scale:.0f} ms. "
+                f"Slowest queries:\n{statements}"
+            )
+        return response
+
+
+def make_owner(username="owner", phone="9000000001"):
+    user = User.objects.create_user(username=username, email=f"{username}@example.com", password=PASSWORD)
+    UserDetails.objects.create(user=user, phone_number=phone)
+    return user
+
+
+def seed_walkins(user, business, count, days=60, open_today=3):
+    """
+    count visits spread over the last `days` days, a few still open today.
+    """
+    today = timezone.localdate()
+    CustomerDetails.objects.bulk_create([
+        CustomerDetails(
+            user=user,
+            business=business,
+            cust_name=f"Patient {i}",
+            cust_contact_number=f"98{i:08d}",
+            cust_visit_purpose=("Fever", "Checkup", "Follow-up")[i % 3],
+            cust_walkin_date=today - timedelta(days=i % days),
+            cust_clockin=dtime(9 + i % 8, i % 60),
+            cust_clockout=dtime(18, 0),
+        )
+        for i in range(count)
+    ])
+    CustomerDetails.objects.bulk_create([
+        CustomerDetails(
+            user=user,
+            business=business,
+            cust_name=f"Waiting {i}",
+            cust_contact_number=f"97{i:08d}",
+            cust_visit_purpose="Fever",
+            cust_walkin_date=today,
+            cust_clockin=dtime(10, i),
+        )
+        for i in range(open_today)
+    ])
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+        cls.other_business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Second Clinic", business_location="Pune"
+        )
+        seed_walkins(cls.user, cls.business, 50)
+        seed_walkins(cls.user, cls.other_business, 10)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        # First page load sets the CSRF cookie; keep it out of the budgets
+        self.client.get(reverse("home"))
+
+    def dashboard_url(self, **params):
+        params.setdefault("business_id", self.business.pk)
+        query = "&".join(f"{k}={v}" for k, v in params.items())
+        return reverse("management_dashboard") + "?" + query
+
+    def open_visit_ids(self):
+        return list(
+            CustomerDetails.objects.filter(
+                business=self.business, cust_clockout__isnull=True
+            ).values_list("pk", flat=True)
+        )
+
+    # ---------- PUBLIC PAGES ----------
+
+    def test_mainpage(self):
+        self.client.logout()
+        with self.assertMaxQueries(0):
+            self.assertEqual(self.client.get(reverse("mainpage")).status_code, 200)
+
+    def test_login_get(self):
+        self.client.logout()
+        with self.assertMaxQueries(0):
+            self.assertEqual(self.client.get(reverse("loginpage")).status_code, 200)
+
+    def test_login_post(self):
+        self.client.logout()
+        with self.assertMaxQueries(10):
+            response = self.client.post(reverse("loginpage"), {"username": "owner", "password": PASSWORD})
+        self.assertRedirects(response, reverse("home"), fetch_redirect_response=False)
+
+    def test_login_password_reset(self):
+        self.client.logout()
+        with self.assertMaxQueries(2):
+            response = self.client.post(reverse("loginpage"), {
+                "reset_action": "1",
+                "reset_method": "phone",
+                "identifier": "9000000001",
+                "otp": "123456",
+                "new_password": PASSWORD,
+                "confirm_password": PASSWORD,
+            })
+        self.assertEqual(response.status_code, 200)
+
+    def test_signup_get(self):
+        self.client.logout()
+        with self.assertMaxQueries(0):
+            self.assertEqual(self.client.get(reverse("signuppage")).status_code, 200)
+
+    def test_signup_post(self):
+        self.client.logout()
+        with self.assertMaxQueries(6):
+            response = self.client.post(reverse("signuppage"), {
+                "owner_name": "New Owner",
+                "username": "newowner",
+                "email": "new@example.com",
+                "phone": "9000000099",
+                "password": PASSWORD,
+                "confirm_password": PASSWORD,
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.filter(username="newowner").exists())
+
+    def test_health_endpoints(self):
+        with self.assertMaxQueries(0):
+            self.assertEqual(self.client.get("/healthz/").status_code, 200)
+        with self.assertMaxQueries(1):
+            self.assertEqual(self.client.get("/healthz/ready/").status_code, 200)
+
+    # ---------- HOME ----------
+
+    def test_home(self):
+        with self.assertMaxQueries(4):
+            self.assertEqual(self.client.get(reverse("home")).status_code, 200)
+
+    # ---------- PATIENT DASHBOARD ----------
+
+    def test_patient_dashboard_get(self):
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        # Includes the (cold) top-purposes query
+        with self.assertMaxQueries(7):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["visits"]), 3)
+
+    def test_patient_dashboard_new_walkin(self):
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        # The first walk-in with a new purpose also adds it to the catalog (3 queries);
+        # visit, token counter, estimator, webhook outbox and usage counter commit together (1 savepoint)
+        with self.assertMaxQueries(18):
+            response = self.client.post(url, {
+                "action": "new_walkin",
+                "phone": "9123456789",
+                "first_name": "Asha",
+                "purpose": "Fever",
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_patient_dashboard_clockout(self):
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        visit_id = self.open_visit_ids()[0]
+        with self.assertMaxQueries(15):
+            self.client.post(url, {"action": "clockout", "visit_id": visit_id})
+        self.assertIsNotNone(CustomerDetails.objects.get(pk=visit_id).cust_clockout)
+
+    def test_patient_dashboard_bulk_clockout(self):
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        visit_ids = self.open_visit_ids()
+        # Same cost as one visit: one UPDATE for the visits, one locked read
+        # and one UPDATE for the estimator rows, one outbox INSERT
+        self.assertGreater(len(visit_ids), 1)
+        with self.assertMaxQueries(15):
+            self.client.post(url, {"action": "clockout", "visit_id": visit_ids})
+        self.assertFalse(
+            CustomerDetails.objects.filter(pk__in=visit_ids, cust_clockout__isnull=True).exists()
+        )
+
+    def test_patient_dashboard_not_modified(self):
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        self.client.get(url)  # sets the CSRF cookie, which is part of the ETag
+        etag = self.client.get(url)["ETag"]
+        with self.assertMaxQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    # ---------- MANAGEMENT DASHBOARD: TABS ----------
+
+    def test_management_dashboard_tabs(self):
+        for tab in ("overview", "add-business", "reports", "profile", "pricing"):
+            with self.subTest(tab=tab):
+                cache.clear()
+                with self.assertMaxQueries(19):
+                    response = self.client.get(self.dashboard_url(tab=tab))
+                self.assertEqual(response.status_code, 200)
+
+    def test_management_dashboard_without_business(self):
+        user = make_owner("empty", phone="9000000002")
+        self.client.force_login(user)
+        with self.assertMaxQueries(6):
+            response = self.client.get(reverse("management_dashboard"))
+        self.assertEqual(response.context["total_walkins"], 0)
+
+    def test_management_dashboard_report_filters(self):
+        today = timezone.localdate().isoformat()
+        month_ago = (timezone.localdate() - timedelta(days=30)).isoformat()
+        filters = {
+            "date range": {"from_date": month_ago, "to_date": today},
+            "single day": {"from_date": today},
+            "time window": {"from_date": month_ago, "to_date": today, "time_from": "09:00", "time_to": "12:00"},
+            "time from only": {"from_date": today, "time_from": "09:00"},
+            "search": {"search": "Patient 1"},
+            "everything": {"from_date": month_ago, "to_date": today, "time_from": "09:00",
+                           "time_to": "17:00", "search": "Fever"},
+        }
+        for label, params in filters.items():
+            with self.subTest(filter=label):
+                with self.assertMaxQueries(19):
+                    response = self.client.get(self.dashboard_url(tab="reports", **params))
+                self.assertEqual(response.status_code, 200)
+
+    def test_management_dashboard_not_modified(self):
+        url = self.dashboard_url(tab="reports")
+        self.client.get(url)  # sets the CSRF cookie, which is part of the ETag
+        etag = self.client.get(url)["ETag"]
+        with self.assertMaxQueries(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_walkin_trends(self):
+        url = reverse("walkin_trends")
+        today = timezone.localdate()
+        ranges = {
+            "day": (today - timedelta(days=59), today),
+            "week": (today - timedelta(days=700), today),
+            "month": (today - timedelta(days=3650), today),
+        }
+        for bucket, (start, end) in ranges.items():
+            with self.subTest(bucket=bucket):
+                params = {"business_id": self.business.pk, "from_date": start, "to_date": end}
+                with self.assertMaxQueries(6):
+                    data = self.client.get(url, params).json()
+                self.assertEqual(data["bucket"], bucket)
+                self.assertLessEqual(len(data["points"]), 250)
+                self.assertEqual(data["total"], 53)
+
+        # Served from cache until the business changes
+        with self.assertMaxQueries(4):
+            self.client.get(url, params)
+
+    def test_walkin_trends_at_the_edges_of_the_calendar(self):
+        url = reverse("walkin_trends")
+        data = self.client.get(url, {"business_id": self.business.pk, "from_date": "9999-12-31"}).json()
+        self.assertEqual(data["points"], [{"start": "9999-12-31", "count": 0}])
+
+        data = self.client.get(url, {"business_id": self.business.pk, "from_date": "9990-01-01", "to_date": "9999-12-31"}).json()
+        self.assertEqual((data["bucket"], len(data["points"])), ("month", 120))
+
+        # More years than SERIES_MAX_POINTS: no bucket fits
+        response = self.client.get(url, {"business_id": self.business.pk, "from_date": "0001-01-01", "to_date": "9999-12-31"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("too long", response.json()["error"])
+
+    def test_csv_export(self):
+        with self.assertMaxQueries(11):
+            response = self.client.get(self.dashboard_url(tab="reports", export="csv"))
+            content = b"".join(response.streaming_content) if response.streaming else response.content
+        # header + 53 visits
+        self.assertEqual(len(content.decode().strip().splitlines()), 54)
+
+    def test_full_report_streams_in_chunks(self):
+        with patch("walkinplus_app.views.REPORT_CHUNK_ROWS", 20), self.assertMaxQueries(11):
+            response = self.client.get(self.dashboard_url(tab="reports", export="html"))
+            self.assertTrue(response.streaming)
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+        # Page head, 20 + 20 + 13 rows, row count
+        self.assertEqual(len(chunks), 5)
+        self.assertNotIn("<tr>", chunks[0].split("<tbody>")[1])
+        self.assertEqual("".join(chunks).count("<tr>"), 1 + 53)
+        self.assertIn("53 walk-ins.", chunks[-1])
+
+    @override_settings(DELTA_EXPORT_SETTLE_SECONDS=0)
+    def test_delta_export_returns_changes_since_watermark(self):
+        with self.assertMaxQueries(10):
+            response = self.client.get(self.dashboard_url(export="delta"))
+        # header + 53 visits
+        self.assertEqual(len(response.content.decode().strip().splitlines()), 54)
+        watermark = response["X-Export-Watermark"]
+
+        visit_id = self.open_visit_ids()[0]
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        self.client.post(url, {"action": "clockout", "visit_id": visit_id})
+
+        with self.assertMaxQueries(10):
+            response = self.client.get(self.dashboard_url(export="delta", since=watermark))
+        lines = response.content.decode().strip().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith(f"{visit_id},"))
+        self.assertGreater(response["X-Export-Watermark"], watermark)
+
+        self.assertEqual(self.client.get(self.dashboard_url(export="delta", since="yesterday")).status_code, 400)
+
+    # ---------- MANAGEMENT DASHBOARD: POST ACTIONS ----------
+
+    def test_add_business(self):
+        with self.assertMaxQueries(3):
+            self.client.post(reverse("management_dashboard"), {
+                "form_type": "add_business",
+                "tab": "add-business",
+                "business_name": "Third Clinic",
+                "location": "Delhi",
+            })
+        self.assertTrue(BusinessDetails.objects.filter(business_name="Third Clinic").exists())
+
+    def test_update_profile(self):
+        with self.assertMaxQueries(6):
+            self.client.post(reverse("management_dashboard"), {
+                "form_type": "update_profile",
+                "tab": "profile",
+                "display_name": "Dr. Rao",
+                "phone": "9000000003",
+            })
+
+    def test_update_business(self):
+        with self.assertMaxQueries(5):
+            self.client.post(reverse("management_dashboard"), {
+                "form_type": "update_business",
+                "tab": "profile",
+                "business_id": self.business.pk,
+                "business_name": "Main Clinic",
+                "location": "Hyderabad",
+                "status": "active",
+            })
+
+    def test_start_background_export(self):
+        # The per-owner limit is checked under the owner's export lock row
+        # (+ savepoint); the first export creates that row (+2)
+        with self.assertMaxQueries(12):
+            self.client.post(reverse("management_dashboard"), {
+                "form_type": "export_job",
+                "tab": "reports",
+                "business_id": self.business.pk,
+                "file_format": "csv.gz",
+            })
+        self.assertEqual(self.user.export_jobs.count(), 1)
+
+    # ---------- ALL-BUSINESSES OVERVIEW ----------
+
+    def test_businesses_overview(self):
+        with self.assertMaxQueries(5):
+            response = self.client.get(reverse("businesses_overview"))
+        self.assertEqual(len(response.context["rows"]), 2)
+
+        # Cached on the second load (page number resolved with one COUNT),
+        # including for spellings of the same page
+        for page in ("", "?page=1", "?page=01", "?page=abc", "?page=99"):
+            with self.subTest(page=page), self.assertMaxQueries(3):
+                self.client.get(reverse("businesses_overview") + page)
+
+    def test_businesses_overview_query_count_is_flat(self):
+        for i in range(20):
+            BusinessDetails.objects.create(owner=self.user, business_name=f"Branch {i}", business_location="X")
+        with self.assertMaxQueries(5):
+            self.client.get(reverse("businesses_overview"))
+
+    # ---------- ADMIN ----------
+
+    def test_admin_customer_changelist(self):
+        admin_user = User.objects.create_superuser("root", "root@example.com", PASSWORD)
+        self.client.force_login(admin_user)
+        with self.assertMaxQueries(6):
+            response = self.client.get(reverse("admin:walkinplus_app_customerdetails_changelist"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_business_filter_is_an_autocomplete(self):
+        admin_user = User.objects.create_superuser("root", "root@example.com", PASSWORD)
+        self.client.force_login(admin_user)
+        other = BusinessDetails.objects.create(owner=self.user, business_name="Other Clinic", business_location="Y")
+        seed_walkins(self.user, other, 1, open_today=0)
+        url = reverse("admin:walkinplus_app_customerdetails_changelist")
+        response = self.client.get(url, {"business": other.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="business-filter"')
+        self.assertContains(response, "admin-autocomplete")
+        # Only the selected business is rendered, not one link per business
+        self.assertNotContains(response, f"?business={self.business.pk}")
+        self.assertEqual({c.business_id for c in response.context["cl"].result_list}, {other.pk})
+
+    def test_admin_date_hierarchy_matches_stock_dates(self):
+        stock = CustomerDetails.objects.filter(business=self.business)
+        indexed = WalkinDatesQuerySet(CustomerDetails).filter(business=self.business)
+        for kind in ("year", "month", "day"):
+            self.assertEqual(
+                indexed.dates("cust_walkin_date", kind, "DESC"),
+                list(stock.dates("cust_walkin_date", kind, "DESC")),
+            )
+
+
+class LatencyTests(QueryBudgetMixin, TestCase):
+    """
+    Medium dataset: 5 businesses x 2,000 visits. Thresholds are generous
+    (SQLite, shared CI boxes); they catch order-of-magnitude regressions
+    such as a lost index or per-row queries, not small slowdowns.
+    """
+
+    databases = PRIMARY_DATABASES
+
+    BUSINESSES = 5
+    VISITS_PER_BUSINESS = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.businesses = [
+            BusinessDetails.objects.create(
+                owner=cls.user, business_name=f"Clinic {i}", business_location="City"
+            )
+            for i in range(cls.BUSINESSES)
+        ]
+        for business in cls.businesses:
+            seed_walkins(cls.user, business, cls.VISITS_PER_BUSINESS, days=365)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_management_dashboard_overview(self):
+        url = reverse("management_dashboard") + f"?business_id={self.businesses[0].pk}"
+        response = self.assertLatencyUnder(500, lambda: self.client.get(url))
+        self.assertEqual(response.status_code, 200)
+
+    def test_management_dashboard_reports_full_year(self):
+        today = timezone.localdate()
+        url = (
+            reverse("management_dashboard")
+            + f"?tab=reports&business_id={self.businesses[0].pk}"
+            + f"&from_date={(today - timedelta(days=365)).isoformat()}&to_date={today.isoformat()}&search=Fever"
+        )
+        response = self.assertLatencyUnder(500, lambda: self.client.get(url))
+        self.assertEqual(len(response.context["records"]), 200)
+
+    def test_csv_export_full_business(self):
+        url = reverse("management_dashboard") + f"?tab=reports&export=csv&business_id={self.businesses[0].pk}"
+        self.assertLatencyUnder(1500, lambda: self.client.get(url))
+
+    def test_full_report_first_chunk(self):
+        # The page head goes out before any walk-in row is read
+        url = reverse("management_dashboard") + f"?tab=reports&export=html&business_id={self.businesses[0].pk}"
+        self.assertLatencyUnder(100, lambda: next(iter(self.client.get(url).streaming_content)))
+
+    def test_patient_dashboard(self):
+        url = reverse("patient_dashboard") + f"?business_id={self.businesses[0].pk}"
+        self.assertLatencyUnder(300, lambda: self.client.get(url))
+
+    def test_businesses_overview(self):
+        self.assertLatencyUnder(300, lambda: self.client.get(reverse("businesses_overview")))
+
+
+class SyncEndpointTests(QueryBudgetMixin, TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def push(self, events):
+        return self.client.post(
+            reverse("patient_dashboard_sync"),
+            data={"business_id": self.business.pk, "events": events},
+            content_type="application/json",
+        )
+
+    def offline_batch(self, size, start=0):
+        events = []
+        for i in range(start, start + size):
+            events.append({"type": "walkin", "key": f"w{i}", "data": {
+                "phone": f"90000000{i:02d}", "first_name": f"Walk {i}", "purpose": "Fever",
+            }})
+        # Half of them were also seen and clocked out while offline
+        for i in range(start, start + size, 2):
+            events.append({"type": "clockout", "key": f"c{i}", "walkin_key": f"w{i}"})
+        return events
+
+    def test_offline_queue_applied_in_one_round_trip(self):
+        response = self.push(self.offline_batch(10))
+        body = response.json()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(body["applied"]), 15)
+        self.assertEqual(body["errors"], [])
+        self.assertEqual(len(body["queue"]), 5)
+        self.assertEqual(CustomerDetails.objects.filter(business=self.business).count(), 10)
+
+    def test_resend_is_idempotent(self):
+        events = self.offline_batch(4)
+        self.push(events)
+        body = self.push(events).json()
+
+        self.assertEqual(body["applied"], [])
+        self.assertEqual(len(body["duplicates"]), 6)
+        self.assertEqual(CustomerDetails.objects.filter(business=self.business).count(), 4)
+
+    def test_visits_and_clockouts_are_set_based(self):
+        # Walk-ins and clock-outs are one INSERT / one UPDATE each, and the
+        # wait-estimator updates are batched too: the query count is flat
+        self.push(self.offline_batch(2, start=50))  # creates the estimate/counter rows
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as small:
+            self.push(self.offline_batch(4))
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as ctx:
+            self.push(self.offline_batch(20, start=4))
+        visit_writes = [
+            q["sql"] for q in ctx.captured_queries
+            if q["sql"].startswith(('INSERT INTO "customer_details"', 'UPDATE "customer_details"'))
+        ]
+        self.assertEqual(len(visit_writes), 2)
+        self.assertEqual(len(ctx.captured_queries), len(small.captured_queries))
+
+    def test_invalid_events_are_reported_per_key(self):
+        body = self.push([
+            {"type": "walkin", "key": "bad", "data": {"phone": ""}},
+            {"type": "clockout", "key": "missing", "visit_id": 999999},
+            {"type": "teleport", "key": "odd"},
+        ]).json()
+
+        self.assertEqual({e["key"] for e in body["errors"]}, {"bad", "missing", "odd"})
+        self.assertEqual(body["applied"], [])
+
+    def test_bad_clockouts_do_not_fail_the_batch(self):
+        body = self.push([
+            {"type": "walkin", "key": "w0", "data": {"phone": "9000000000", "first_name": "Asha", "clockin": "09:00"}},
+            {"type": "walkin", "key": "w1", "data": {"phone": "9000000001", "first_name": "Ravi", "clockin": "25:00"}},
+            {"type": "clockout", "key": "late", "walkin_key": "w0", "clockout": "25:00"},
+            {"type": "clockout", "key": "c0", "walkin_key": "w0", "clockout": "09:30"},
+            {"type": "clockout", "key": "again", "walkin_key": "w0", "clockout": "09:45"},
+        ]).json()
+
+        self.assertEqual(sorted(body["applied"]), ["c0", "w0"])
+        self.assertEqual({e["key"] for e in body["errors"]}, {"w1", "late", "again"})
+        visit = CustomerDetails.objects.get(pk=body["visits"]["w0"])
+        self.assertEqual(visit.cust_clockout, dtime(9, 30))
+
+
+class RequestProfilerTests(TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        BusinessDetails.objects.create(owner=cls.user, business_name="Main Clinic", business_location="Hyderabad")
+
+    def setUp(self):
+        cache.clear()
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+
+    def test_staff_request_writes_profile_and_sql(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+        with override_settings(REQUEST_PROFILE_DIR=self.profile_dir):
+            response = self.client.get(reverse("management_dashboard") + "?_profile=1&tab=reports&search=9876543210")
+
+        profile_id = response["X-Profile-Id"]
+        sql = Path(self.profile_dir, f"{profile_id}.sql.txt").read_text()
+        self.assertIn('FROM "customer_details"', sql)
+        self.assertTrue(Path(self.profile_dir, f"{profile_id}.folded").exists())
+
+        # Patient details (search terms, query parameters) stay out of it
+        self.assertIn("GET /management-dashboard/?_profile=…&search=…&tab=…", sql)
+        self.assertIn("params: (int, str", sql)
+        self.assertNotIn("9876543210", sql)
+        self.assertNotIn("owner@example.com", sql)
+
+    def test_staff_profile_a_page_as_an_owner(self):
+        staff = User.objects.create_user("support", password=PASSWORD, is_staff=True)
+        url = reverse("management_dashboard") + "?_profile=1&_profile_as="
+
+        with override_settings(REQUEST_PROFILE_DIR=self.profile_dir):
+            # Owners cannot use the switch, for themselves or anyone else
+            self.client.force_login(self.user)
+            self.assertFalse(self.client.get(url + str(staff.pk)).has_header("X-Profile-Id"))
+
+            self.client.force_login(staff)
+            response = self.client.get(url + str(self.user.pk))
+            self.assertEqual(response.context["selected_business_name"], "Main Clinic")
+            sql = Path(self.profile_dir, f"{response['X-Profile-Id']}.sql.txt").read_text()
+            self.assertIn(f"user={staff.pk} as={self.user.pk} ", sql)
+
+            # Only that request: the session is still the staff account's
+            self.assertEqual(self.client.get(reverse("management_dashboard")).context["selected_business_name"], "")
+
+            # Checked server-side: no staff targets, no unknown ids, no writes
+            self.assertEqual(self.client.get(url + str(staff.pk)).status_code, 400)
+            self.assertEqual(self.client.get(url + "999999").status_code, 400)
+            self.assertEqual(self.client.post(url + str(self.user.pk), {"form_type": "update_profile"}).status_code, 400)
+
+    def test_non_staff_and_rate_limit(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("home") + "?_profile=1")
+        self.assertFalse(response.has_header("X-Profile-Id"))
+
+        self.user.is_staff = True
+        self.user.save()
+        with override_settings(REQUEST_PROFILE_DIR=self.profile_dir, REQUEST_PROFILE_RATE=1):
+            first = self.client.get(reverse("home"), HTTP_X_WALKINPLUS_PROFILE="1")
+            second = self.client.get(reverse("home"), HTTP_X_WALKINPLUS_PROFILE="1")
+        self.assertTrue(first.has_header("X-Profile-Id"))
+        self.assertFalse(second.has_header("X-Profile-Id"))
+
+
+class HealthCheckTests(TestCase):
+    databases = PRIMARY_DATABASES
+
+    def test_liveness_skips_host_check_and_database(self):
+        # Platform probes call the instance by IP, which is not in ALLOWED_HOSTS
+        client = Client(HTTP_HOST="10.0.0.7")
+        for path in ("/healthz", "/healthz/"):
+            with self.assertNumQueries(0):
+                response = client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {"status": "ok"})
+            self.assertFalse(response.cookies)
+
+    def test_readiness_pings_database(self):
+        with self.assertNumQueries(1):
+            response = Client(HTTP_HOST="10.0.0.7").get("/healthz/ready/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ok", "database": "ok"})
+
+    def test_readiness_fails_when_database_is_down(self):
+        with patch("walkinplus_app.middleware.connection") as connection:
+            connection.cursor.side_effect = OperationalError("connection refused")
+            response = Client(HTTP_HOST="10.0.0.7").get("/healthz/ready")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"status": "unavailable", "database": "error"})
+
+    def test_profile_startup_reports_phases(self):
+        output = Path(tempfile.mkdtemp(), "startup.jsonl")
+        self.addCleanup(shutil.rmtree, output.parent, ignore_errors=True)
+        stdout = StringIO()
+
+        # Any real cold start is over a 1 microsecond budget
+        with self.assertRaisesMessage(CommandError, "over the 0.001 ms budget"):
+            call_command("profile_startup", top=5, output=str(output), budget_ms=0.001, stdout=stdout)
+
+        self.assertIn("first response status   200 OK", stdout.getvalue())
+        self.assertIn("No DB connections opened during startup.", stdout.getvalue())
+        record = json.loads(output.read_text())
+        self.assertEqual(record["first_response_status"], "200 OK")
+        self.assertEqual(record["import_time_db_connections"], [])
+        self.assertEqual(len(record["slowest_imports"]), 5)
+        self.assertGreater(record["cold_start_ms"], 0)
+
+
+class ArchiveWalkinsTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+        # One visit a day for the last 60 days, with purposes and tokens
+        seed_walkins(cls.user, cls.business, 60, open_today=0)
+        catalog = purpose_ids(cls.business.pk, ["Fever", "Checkup", "Follow-up"])
+        for visit in CustomerDetails.objects.all():
+            visit.purpose_id = catalog[visit.cust_visit_purpose.lower()]
+            visit.cust_token = 1
+            visit.save()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def report_lines(self, from_date, to_date):
+        url = reverse("management_dashboard") + (
+            f"?business_id={self.business.pk}&export=csv&from_date={from_date}&to_date={to_date}"
+        )
+        return self.client.get(url).content.decode().strip().splitlines()[1:]
+
+    def test_archived_visits_keep_their_columns_and_stay_in_reports(self):
+        today = timezone.localdate()
+        live = {v.pk: v for v in CustomerDetails.objects.all()}
+
+        call_command("archive_walkins", days=30, batch_size=7, stdout=StringIO())
+
+        self.assertEqual(CustomerDetails.objects.count(), 31)
+        self.assertEqual(ArchivedCustomerDetails.objects.count(), 29)
+        for archived in ArchivedCustomerDetails.objects.all():
+            visit = live[archived.pk]
+            self.assertEqual(
+                (archived.purpose_id, archived.cust_token, archived.updated_at),
+                (visit.purpose_id, visit.cust_token, visit.updated_at),
+            )
+
+        # Across the archive boundary: archived rows first, oldest first
+        lines = self.report_lines(today - timedelta(days=40), today)
+        self.assertEqual(len(lines), 41)
+        dates = [line.split(",")[3] for line in lines]
+        self.assertEqual(dates, sorted(dates))
+        # Entirely within the live table
+        self.assertEqual(len(self.report_lines(today - timedelta(days=5), today)), 6)
+
+    def test_open_visits_are_not_archived(self):
+        forgotten = CustomerDetails.objects.order_by("cust_walkin_date").first()
+        CustomerDetails.objects.filter(pk=forgotten.pk).update(cust_clockout=None)
+        record_walkins(self.business.pk, [forgotten.cust_visit_purpose])
+
+        call_command("archive_walkins", days=30, stdout=StringIO())
+
+        # Still open (and still in the queue depth) until it is clocked out
+        self.assertTrue(CustomerDetails.objects.filter(pk=forgotten.pk).exists())
+        self.assertEqual(ArchivedCustomerDetails.objects.count(), 28)
+        self.assertEqual(estimated_wait(self.business.pk)["queue_depth"], 1)
+
+        call_command("close_stale_visits", stdout=StringIO())
+        call_command("archive_walkins", days=30, stdout=StringIO())
+        self.assertFalse(CustomerDetails.objects.filter(pk=forgotten.pk).exists())
+        self.assertEqual(estimated_wait(self.business.pk)["queue_depth"], 0)
+
+
+class CloseVisitsTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        today = timezone.localdate()
+        # Three visits never closed on earlier days, two waiting today
+        dates = [today - timedelta(days=3), today - timedelta(days=2), today - timedelta(days=1), today, today]
+        self.visits = CustomerDetails.objects.bulk_create([
+            CustomerDetails(
+                user=self.user,
+                business=self.business,
+                cust_name=f"Open {i}",
+                cust_contact_number=f"97{i:08d}",
+                cust_visit_purpose=("Fever", "Checkup")[i % 2],
+                cust_walkin_date=day,
+                cust_clockin=dtime(10, i),
+            )
+            for i, day in enumerate(dates)
+        ])
+        record_walkins(self.business.pk, [visit.cust_visit_purpose for visit in self.visits])
+        self.before = timezone.now()
+
+    def depths(self):
+        return dict(
+            WaitTimeEstimate.objects.filter(business=self.business).values_list("purpose", "queue_depth")
+        )
+
+    def test_stale_visits_are_closed_in_batches(self):
+        self.assertEqual(self.depths(), {"": 5, "fever": 3, "checkup": 2})
+
+        out = StringIO()
+        call_command("close_stale_visits", batch_size=2, clockout_time="20:00", stdout=out)
+        self.assertIn("Closed 3 stale open visits", out.getvalue())
+
+        stale = CustomerDetails.objects.filter(pk__in=[v.pk for v in self.visits[:3]])
+        self.assertEqual({v.cust_clockout for v in stale}, {dtime(20, 0)})
+        self.assertTrue(all(v.updated_at >= self.before for v in stale))
+        self.assertFalse(
+            CustomerDetails.objects.filter(pk__in=[v.pk for v in self.visits[3:]], cust_clockout__isnull=False).exists()
+        )
+        # Only today's two open visits are still waiting
+        self.assertEqual(self.depths(), {"": 2, "fever": 1, "checkup": 1})
+
+    @override_settings(WEBHOOK_ENDPOINTS={"sms": "http://127.0.0.1:9/hook"})
+    def test_stale_closures_are_sent_to_webhooks(self):
+        call_command("close_stale_visits", batch_size=2, clockout_time="20:00", stdout=StringIO())
+
+        events = WebhookEvent.objects.filter(event_type=WebhookEvent.TYPE_WALKIN_CLOCKED_OUT)
+        self.assertEqual(
+            sorted((e.payload["data"]["visit_id"], e.payload["data"]["clockout"]) for e in events),
+            [(visit.pk, "20:00:00") for visit in self.visits[:3]],
+        )
+
+    def test_clockout_of_several_selected_visits(self):
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        today_ids = [v.pk for v in self.visits[3:]]
+        self.client.post(url, {"action": "clockout", "visit_id": today_ids + [self.visits[0].pk, "x"]})
+
+        closed = CustomerDetails.objects.filter(cust_clockout__isnull=False)
+        # Every selected open visit of the business, old or not
+        self.assertEqual(set(closed.values_list("pk", flat=True)), set(today_ids) | {self.visits[0].pk})
+        self.assertTrue(all(v.updated_at >= self.before for v in closed))
+        self.assertEqual(self.depths()[""], 2)
+
+
+class WaitTimeEstimateTests(TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+
+    def depths(self):
+        return dict(
+            WaitTimeEstimate.objects.filter(business=self.business).values_list("purpose", "queue_depth")
+        )
+
+    def clockout(self, purpose, clockin, clockout):
+        today = timezone.localdate()
+        record_clockout(
+            self.business.pk, purpose, today, clockin, timezone.make_aware(datetime.combine(today, clockout))
+        )
+
+    @override_settings(WAIT_ESTIMATE_ALPHA=0.5)
+    def test_clockouts_update_moving_averages(self):
+        record_walkins(self.business.pk, ["Fever", "fever ", "Checkup"])
+        self.assertEqual(self.depths(), {"": 3, "fever": 2, "checkup": 1})
+
+        self.clockout("Fever", dtime(10, 0), dtime(10, 20))
+        self.clockout("Fever", dtime(10, 0), dtime(10, 40))
+        # Clocked out before clocking in: not a duration sample
+        self.clockout("Checkup", dtime(12, 0), dtime(11, 0))
+
+        rows = {row.purpose: row for row in WaitTimeEstimate.objects.filter(business=self.business)}
+        # 20 min, then 0.5 * 40 min + 0.5 * 20 min
+        self.assertEqual(rows["fever"].avg_duration_seconds, 1800)
+        self.assertEqual(rows["fever"].duration_samples, 2)
+        # The second fever patient was alone in its own queue, but not in
+        # the clinic's: only the overall row measured the queue's speed
+        self.assertEqual(rows["fever"].avg_gap_seconds, 0)
+        self.assertEqual(rows[""].avg_gap_seconds, 1200)
+        self.assertEqual(rows["checkup"].duration_samples, 0)
+        self.assertEqual(self.depths(), {"": 0, "fever": 0, "checkup": 0})
+
+        record_walkins(self.business.pk, ["Fever", "Cough", "Cough"])
+        self.assertEqual(estimated_wait(self.business.pk), {
+            # 3 waiting x 20 min between clock-outs
+            "queue_depth": 3,
+            "wait_minutes": 60,
+            "purposes": [
+                # No clock-outs seen for cough yet
+                {"purpose": "cough", "queue_depth": 2, "wait_minutes": None},
+                # No gaps measured: 1 waiting x 30 min average visit
+                {"purpose": "fever", "queue_depth": 1, "wait_minutes": 30},
+            ],
+        })
+
+    def test_batched_clockouts_match_one_by_one(self):
+        other = BusinessDetails.objects.create(owner=self.user, business_name="Annex", business_location="Hyderabad")
+        today = timezone.localdate()
+
+        def at(hour, minute):
+            return timezone.make_aware(datetime.combine(today, dtime(hour, minute)))
+
+        clockouts = [
+            ("Fever", today, dtime(10, 0), at(10, 20)),
+            ("Checkup", today, dtime(10, 5), at(10, 30)),
+            ("Fever", today, dtime(10, 10), at(10, 45)),
+        ]
+        for business in (self.business, other):
+            record_walkins(business.pk, ["Fever", "Checkup", "Fever", "Fever"])
+        for clockout in clockouts:
+            record_clockout(self.business.pk, *clockout)
+
+        # One locked read and one UPDATE (in a savepoint), in any order
+        with self.assertNumQueries(4):
+            record_clockouts(other.pk, list(reversed(clockouts)))
+
+        fields = ["purpose", "queue_depth", "avg_duration_seconds", "duration_samples", "avg_gap_seconds", "last_clockout_at"]
+        for purpose in ("", "fever", "checkup"):
+            self.assertEqual(
+                WaitTimeEstimate.objects.filter(business=other, purpose=purpose).values(*fields).get(),
+                WaitTimeEstimate.objects.filter(business=self.business, purpose=purpose).values(*fields).get(),
+            )
+
+    def test_dashboard_shows_wait_per_purpose(self):
+        record_walkins(self.business.pk, ["Fever", "Fever"])
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("patient_dashboard") + f"?business_id={self.business.pk}")
+        self.assertEqual(response.context["purpose_waits"], [{"purpose": "fever", "queue_depth": 2, "wait_minutes": None}])
+        self.assertContains(response, "Fever: 2")
+
+    def test_resync_counts_todays_open_visits(self):
+        today = timezone.localdate()
+        visits = [
+            ("Fever", today, None),
+            ("Fever", today, None),
+            ("Checkup", today, None),
+            ("Checkup", today, dtime(11, 0)),
+            ("Fever", today - timedelta(days=1), None),
+        ]
+        CustomerDetails.objects.bulk_create([
+            CustomerDetails(
+                user=self.user,
+                business=self.business,
+                cust_name=f"Patient {i}",
+                cust_contact_number=f"97{i:08d}",
+                cust_visit_purpose=purpose,
+                cust_walkin_date=day,
+                cust_clockin=dtime(10, i),
+                cust_clockout=clockout,
+            )
+            for i, (purpose, day, clockout) in enumerate(visits)
+        ])
+        record_walkins(self.business.pk, ["Fever", "Checkup", "Cough"])
+        WaitTimeEstimate.objects.filter(business=self.business).update(queue_depth=9)
+
+        resync_queue_depths([self.business.pk])
+        self.assertEqual(self.depths(), {"": 3, "fever": 2, "checkup": 1, "cough": 0})
+
+
+class ExportJobTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+        seed_walkins(cls.user, cls.business, 30)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def start_export(self):
+        return self.client.post(reverse("management_dashboard"), {
+            "form_type": "export_job",
+            "tab": "reports",
+            "business_id": self.business.pk,
+            "file_format": "csv",
+        }, follow=True)
+
+    def test_worker_writes_the_report(self):
+        self.start_export()
+        job = ExportJob.objects.get()
+        run_export_job(job.pk, start_next=False)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_written, job.total_rows), (ExportJob.STATUS_DONE, 33, 33))
+        lines = Path(settings.MEDIA_ROOT, job.file_name).read_text().splitlines()
+        self.assertEqual(len(lines), 1 + 33)
+
+        # Claimed once: running it again changes nothing
+        run_export_job(job.pk, start_next=False)
+        self.assertEqual(ExportJob.objects.get().status, ExportJob.STATUS_DONE)
+
+    @override_settings(EXPORT_JOBS_PER_OWNER=2, EXPORT_RUNNING_PER_OWNER=1)
+    def test_owner_limits(self):
+        self.start_export()
+        self.start_export()
+        response = self.start_export()
+        self.assertContains(response, "You already have exports running")
+        first, second = ExportJob.objects.order_by("pk")
+
+        # While the first runs, the second waits its turn
+        ExportJob.objects.filter(pk=first.pk).update(status=ExportJob.STATUS_RUNNING)
+        run_export_job(second.pk, start_next=False)
+        self.assertEqual(ExportJob.objects.get(pk=second.pk).status, ExportJob.STATUS_PENDING)
+
+        # ... and is handed to the pool when the first finishes
+        ExportJob.objects.filter(pk=first.pk).update(status=ExportJob.STATUS_PENDING)
+        with patch("walkinplus_app.exports._get_pool") as get_pool:
+            run_export_job(first.pk)
+        get_pool.return_value.submit.assert_called_once_with(run_export_job, second.pk, None)
+
+    def test_requeue_leaves_jobs_with_a_live_lease_alone(self):
+        self.start_export()
+        self.start_export()
+        live, abandoned = ExportJob.objects.order_by("pk")
+        now = timezone.now()
+        ExportJob.objects.filter(pk=live.pk).update(
+            status=ExportJob.STATUS_RUNNING, claim="a" * 32, lease_until=now + timedelta(minutes=5)
+        )
+        ExportJob.objects.filter(pk=abandoned.pk).update(
+            status=ExportJob.STATUS_RUNNING, claim="b" * 32, lease_until=now - timedelta(seconds=1)
+        )
+
+        with override_settings(EXPORT_RUNNING_PER_OWNER=2):
+            call_command("run_export_jobs", requeue_running=True, stdout=StringIO())
+
+        live.refresh_from_db()
+        abandoned.refresh_from_db()
+        self.assertEqual((live.status, live.claim), (ExportJob.STATUS_RUNNING, "a" * 32))
+        self.assertEqual(abandoned.status, ExportJob.STATUS_DONE)
+        # Queuing took the owner's own lock row, not their business rows
+        self.assertTrue(ExportOwnerLock.objects.filter(owner=self.user).exists())
+
+    def test_worker_stops_when_its_job_is_taken_over(self):
+        self.start_export()
+        job = ExportJob.objects.get()
+
+        def rows_then_requeued(*args):
+            # Lease ran out mid-export; another worker claimed the job
+            ExportJob.objects.filter(pk=job.pk).update(claim="c" * 32)
+            return iter_report_rows(*args)
+
+        with patch("walkinplus_app.exports.iter_report_rows", rows_then_requeued):
+            run_export_job(job.pk, start_next=False)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.claim, job.file_name), (ExportJob.STATUS_RUNNING, "c" * 32, ""))
+        # Neither a finished file nor a stray partial one
+        self.assertEqual(list(Path(settings.MEDIA_ROOT).rglob("*.*")), [])
+
+
+class ReplicaRoutingTests(TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+
+    def test_reads_use_replica_only_when_asked(self):
+        router = PrimaryReplicaRouter()
+        with patch("walkinplus_app.routers.replica_configured", return_value=True):
+            self.assertIsNone(router.db_for_read(CustomerDetails))
+            with reading_from_replica():
+                self.assertEqual(router.db_for_read(CustomerDetails), REPLICA_DB_ALIAS)
+                self.assertEqual(router.db_for_write(CustomerDetails), DEFAULT_DB_ALIAS)
+            self.assertIsNone(router.db_for_read(CustomerDetails))
+
+        # No replica configured: reads stay on the primary
+        with patch("walkinplus_app.routers.replica_configured", return_value=False), reading_from_replica():
+            self.assertIsNone(router.db_for_read(CustomerDetails))
+
+    def test_replica_reads_skips_writes_and_pinned_clients(self):
+        @replica_reads
+        def view(request):
+            return PrimaryReplicaRouter().db_for_read(CustomerDetails)
+
+        factory = RequestFactory()
+        pinned = factory.get("/")
+        pinned.COOKIES[PIN_PRIMARY_COOKIE] = "1"
+        with patch("walkinplus_app.routers.replica_configured", return_value=True):
+            self.assertEqual(view(factory.get("/")), REPLICA_DB_ALIAS)
+            self.assertEqual(view(factory.head("/")), REPLICA_DB_ALIAS)
+            self.assertIsNone(view(factory.post("/")))
+            self.assertIsNone(view(pinned))
+
+    def test_write_pins_client_to_primary(self):
+        self.client.force_login(self.user)
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        walkin = {"action": "new_walkin", "phone": "9123456789", "first_name": "Asha"}
+
+        with patch("walkinplus_app.middleware.replica_configured", return_value=True):
+            self.assertNotIn(PIN_PRIMARY_COOKIE, self.client.get(url).cookies)
+            response = self.client.post(url, walkin)
+        cookie = response.cookies[PIN_PRIMARY_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_PIN_SECONDS)
+        self.assertTrue(cookie["httponly"])
+
+        # Without a replica there is nothing to pin to
+        self.client.cookies.pop(PIN_PRIMARY_COOKIE)
+        with patch("walkinplus_app.middleware.replica_configured", return_value=False):
+            self.assertNotIn(PIN_PRIMARY_COOKIE, self.client.post(url, walkin).cookies)
+
+    @skipUnless(replica_configured(), "needs REPLICA_DATABASE_URL")
+    def test_management_dashboard_reads_from_replica(self):
+        self.client.force_login(self.user)
+        url = reverse("management_dashboard") + f"?business_id={self.business.pk}"
+
+        routed = []
+        db_for_read = PrimaryReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            routed.append(db_for_read(router, model, **hints))
+            return routed[-1]
+
+        with patch.object(PrimaryReplicaRouter, "db_for_read", record):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertIn(REPLICA_DB_ALIAS, routed)
+
+
+@skipUnless(settings.SHARD_DATABASES, "set SHARD_DATABASE_URLS (e.g. shard1=sqlite:///shard1.sqlite3) to run")
+class TenantShardTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shard = settings.SHARD_DATABASES[0]
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+        seed_walkins(cls.user, cls.business, 20, open_today=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+
+    def move(self):
+        call_command("move_tenant", self.user.username, self.shard, wait_seconds=0, stdout=StringIO())
+
+    def test_move_tenant_copies_and_routes(self):
+        self.move()
+
+        self.assertEqual(shard_for_owner(self.user.pk), (self.shard, TenantShard.STATUS_ACTIVE))
+        self.assertEqual(CustomerDetails.objects.using(self.shard).filter(business=self.business.pk).count(), 22)
+        self.assertFalse(CustomerDetails.objects.using(DEFAULT_DB_ALIAS).exists())
+
+        # Requests now read and write the owner's shard
+        self.assertEqual(len(self.client.get(self.url).context["visits"]), 2)
+        self.client.post(self.url, {"action": "new_walkin", "phone": "9123456789", "first_name": "Asha"})
+        self.assertTrue(CustomerDetails.objects.using(self.shard).filter(cust_name="Asha").exists())
+
+    def test_visits_closed_during_the_copy_are_recopied(self):
+        visit = CustomerDetails.objects.filter(business=self.business, cust_clockout__isnull=True).first()
+        copy_rows = MoveTenantCommand.copy_rows
+
+        def copy_then_clock_out(command, model, qs, target):
+            copied = copy_rows(command, model, qs, target)
+            # The visit tables are copied by now; the tenant is still live
+            if model is ExportJob:
+                CustomerDetails.objects.using(DEFAULT_DB_ALIAS).filter(pk=visit.pk).update(cust_clockout=dtime(12, 0))
+            return copied
+
+        with patch.object(MoveTenantCommand, "copy_rows", copy_then_clock_out):
+            self.move()
+        self.assertEqual(CustomerDetails.objects.using(self.shard).get(pk=visit.pk).cust_clockout, dtime(12, 0))
+
+    def test_rows_deleted_during_the_copy_are_removed(self):
+        visit = CustomerDetails.objects.filter(business=self.business, cust_clockout__isnull=False).first()
+        copy_rows = MoveTenantCommand.copy_rows
+
+        def copy_then_archive(command, model, qs, target):
+            copied = copy_rows(command, model, qs, target)
+            if model is ExportJob:
+                CustomerDetails.objects.using(DEFAULT_DB_ALIAS).filter(pk=visit.pk).delete()
+            return copied
+
+        with patch.object(MoveTenantCommand, "copy_rows", copy_then_archive):
+            self.move()
+        self.assertFalse(CustomerDetails.objects.using(self.shard).filter(pk=visit.pk).exists())
+        self.assertEqual(CustomerDetails.objects.using(self.shard).filter(business=self.business.pk).count(), 21)
+
+        # The delete triggers only live as long as the move
+        self.assertFalse(MoveTenantCommand().tombstone_triggers_installed(DEFAULT_DB_ALIAS))
+        self.assertFalse(MoveTombstone.objects.using(DEFAULT_DB_ALIAS).exists())
+
+    def test_move_onto_a_shard_with_another_tenant(self):
+        other = make_owner("other", "9000000002")
+        other.save(using=self.shard, force_insert=True)
+        set_shard(other.pk, self.shard)
+        with tenant_database(self.shard):
+            clinic = BusinessDetails.objects.create(owner=other, business_name="Other Clinic", business_location="Pune")
+            seed_walkins(other, clinic, 5, open_today=0)
+
+        # The shard hands out ids from its own block, clear of the primary's
+        self.assertGreater(clinic.pk, settings.SHARD_ID_BLOCK)
+
+        self.move()
+        self.assertEqual(CustomerDetails.objects.using(self.shard).filter(business=self.business.pk).count(), 22)
+        self.assertEqual(CustomerDetails.objects.using(self.shard).filter(business=clinic.pk).count(), 5)
+
+    def test_writes_refused_while_moving(self):
+        set_shard(self.user.pk, DEFAULT_DB_ALIAS, TenantShard.STATUS_MOVING)
+
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        response = self.client.post(self.url, {"action": "new_walkin", "phone": "9123456789", "first_name": "Asha"})
+        self.assertEqual(response.status_code, 503)
+
+
+class PurposeCatalogTests(TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_variants_share_one_catalog_row(self):
+        ids = purpose_ids(self.business.pk, ["Fever", " fever ", "FEVER", "Checkup", ""])
+        self.assertEqual(set(ids), {"fever", "checkup"})
+        self.assertEqual(VisitPurpose.objects.filter(business=self.business).count(), 2)
+        self.assertEqual(purpose_ids(self.business.pk, ["fever"]), {"fever": ids["fever"]})
+
+    def test_migration_folds_existing_text(self):
+        seed_walkins(self.user, self.business, 30, open_today=0)
+        fold = import_module("walkinplus_app.migrations.0010_fold_visit_purposes").fold_purposes
+        # The migration only needs the schema editor's connection
+        fold(django_apps, SimpleNamespace(connection=connections[DEFAULT_DB_ALIAS]))
+
+        self.assertFalse(CustomerDetails.objects.filter(purpose__isnull=True).exists())
+        self.assertEqual(
+            sorted(top_purposes(self.business.pk)), ["Checkup", "Fever", "Follow-up"]
+        )
+
+
+class KioskCheckinTests(QueryBudgetMixin, TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+        cls.token = new_kiosk_token(cls.business)
+
+    def setUp(self):
+        cache.clear()
+
+    def checkin(self, data, token=None):
+        return self.client.post(
+            "/kiosk/checkin/",
+            data,
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {token or self.token}",
+        )
+
+    def test_checkin_returns_visit_id(self):
+        # Cold token lookup, new catalog entry, queue token, INSERT, estimator rows, usage counter, change marker
+        with self.assertMaxQueries(16):
+            response = self.checkin({"phone": "9123456789", "first_name": "Asha", "purpose": "Fever"})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn("sessionid", response.cookies)
+        self.assertEqual(response.json()["token"], 1)
+        visit = CustomerDetails.objects.get(pk=response.json()["visit_id"])
+        self.assertEqual(visit.business, self.business)
+        self.assertEqual(visit.purpose.key, "fever")
+        self.assertEqual(estimated_wait(self.business.pk)["queue_depth"], 1)
+
+    def test_rejects_bad_token_and_payload(self):
+        self.assertEqual(self.checkin({"phone": "1", "first_name": "A"}, token="wrong").status_code, 401)
+        self.assertEqual(self.checkin({"phone": "9123456789"}).status_code, 400)
+        self.assertEqual(self.checkin("not json").status_code, 400)
+        self.assertEqual(self.client.get("/kiosk/checkin/").status_code, 405)
+
+    @override_settings(KIOSK_BATCH_WAIT_MS=1000)
+    def test_lone_checkin_does_not_wait(self):
+        with patch("walkinplus_app.kiosk.time") as kiosk_time:
+            response = self.checkin({"phone": "9123456789", "first_name": "Asha"})
+        self.assertEqual(response.status_code, 201)
+        kiosk_time.sleep.assert_not_called()
+
+    def test_bad_checkin_only_fails_itself(self):
+        now = timezone.localtime()
+
+        def queued(first_name):
+            fields = parse_walkin_fields({"phone": "9123456789", "first_name": first_name}, now.date(), now.time())
+            return _Checkin(DEFAULT_DB_ALIAS, self.business.pk, self.user.pk, fields)
+
+        asha, bad, ravi = queued("Asha"), queued("Bad"), queued("Ravi")
+        bad.fields["cust_contact_number"] = None  # NOT NULL: fails the batch INSERT
+        _save_checkins([asha, bad, ravi])
+
+        self.assertIsInstance(bad.error, IntegrityError)
+        self.assertEqual((asha.error, ravi.error), (None, None))
+        self.assertEqual((asha.token, ravi.token), (1, 2))
+        self.assertEqual(
+            dict(CustomerDetails.objects.values_list("pk", "cust_name")),
+            {asha.visit_id: "Asha", ravi.visit_id: "Ravi"},
+        )
+        self.assertEqual(estimated_wait(self.business.pk)["queue_depth"], 2)
+
+
+class KioskBurstTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_checkins_get_their_own_visit_ids(self):
+        user = make_owner()
+        business = BusinessDetails.objects.create(owner=user, business_name="Main Clinic", business_location="Pune")
+        token = new_kiosk_token(business)
+        visit_ids = []
+
+        def checkin(i):
+            response = Client().post(
+                "/kiosk/checkin/",
+                {"phone": f"90000000{i:02d}", "first_name": f"Walk {i}"},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=f"Bearer {token}",
+            )
+            visit_ids.append((f"Walk {i}", response.json()["visit_id"]))
+            connections.close_all()
+
+        with override_settings(KIOSK_BATCH_WAIT_MS=50):
+            threads = [threading.Thread(target=checkin, args=(i,)) for i in range(20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        names = dict(CustomerDetails.objects.values_list("pk", "cust_name"))
+        self.assertEqual(len(names), 20)
+        for name, visit_id in visit_ids:
+            self.assertEqual(names[visit_id], name)
+
+
+@contextmanager
+def stub_receiver(statuses=(), delay=0):
+    """
+    Local HTTP server standing in for a webhook receiver. Replies with the
+    given statuses in turn (then 200). Yields (url, received, stats):
+    received holds (payload, signature header, expected signature) per
+    request; stats.max_in_flight is the most requests handled at once.
+    """
+    statuses = list(statuses)
+    received = []
+    stats = SimpleNamespace(in_flight=0, max_in_flight=0)
+    lock = threading.Lock()
+
+    class Receiver(BaseHTTPRequestHandler):
+        def do_POST(self):
+            with lock:
+                stats.in_flight += 1
+                stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+                status = statuses.pop(0) if statuses else 200
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(delay)
+            with lock:
+                received.append((json.loads(body), self.headers["X-WalkinPlus-Signature"], sign(body)))
+                stats.in_flight -= 1
+            self.send_response(status)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/hook", received, stats
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class WebhookOutboxTests(TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+        seed_walkins(cls.user, cls.business, count=0, open_today=2)
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username="owner", password=PASSWORD)
+
+    def clockout(self):
+        visit_id = CustomerDetails.objects.filter(cust_clockout__isnull=True).values_list("pk", flat=True)[0]
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(url, {"action": "clockout", "visit_id": visit_id})
+        return visit_id, callbacks
+
+    def test_clockout_writes_event_in_same_transaction(self):
+        with override_settings(WEBHOOK_ENDPOINTS={}):
+            self.clockout()
+        self.assertFalse(WebhookEvent.objects.exists())
+
+        with override_settings(WEBHOOK_ENDPOINTS={"sms": "http://127.0.0.1:9/", "billing": "http://127.0.0.1:9/"}):
+            visit_id, callbacks = self.clockout()
+        events = WebhookEvent.objects.order_by("endpoint")
+        self.assertEqual([e.endpoint for e in events], ["billing", "sms"])
+        self.assertEqual({e.event_type for e in events}, {WebhookEvent.TYPE_WALKIN_CLOCKED_OUT})
+        self.assertEqual(events[0].payload, events[1].payload)
+        self.assertEqual(events[0].payload["data"]["visit_id"], visit_id)
+        self.assertIsNotNone(events[0].payload["data"]["clockout"])
+        # Delivery only starts after the commit
+        self.assertEqual(len(callbacks), 1)
+
+
+class WebhookDeliveryTests(TransactionTestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_owner()
+        self.business = BusinessDetails.objects.create(
+            owner=self.user, business_name="Main Clinic", business_location="Pune"
+        )
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        client = Client()
+        client.login(username="owner", password=PASSWORD)
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+
+        with stub_receiver(statuses=[500]) as (hook_url, received, _), \
+                override_settings(WEBHOOK_ENDPOINTS={"sms": hook_url}, WEBHOOK_RETRY_BASE_SECONDS=60):
+            with self.assertLogs("walkinplus_app.webhooks", "WARNING"):
+                client.post(url, {"action": "new_walkin", "phone": "9123456789", "first_name": "Asha"})
+                self.assertTrue(get_dispatcher().wait_idle(5))
+
+            event = WebhookEvent.objects.get()
+            self.assertEqual((event.status, event.attempts), (WebhookEvent.STATUS_PENDING, 1))
+            self.assertIn("500", event.last_error)
+            self.assertGreater(event.next_attempt_at, timezone.now() + timedelta(seconds=40))
+
+            # Backoff has passed
+            WebhookEvent.objects.update(next_attempt_at=timezone.now())
+            get_dispatcher().kick()
+            self.assertTrue(get_dispatcher().wait_idle(5))
+
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (WebhookEvent.STATUS_DELIVERED, 2))
+        self.assertEqual(len(received), 2)
+        (first, _, _), (second, signature, expected) = received
+        self.assertEqual(first, second)
+        self.assertEqual(signature, f"sha256={expected}")
+        self.assertEqual(second["events"][0]["type"], WebhookEvent.TYPE_WALKIN_CREATED)
+        self.assertEqual(second["events"][0]["data"]["phone"], "9123456789")
+
+    def test_concurrency_per_endpoint_is_limited(self):
+        visits = [
+            CustomerDetails(
+                user=self.user, business=self.business, cust_name=f"Walk {i}", cust_contact_number=f"90{i:08d}",
+                cust_walkin_date=timezone.localdate(), cust_clockin=dtime(9, i),
+            )
+            for i in range(6)
+        ]
+        with stub_receiver(delay=0.05) as (hook_url, received, stats), override_settings(
+            WEBHOOK_ENDPOINTS={"billing": hook_url}, WEBHOOK_BATCH_SIZE=1, WEBHOOK_CONCURRENCY_PER_ENDPOINT=2,
+        ):
+            with transaction.atomic():
+                enqueue_events(self.business.pk, WebhookEvent.TYPE_WALKIN_CREATED,
+                               CustomerDetails.objects.bulk_create(visits))
+            self.assertTrue(get_dispatcher().wait_idle(5))
+
+        self.assertEqual(len(received), 6)
+        self.assertEqual(stats.max_in_flight, 2)
+        self.assertFalse(WebhookEvent.objects.exclude(status=WebhookEvent.STATUS_DELIVERED).exists())
+
+
+class QueueTokenTests(TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_tokens_count_up_per_day_across_entry_points(self):
+        self.client.post(
+            reverse("patient_dashboard_sync"),
+            data={"business_id": self.business.pk, "events": [
+                {"type": "walkin", "key": f"w{i}", "data": {"phone": f"900000000{i}", "first_name": f"Walk {i}"}}
+                for i in range(3)
+            ] + [
+                {"type": "walkin", "key": "yesterday", "data": {
+                    "phone": "9000000009", "first_name": "Late",
+                    "walkin_date": str(timezone.localdate() - timedelta(days=1)),
+                }},
+            ]},
+            content_type="application/json",
+        )
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        self.client.post(url, {"action": "new_walkin", "phone": "9123456789", "first_name": "Asha"})
+
+        tokens = dict(CustomerDetails.objects.values_list("cust_name", "cust_token"))
+        self.assertEqual(tokens, {"Walk 0": 1, "Walk 1": 2, "Walk 2": 3, "Asha": 4, "Late": 1})
+        self.assertContains(self.client.get(url), "#4</span>")
+
+
+class QueueTokenConcurrencyTests(TransactionTestCase):
+    databases = PRIMARY_DATABASES
+
+    def test_parallel_walkins_get_distinct_gapless_tokens(self):
+        user = make_owner()
+        business = BusinessDetails.objects.create(owner=user, business_name="Main Clinic", business_location="Pune")
+        today = timezone.localdate()
+
+        def walkin(worker, i):
+            with transaction.atomic():
+                visit = CustomerDetails(
+                    user=user, business=business, cust_name=f"Walk {worker}-{i}",
+                    cust_contact_number="9000000000", cust_walkin_date=today, cust_clockin=dtime(9),
+                )
+                assign_tokens(business.pk, [visit])
+                visit.save()
+                if i == 2:
+                    # A failed walk-in gives its token back
+                    raise ValueError
+
+        def walkins(worker):
+            try:
+                for i in range(5):
+                    while True:
+                        try:
+                            walkin(worker, i)
+                        except ValueError:
+                            pass
+                        except OperationalError:
+                            # The in-memory SQLite test database reports a busy table
+                            # instead of waiting for it like PostgreSQL; try again
+                            time.sleep(0.001)
+                            continue
+                        break
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=walkins, args=(n,)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        tokens = sorted(CustomerDetails.objects.values_list("cust_token", flat=True))
+        self.assertEqual(tokens, list(range(1, 16 * 4 + 1)))
+
+
+class BusinessLogoTests(TestCase):
+    databases = PRIMARY_DATABASES
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, data, name="logo.png"):
+        return self.client.post(reverse("management_dashboard"), {
+            "form_type": "update_business",
+            "business_id": self.business.pk,
+            "business_name": "Main Clinic",
+            "location": "Hyderabad",
+            "logo_file": SimpleUploadedFile(name, data),
+        }, follow=True)
+
+    def test_thumbnails_are_served_immutable(self):
+        logo_dir = Path(settings.MEDIA_ROOT, "logos")
+        logo_dir.mkdir()
+        Path(logo_dir, "0123456789abcdef0123.webp").write_bytes(b"RIFF")
+
+        response = self.client.get(reverse("logo_file", args=["0123456789abcdef0123.webp"]))
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn("max-age=31536000", response["Cache-Control"])
+        self.assertEqual(self.client.get(reverse("logo_file", args=["originals"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("logo_file", args=["fedcba98765432100123.png"])).status_code, 404)
+
+    @skipUnless(uploads_enabled(), "needs Pillow")
+    def test_upload_writes_content_hashed_thumbnails(self):
+        from PIL import Image
+
+        out = BytesIO()
+        Image.new("RGB", (800, 400), "teal").save(out, "PNG")
+        self.upload(out.getvalue())
+
+        self.business.refresh_from_db()
+        variants = self.business.logo_variants
+        self.assertEqual((variants["width"], variants["height"]), (64, 32))
+        self.assertTrue(Path(settings.MEDIA_ROOT, self.business.logo_original).is_file())
+        for ext, files in variants["files"].items():
+            for name in files.values():
+                data = Path(settings.MEDIA_ROOT, "logos", name).read_bytes()
+                self.assertEqual(name, f"{hashlib.sha256(data).hexdigest()[:20]}.{ext}")
+
+        page = self.client.get(reverse("patient_dashboard"))
+        self.assertContains(page, reverse("logo_file", args=[variants["files"]["png"]["64"]]))
+        self.assertContains(page, "<picture>")
+
+        response = self.upload(b"not an image")
+        self.assertContains(response, "not an image we can read")
+
+    @skipUnless(not uploads_enabled(), "Pillow is installed")
+    def test_upload_without_pillow_is_refused(self):
+        response = self.upload(b"\x89PNG")
+        self.assertContains(response, "Logo uploads are not available")
+        self.business.refresh_from_db()
+        self.assertEqual(self.business.logo_variants, {})
+
+
+class UsageMeteringTests(TestCase):
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_owner()
+        cls.business = BusinessDetails.objects.create(
+            owner=cls.user, business_name="Main Clinic", business_location="Hyderabad"
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def counters(self):
+        return {
+            (c.month, c.walkins, c.exports)
+            for c in UsageCounter.objects.filter(business=self.business)
+        }
+
+    def test_walkins_and_exports_are_metered_per_month(self):
+        this_month = timezone.localdate().replace(day=1)
+        last_month = (this_month - timedelta(days=1)).replace(day=1)
+        self.client.post(
+            reverse("patient_dashboard_sync"),
+            data={"business_id": self.business.pk, "events": [
+                {"type": "walkin", "key": "w1", "data": {"phone": "9000000001", "first_name": "Now"}},
+                {"type": "walkin", "key": "w2", "data": {
+                    "phone": "9000000002", "first_name": "Late", "walkin_date": str(last_month),
+                }},
+            ]},
+            content_type="application/json",
+        )
+        url = reverse("patient_dashboard") + f"?business_id={self.business.pk}"
+        self.client.post(url, {"action": "new_walkin", "phone": "9123456789", "first_name": "Asha"})
+        self.client.get(reverse("management_dashboard") + f"?business_id={self.business.pk}&export=csv")
+
+        self.assertEqual(self.counters(), {(this_month, 2, 1), (last_month, 1, 0)})
+
+        page = self.client.get(reverse("management_dashboard") + "?tab=pricing")
+        self.assertContains(page, "2 walk-ins •")
+        self.assertContains(page, "1 active business •")
+
+        response = self.client.get(
+            reverse("management_dashboard") + f"?export=usage&month={last_month:%Y-%m}"
+        )
+        self.assertEqual(
+            response.content.decode().splitlines()[1],
+            f"{last_month:%Y-%m},{self.business.pk},Main Clinic,1,0",
+        )
+        self.assertEqual(
+            self.client.get(reverse("management_dashboard") + "?export=usage&month=2026-13").status_code, 400
+        )
+
+    def test_reconcile_rebuilds_walkin_counters(self):
+        seed_walkins(self.user, self.business, 40, days=90, open_today=0)
+        UsageCounter.objects.create(business=self.business, month=date(2000, 1, 1), walkins=5, exports=2)
+        expected = Counter(
+            d.replace(day=1) for d in CustomerDetails.objects.values_list("cust_walkin_date", flat=True)
+        )
+
+        out = StringIO()
+        call_command("reconcile_usage", dry_run=True, stdout=out)
+        self.assertIn(f"{len(expected) + 1} usage counters are off.", out.getvalue())
+        self.assertEqual(UsageCounter.objects.filter(walkins__gt=0).count(), 1)
+
+        call_command("reconcile_usage", batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            {(c.month, c.walkins) for c in UsageCounter.objects.filter(walkins__gt=0)},
+            set(expected.items()),
+        )
+        # Exports can't be recounted and are kept
+        self.assertEqual(UsageCounter.objects.get(month=date(2000, 1, 1)).exports, 2)
+
+        out = StringIO()
+        call_command("reconcile_usage", dry_run=True, stdout=out)
+        self.assertIn("0 usage counters are off.", out.getvalue())
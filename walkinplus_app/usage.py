@@ -0,0 +1,117 @@
+"""
+Usage metering for billing: walk-ins and exports per business and month.
+
+Each metered action bumps one UsageCounter row with a single upsert, in
+the transaction of the action itself, so the pricing tab and billing
+exports read one row per business instead of counting visits. Walk-ins
+count towards the month of their walk-in date; exports towards the
+month they were downloaded or started.
+
+The counter row stays locked until the surrounding transaction ends:
+call count_walkins() late in the transaction, as with assign_tokens().
+The reconcile_usage command recounts walk-ins from the visit tables if
+the counters ever drift (e.g. visits deleted in the admin).
+"""
+from collections import Counter
+
+from django.db import connections
+from django.db.models import Count, DateField
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .models import ArchivedCustomerDetails, BusinessDetails, CustomerDetails, UsageCounter
+from .routers import tenant_db
+
+
+def month_of(day):
+    return day.replace(day=1)
+
+
+def _bump_sql(connection):
+    table = connection.ops.quote_name(UsageCounter._meta.db_table)
+    # The same statement works on PostgreSQL and SQLite (3.24+)
+    return (
+        f"INSERT INTO {table} (business_id, month, walkins, exports) VALUES (%s, %s, %s, %s) "
+        f"ON CONFLICT (business_id, month) "
+        f"DO UPDATE SET walkins = {table}.walkins + EXCLUDED.walkins, "
+        f"exports = {table}.exports + EXCLUDED.exports"
+    )
+
+
+def bump_usage(business_id, month, walkins=0, exports=0):
+    """
+    Add to one business's counters for the month (a first-of-month date).
+    """
+    connection = connections[tenant_db()]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _bump_sql(connection),
+            [business_id, connection.ops.adapt_datefield_value(month), walkins, exports],
+        )
+
+
+def count_walkins(business_id, visits):
+    """
+    Meter new CustomerDetails of one business; one upsert per walk-in
+    month among them. Call in the transaction that inserts them.
+    """
+    by_month = Counter(month_of(visit.cust_walkin_date) for visit in visits)
+    for month, walkins in by_month.items():
+        bump_usage(business_id, month, walkins=walkins)
+
+
+def count_export(business_id):
+    """
+    Meter one export of the business's walk-ins.
+    """
+    bump_usage(business_id, month_of(timezone.localdate()), exports=1)
+    # Let the dashboard (ETag) show the new figure
+    BusinessDetails.mark_changed(pk=business_id)
+
+
+def monthly_usage(businesses, month):
+    """
+    Usage of the given businesses in one month: totals plus one row per
+    business, in the order given. A business counts as active when it
+    had at least one walk-in that month.
+    """
+    counters = {
+        c.business_id: c
+        for c in UsageCounter.objects.filter(business_id__in=[b.pk for b in businesses], month=month)
+    }
+    rows = []
+    for business in businesses:
+        counter = counters.get(business.pk)
+        rows.append({
+            "business_id": business.pk,
+            "name": business.business_name,
+            "walkins": counter.walkins if counter else 0,
+            "exports": counter.exports if counter else 0,
+        })
+    return {
+        "month": month,
+        "rows": rows,
+        "walkins": sum(row["walkins"] for row in rows),
+        "exports": sum(row["exports"] for row in rows),
+        "active_businesses": sum(1 for row in rows if row["walkins"]),
+    }
+
+
+def walkin_counts(business_ids):
+    """
+    {(business_id, month): visits} for the given businesses, counted
+    from the live and the archive table (grouped on the business/date
+    indexes).
+    """
+    counts = Counter()
+    for model in (CustomerDetails, ArchivedCustomerDetails):
+        grouped = (
+            model.objects.filter(business_id__in=business_ids)
+            .annotate(month=Trunc("cust_walkin_date", "month", output_field=DateField()))
+            .values_list("business_id", "month")
+            .annotate(n=Count("pk"))
+            .order_by()
+        )
+        for business_id, month, n in grouped:
+            counts[business_id, month] += n
+    return counts
@@ -5,13 +5,141 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.dateparse import parse_date, parse_time
-from django.db.models import Q
-from datetime import timedelta
-from django.http import HttpResponse
-from django.urls import reverse
+from django.utils.dateparse import parse_date
+from datetime import datetime, timedelta
+from django.http import HttpResponse, HttpResponseBadRequest, FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.template import loader
 import csv
-from .models import UserDetails, BusinessDetails, CustomerDetails
+import hashlib
+import json
+from pathlib import Path
+from urllib.parse import urlencode
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Sum
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+from .models import UserDetails, BusinessDetails, CustomerDetails, ArchivedCustomerDetails, ExportJob, WebhookEvent
+from .exports import enqueue_export
+from .kiosk import new_kiosk_token
+from .logos import (
+    CONTENT_TYPES as LOGO_CONTENT_TYPES,
+    LOGO_DIR,
+    THUMBNAIL_NAME,
+    LogoError,
+    clear_logo,
+    logo_picture,
+    save_logo,
+    uploads_enabled,
+)
+from .purposes import purpose_id, top_purposes
+from .queue_tokens import assign_tokens
+from .routers import replica_reads, tenant_db
+from .sync import SyncError, apply_sync_batch
+from .usage import count_export, count_walkins, month_of, monthly_usage
+from .waittime import estimated_wait, record_clockouts, record_walkin
+from .webhooks import enqueue_events
+from .reports import (
+    CSV_HEADER,
+    DELTA_CSV_HEADER,
+    business_overview_rows,
+    csv_row,
+    delta_csv_row,
+    format_watermark,
+    iter_delta_rows,
+    iter_report_rows,
+    parse_watermark,
+    parse_report_filters,
+    report_filter_params,
+    report_querysets,
+    walkin_series,
+)
+
+# Columns of the billing usage CSV (pricing tab)
+USAGE_CSV_HEADER = ["Month", "Business ID", "Business", "Walk-ins", "Exports"]
+
+# Businesses per page on the "all businesses" overview
+OVERVIEW_PAGE_SIZE = 25
+
+# Table rows rendered (and sent) per chunk of the printable full report
+REPORT_CHUNK_ROWS = 500
+
+
+def _dashboard_change_marker(request):
+    """
+    Cheap summary of everything the dashboards render for this owner:
+    (number of businesses, sum of their data versions, latest change).
+    One aggregate over the owner's businesses; cached on the request so
+    the ETag and Last-Modified functions share it.
+    """
+    if not hasattr(request, "_dashboard_marker"):
+        request._dashboard_marker = BusinessDetails.objects.filter(
+            owner=request.user
+        ).aggregate(
+            count=Count("pk"),
+            versions=Sum("data_version"),
+            changed_at=Max("data_changed_at"),
+        )
+    return request._dashboard_marker
+
+
+def _dashboard_is_cacheable(request):
+    # Only plain page loads; flash messages must always be rendered
+    return (
+        request.method in ("GET", "HEAD")
+        and request.user.is_authenticated
+        and not request.COOKIES.get("messages")
+        and "_messages" not in request.session
+    )
+
+
+def dashboard_etag(request, *args, **kwargs):
+    if not _dashboard_is_cacheable(request):
+        return None
+
+    marker = _dashboard_change_marker(request)
+    user = request.user
+    parts = [
+        user.pk,
+        user.username,
+        user.first_name,
+        user.email,
+        marker["count"],
+        marker["versions"] or 0,
+        marker["changed_at"].isoformat() if marker["changed_at"] else "",
+        # Stats are relative to today; forms embed the CSRF token
+        timezone.localdate().isoformat(),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+        request.get_full_path(),
+    ]
+    return hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+
+
+def dashboard_last_modified(request, *args, **kwargs):
+    if not _dashboard_is_cacheable(request):
+        return None
+
+    changed_at = _dashboard_change_marker(request)["changed_at"]
+    if changed_at is None:
+        return None
+
+    # "Today" figures roll over at midnight; a new login rotates the CSRF token
+    start_of_today = timezone.make_aware(
+        datetime.combine(timezone.localdate(), datetime.min.time())
+    )
+    candidates = [changed_at, start_of_today]
+    if request.user.last_login:
+        candidates.append(request.user.last_login)
+    return max(candidates)
+
+
+# Browsers must revalidate every time; unchanged pages answer 304
+dashboard_conditional = condition(
+    etag_func=dashboard_etag,
+    last_modified_func=dashboard_last_modified,
+)
 
 
 def mainpage(request):
@@ -174,6 +302,7 @@ def login_page(request):
 
 
 @login_required
+@replica_reads
 def home(request):
     # If somehow user hits /home/ without logging in
     if not request.user.is_authenticated:
@@ -201,6 +330,8 @@ def home(request):
     return render(request, "home.html", context)
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@dashboard_conditional
 def patient_dashboard(request):
     user = request.user
 
@@ -236,23 +367,46 @@ def patient_dashboard(request):
     base_url = reverse("patient_dashboard") + f"?business_id={selected_business.business_id}"
 
     # ─────────────────────────────
-    # CLOCK-OUT HANDLER
+    # CLOCK-OUT HANDLER (one visit or many selected visits)
     # ─────────────────────────────
     if request.method == "POST" and request.POST.get("action") == "clockout":
-        visit_id = request.POST.get("visit_id")
-
-        try:
-            visit = CustomerDetails.objects.get(
-                pk=visit_id,
-                user=user,
-                business=selected_business,   # ensure it belongs to this business
-                cust_clockout__isnull=True,  # only open visits
-            )
-            visit.cust_clockout = timezone.localtime().time()
-            visit.save()
+        visit_ids = [v for v in request.POST.getlist("visit_id") if v.isdigit()]
+
+        # One conditional UPDATE: only open visits of this user + business
+        closed = 0
+        if visit_ids:
+            clockout_at = timezone.localtime()
+            with transaction.atomic(using=tenant_db()):
+                open_qs = CustomerDetails.objects.filter(
+                    pk__in=visit_ids,
+                    user=user,
+                    business=selected_business,   # ensure it belongs to this business
+                    cust_clockout__isnull=True,  # only open visits
+                )
+                # The visits being closed (for the wait estimator and webhooks)
+                closing = list(open_qs.select_for_update().values(
+                    "pk", "cust_name", "cust_contact_number",
+                    "cust_visit_purpose", "cust_walkin_date", "cust_clockin",
+                ))
+                closed = open_qs.update(cust_clockout=clockout_at.time(), updated_at=clockout_at)
+
+                record_clockouts(selected_business.pk, [
+                    (visit["cust_visit_purpose"], visit["cust_walkin_date"], visit["cust_clockin"], clockout_at)
+                    for visit in closing
+                ])
+                enqueue_events(
+                    selected_business.pk,
+                    WebhookEvent.TYPE_WALKIN_CLOCKED_OUT,
+                    [{**visit, "cust_clockout": clockout_at.time()} for visit in closing],
+                )
+            if closed:
+                BusinessDetails.mark_changed(pk=selected_business.pk)
 
+        if closed == 1:
             messages.success(request, "Clock-out recorded.")
-        except CustomerDetails.DoesNotExist:
+        elif closed:
+            messages.success(request, f"Clock-out recorded for {closed} visits.")
+        else:
             messages.error(request, "Visit not found or already clocked out.")
 
         return redirect(base_url)
@@ -277,23 +431,31 @@ def patient_dashboard(request):
         today = timezone.localdate()
         now_time = timezone.localtime().time()
 
-        # IMPORTANT: store with this specific business
-        CustomerDetails.objects.create(
-            user=user,
-            business=selected_business,
-            cust_name=f"{first_name} {last_name}".strip(),
-            cust_dob=dob_raw,
-            cust_contact_number=phone,
-            cust_companion=care_of,
-            cust_companion_relation=relation,
-            cust_visit_purpose=purpose,
-            cust_notes=notes,
-            cust_walkin_date=today,
-            cust_clockin=now_time,
-            # cust_clockout NULL until clock out
-        )
-
-        messages.success(request, "Walk-in registered successfully.")
+        with transaction.atomic(using=tenant_db()):
+            # IMPORTANT: store with this specific business
+            visit = CustomerDetails(
+                user=user,
+                business=selected_business,
+                cust_name=f"{first_name} {last_name}".strip(),
+                cust_dob=dob_raw,
+                cust_contact_number=phone,
+                cust_companion=care_of,
+                cust_companion_relation=relation,
+                cust_visit_purpose=purpose,
+                purpose_id=purpose_id(selected_business.pk, purpose),
+                cust_notes=notes,
+                cust_walkin_date=today,
+                cust_clockin=now_time,
+                # cust_clockout NULL until clock out
+            )
+            assign_tokens(selected_business.pk, [visit])
+            visit.save(force_insert=True)
+            record_walkin(selected_business.pk, purpose)
+            enqueue_events(selected_business.pk, WebhookEvent.TYPE_WALKIN_CREATED, [visit])
+            count_walkins(selected_business.pk, [visit])
+        BusinessDetails.mark_changed(pk=selected_business.pk)
+
+        messages.success(request, f"Walk-in registered successfully. Token #{visit.cust_token}.")
         return redirect(base_url)
 
     # ─────────────────────────────
@@ -310,14 +472,95 @@ def patient_dashboard(request):
 
     today_date = today.strftime("%d %b %Y")
 
+    # Running estimate (one small row), not a scan of past visits
+    wait = estimated_wait(selected_business.pk)
+
     context = {
         "visits": visits,
         "today_date": today_date,
         "selected_business_name": selected_business.business_name,
+        "selected_business_logo": logo_picture(selected_business.logo_variants),
+        "queue_depth": wait["queue_depth"],
+        "estimated_wait_minutes": wait["wait_minutes"],
+        "purpose_waits": wait["purposes"],
+        # Most common purposes for one-click entry (cached per business)
+        "purpose_suggestions": top_purposes(selected_business.pk),
     }
     return render(request, "patient_dashboard.html", context)
 
 @login_required
+@require_POST
+def patient_dashboard_sync(request):
+    """
+    Batch sync for reception desks (JSON POST, session + CSRF as usual):
+
+        {"business_id": 1, "events": [
+            {"type": "walkin", "key": "<uuid>", "data": {"phone": ..., "first_name": ...}},
+            {"type": "clockout", "key": "<uuid>", "walkin_key": "<uuid>"},
+            {"type": "clockout", "key": "<uuid>", "visit_id": 42, "clockout": "11:05"}
+        ]}
+
+    Applies everything in one transaction and returns the result per key
+    plus the current queue, so an offline queue is flushed in one round trip.
+    """
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "Expected a JSON object."}, status=400)
+
+    business_id = str(payload.get("business_id", ""))
+    business = None
+    if business_id.isdigit():
+        business = BusinessDetails.objects.filter(
+            pk=business_id, owner=request.user, is_active=True
+        ).first()
+    if business is None:
+        return JsonResponse({"error": "Unknown or inactive business."}, status=404)
+
+    events = payload.get("events")
+    if isinstance(events, list) and len(events) > settings.SYNC_MAX_EVENTS:
+        return JsonResponse({"error": f"At most {settings.SYNC_MAX_EVENTS} events per batch."}, status=400)
+
+    try:
+        result = apply_sync_batch(request.user, business, events)
+    except SyncError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    except IntegrityError:
+        # Same keys pushed concurrently from another tab; resending is safe
+        return JsonResponse({"error": "Conflicting sync in progress, please retry."}, status=409)
+
+    # New server state: today's open queue for this business
+    queue = CustomerDetails.objects.filter(
+        user=request.user,
+        business=business,
+        cust_walkin_date=timezone.localdate(),
+        cust_clockout__isnull=True,
+    ).order_by("cust_clockin").values("cust_id", "cust_name", "cust_visit_purpose", "cust_clockin")
+    wait = estimated_wait(business.pk)
+
+    result.update({
+        "queue": [
+            {
+                "visit_id": v["cust_id"],
+                "name": v["cust_name"],
+                "purpose": v["cust_visit_purpose"],
+                "clockin": v["cust_clockin"].strftime("%H:%M:%S"),
+            }
+            for v in queue
+        ],
+        "queue_depth": wait["queue_depth"],
+        "estimated_wait_minutes": wait["wait_minutes"],
+        "purpose_waits": wait["purposes"],
+    })
+    return JsonResponse(result)
+
+
+@login_required
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@dashboard_conditional
 def management_dashboard(request):
     user = request.user
 
@@ -342,13 +585,18 @@ def management_dashboard(request):
             logo = request.POST.get("business_logo", "").strip()
 
             if business_name and location:
-                BusinessDetails.objects.create(
+                business = BusinessDetails.objects.create(
                     owner=user,
                     business_name=business_name,
                     business_location=location,
                     business_logo=logo,
                     is_active=True,  # new businesses active by default
                 )
+                if request.FILES.get("logo_file"):
+                    try:
+                        save_logo(business, request.FILES["logo_file"])
+                    except LogoError as exc:
+                        messages.error(request, f"Business saved, but the logo was not: {exc}")
             return redirect(redirect_url)
 
         # 2) UPDATE PROFILE (username, name, email, phone, password)
@@ -383,6 +631,9 @@ def management_dashboard(request):
                 user.save()
                 # They will need to log in again after password change.
 
+            # Profile is shown on every dashboard page
+            BusinessDetails.mark_changed(owner=user)
+
             return redirect(redirect_url)
 
         # 3) UPDATE BUSINESS (name, location, logo, active/inactive)
@@ -402,9 +653,51 @@ def management_dashboard(request):
             business.business_logo = logo
             business.is_active = (status == "active")
             business.save()
+            if request.FILES.get("logo_file"):
+                try:
+                    save_logo(business, request.FILES["logo_file"])
+                except LogoError as exc:
+                    messages.error(request, str(exc))
+            elif request.POST.get("remove_logo"):
+                clear_logo(business)
+            BusinessDetails.mark_changed(pk=business.pk)
 
             return redirect(redirect_url)
 
+        # 4) KIOSK TOKEN (self check-in tablet); the token is shown only once
+        elif form_type == "kiosk_token":
+            business = get_object_or_404(BusinessDetails, pk=business_id_param, owner=user)
+            token = new_kiosk_token(business)
+            BusinessDetails.mark_changed(pk=business.pk)
+            messages.success(
+                request,
+                f"New kiosk token for {business.business_name}: {token} "
+                "(copy it now, it will not be shown again). "
+                f"Kiosks send check-ins to {request.build_absolute_uri('/kiosk/checkin/')}",
+            )
+            return redirect(redirect_url)
+
+        # 5) BACKGROUND EXPORT (large date ranges; rendered by the export worker pool)
+        elif form_type == "export_job":
+            business = get_object_or_404(BusinessDetails, pk=business_id_param, owner=user)
+            file_format = request.POST.get("file_format", ExportJob.FORMAT_CSV)
+            if file_format not in dict(ExportJob.FORMAT_CHOICES):
+                file_format = ExportJob.FORMAT_CSV
+
+            filters = report_filter_params(parse_report_filters(request.POST))
+
+            if enqueue_export(user, business, filters, file_format) is None:
+                messages.error(request, "You already have exports running. Please wait for them to finish.")
+            else:
+                count_export(business.pk)
+                messages.success(request, "Export started. The download link will appear below when it is ready.")
+
+            # Keep the report filters on the way back
+            kept_filters = {key: value for key, value in filters.items() if value}
+            if kept_filters:
+                redirect_url += "&" + urlencode(kept_filters)
+            return redirect(redirect_url)
+
     # ---------- BUILD CONTEXT FOR GET / PAGE RENDER ----------
 
     # User details
@@ -447,10 +740,15 @@ def management_dashboard(request):
             "name": b.business_name,
             "location": b.business_location,
             "logo": b.business_logo,
+            "logo_image": logo_picture(b.logo_variants),
             "customer_dashboard_enabled": b.is_active,
             "is_selected": bool(selected_business and b.pk == selected_business.pk),
         })
 
+    # ---------- USAGE CSV (billing: every business, one month) ----------
+    if request.GET.get("export") == "usage":
+        return csv_usage_export(business_objs, request.GET.get("month", "").strip())
+
     # ---------- BASE QUERYSET: ONLY THIS USER + SELECTED BUSINESS ----------
     if selected_business:
         customers_qs = CustomerDetails.objects.filter(
@@ -461,6 +759,33 @@ def management_dashboard(request):
         # No business yet → no data → all stats 0
         customers_qs = CustomerDetails.objects.none()
 
+    # ---------- DELTA EXPORT (rows changed since the client's watermark) ----------
+    if request.GET.get("export") == "delta" and selected_business:
+        count_export(selected_business.pk)
+        return csv_delta_export(user, selected_business, request.GET.get("since", "").strip())
+
+    # ---------- FILTERS FOR REPORTS (ALSO PER SELECTED BUSINESS) ----------
+
+    report_filters = parse_report_filters(request.GET)
+
+    # Old visits live in the archive table; archived_qs is only set when
+    # the selected date range actually reaches back that far.
+    if selected_business:
+        filtered_qs, archived_qs = report_querysets(user, selected_business, report_filters)
+    else:
+        filtered_qs, archived_qs = customers_qs, None
+
+    # ---------- EXPORT CSV (uses filtered queryset and selected business) ----------
+    if request.GET.get("export") == "csv":
+        if selected_business:
+            count_export(selected_business.pk)
+        return csv_export_walkins(filtered_qs, archived_qs)
+
+    # ---------- PRINTABLE FULL REPORT (every matching row, streamed) ----------
+    if request.GET.get("export") == "html" and selected_business:
+        count_export(selected_business.pk)
+        return html_report_walkins(selected_business, report_filters, filtered_qs, archived_qs)
+
     # ---------- OVERVIEW STATS (PER SELECTED BUSINESS) ----------
 
     today = timezone.localdate()
@@ -483,7 +808,9 @@ def management_dashboard(request):
             cust_clockout__isnull=True,
         ).count()
 
-        total_walkins = customers_qs.count()
+        total_walkins = customers_qs.count() + ArchivedCustomerDetails.objects.filter(
+            user=user, business=selected_business
+        ).count()
 
         last_30_start = today - timedelta(days=29)
         last_30_total = customers_qs.filter(
@@ -499,68 +826,25 @@ def management_dashboard(request):
         total_walkins = 0
         avg_per_day = 0
 
-    # ---------- FILTERS FOR REPORTS (ALSO PER SELECTED BUSINESS) ----------
-
-    from_date_str = request.GET.get("from_date", "").strip()
-    to_date_str = request.GET.get("to_date", "").strip()
-    time_from_str = request.GET.get("time_from", "").strip()
-    time_to_str = request.GET.get("time_to", "").strip()
-    search_query = request.GET.get("search", "").strip()
-
-    from_date = parse_date(from_date_str) if from_date_str else None
-    to_date = parse_date(to_date_str) if to_date_str else None
-    time_from = parse_time(time_from_str) if time_from_str else None
-    time_to = parse_time(time_to_str) if time_to_str else None
-
-    # normalize dates – if only one provided, use it for both
-    if from_date and not to_date:
-        to_date = from_date
-    if to_date and not from_date:
-        from_date = to_date
-
-    filtered_qs = customers_qs
-
-    if from_date and to_date:
-        filtered_qs = filtered_qs.filter(
-            cust_walkin_date__gte=from_date,
-            cust_walkin_date__lte=to_date,
-        )
-
-        # Apply per-day time window if both time_from and time_to present
-        if time_from and time_to:
-            mid_days = Q(
-                cust_walkin_date__gt=from_date,
-                cust_walkin_date__lt=to_date
-            )
-            start_day = Q(
-                cust_walkin_date=from_date,
-                cust_clockin__gte=time_from
-            )
-            end_day = Q(
-                cust_walkin_date=to_date,
-                cust_clockin__lte=time_to
-            )
-            filtered_qs = filtered_qs.filter(mid_days | start_day | end_day)
-        elif time_from and from_date == to_date:
-            filtered_qs = filtered_qs.filter(cust_clockin__gte=time_from)
-        elif time_to and from_date == to_date:
-            filtered_qs = filtered_qs.filter(cust_clockin__lte=time_to)
-
-    # Search in name / number / purpose
-    if search_query:
-        filtered_qs = filtered_qs.filter(
-            Q(cust_name__icontains=search_query)
-            | Q(cust_contact_number__icontains=search_query)
-            | Q(cust_visit_purpose__icontains=search_query)
-        )
-
-    # ---------- EXPORT CSV (uses filtered queryset and selected business) ----------
-    if request.GET.get("export") == "csv":
-        return csv_export_walkins(filtered_qs)
-
     # Records for reports table (latest first; show max 200)
     total_records = filtered_qs.count()
-    records = filtered_qs.order_by("-cust_walkin_date", "-cust_clockin")[:200]
+    records = list(filtered_qs.order_by("-cust_walkin_date", "-cust_clockin")[:200])
+
+    if archived_qs is not None:
+        total_records += archived_qs.count()
+        # Archived visits are always older than live ones, so they only fill the tail
+        if len(records) < 200:
+            records += list(
+                archived_qs.order_by("-cust_walkin_date", "-cust_clockin")[:200 - len(records)]
+            )
+
+    # Recent background exports for this business (progress + download links)
+    if selected_business:
+        export_jobs = ExportJob.objects.filter(
+            owner=user, business=selected_business
+        ).order_by("-created_at")[:5]
+    else:
+        export_jobs = []
 
     context = {
         # which tab to highlight
@@ -570,6 +854,7 @@ def management_dashboard(request):
         "businesses": businesses,
         "selected_business_id": selected_business.pk if selected_business else "",
         "selected_business_name": selected_business.business_name if selected_business else "",
+        "logo_uploads_enabled": uploads_enabled(),
 
         # overview stats (per selected business)
         "today_walkins": today_walkins,
@@ -582,11 +867,12 @@ def management_dashboard(request):
         # reports
         "records": records,
         "total_records": total_records,
-        "from_date": from_date_str,
-        "to_date": to_date_str,
-        "time_from": time_from_str,
-        "time_to": time_to_str,
-        "search": search_query,
+        "from_date": report_filters["from_date_str"],
+        "to_date": report_filters["to_date_str"],
+        "time_from": report_filters["time_from_str"],
+        "time_to": report_filters["time_to_str"],
+        "search": report_filters["search"],
+        "export_jobs": export_jobs,
 
         # profile
         "username": user.username,
@@ -598,6 +884,7 @@ def management_dashboard(request):
         # pricing
         "current_plan_name": "Starter Pack – Monthly",
         "current_plan_price": 49,
+        "usage": monthly_usage(business_objs, month_of(today)),
     }
 
     return render(request, "management_dashboard.html", context)
@@ -605,10 +892,91 @@ def management_dashboard(request):
 
 
 
-def csv_export_walkins(qs):
+@login_required
+@replica_reads
+def businesses_overview(request):
+    """
+    All businesses of the owner side by side (today, week, month, pending,
+    30-day average), paginated and cached for a short time.
+    """
+    user = request.user
+    today = timezone.localdate()
+
+    # Resolve ?page= first (one COUNT), so "01", "abc" or a page past the
+    # end share the cache entry of the page actually shown
+    business_objs = BusinessDetails.objects.filter(owner=user).order_by("created_at")
+    page = Paginator(business_objs, OVERVIEW_PAGE_SIZE).get_page(request.GET.get("page", "1"))
+
+    cache_key = f"businesses_overview:{user.pk}:{today.isoformat()}:{page.number}"
+    context = cache.get(cache_key)
+
+    if context is None:
+        businesses = list(page.object_list)
+
+        context = {
+            "rows": business_overview_rows(user, businesses, today) if businesses else [],
+            "today_date": today.strftime("%d %b %Y"),
+            "page_number": page.number,
+            "num_pages": page.paginator.num_pages,
+            "total_businesses": page.paginator.count,
+            "previous_page": page.previous_page_number() if page.has_previous() else None,
+            "next_page": page.next_page_number() if page.has_next() else None,
+        }
+        cache.set(cache_key, context, settings.OVERVIEW_CACHE_SECONDS)
+
+    return render(request, "businesses_overview.html", context)
+
+
+@login_required
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@dashboard_conditional
+def walkin_trends(request):
+    """
+    Chart data for the selected business (JSON): walk-ins per day, week,
+    month or year – whichever keeps the series under SERIES_MAX_POINTS –
+    using the Reports tab filters (from_date, to_date, time_from,
+    time_to, search). Cached until the business's data changes.
+    """
+    user = request.user
+    business_id = request.GET.get("business_id", "")
+
+    businesses = BusinessDetails.objects.filter(owner=user)
+    if business_id.isdigit():
+        business = businesses.filter(pk=business_id).first()
+    else:
+        business = businesses.order_by("created_at").first()
+    if business is None:
+        return JsonResponse({"error": "Unknown business."}, status=404)
+
+    filters = parse_report_filters(request.GET)
+    today = timezone.localdate()
+
+    # data_version changes on every write to this business: no stale series
+    params = urlencode(report_filter_params(filters))
+    cache_key = "walkin_trends:{}:{}:{}:{}:{}".format(
+        user.pk,
+        business.pk,
+        business.data_version,
+        today.isoformat(),
+        hashlib.sha1(params.encode()).hexdigest(),
+    )
+    series = cache.get(cache_key)
+    if series is None:
+        try:
+            series = walkin_series(user, business, filters, today, settings.SERIES_MAX_POINTS)
+        except ValueError as exc:
+            return JsonResponse({"error": str(exc)}, status=400)
+        cache.set(cache_key, series, settings.SERIES_CACHE_SECONDS)
+
+    return JsonResponse({"business_id": business.pk, **series})
+
+
+def csv_export_walkins(qs, archived_qs=None):
     """
     Export walk-in records in CSV format according to the given queryset.
     This queryset is already filtered by selected business + filters.
+    If archived_qs is given, those (older) rows are written first.
     """
     response = HttpResponse(
         content_type="text/csv",
@@ -616,32 +984,155 @@ def csv_export_walkins(qs):
     )
 
     writer = csv.writer(response)
-    writer.writerow([
-        "Customer Name",
-        "Customer DOB",
-        "Purpose",
-        "Walk-in Date",
-        "In Time",
-        "Out Time",
-        "Contact Number",
-        "Companion",
-        "Relation",
-        "Notes",
-    ])
-
-    for r in qs.order_by("cust_walkin_date", "cust_clockin"):
-        writer.writerow([
-            r.cust_name or "",
-            r.cust_dob or "",
-            r.cust_visit_purpose or "",
-            r.cust_walkin_date or "",
-            r.cust_clockin or "",
-            r.cust_clockout or "",
-            r.cust_contact_number or "",
-            r.cust_companion or "",
-            r.cust_companion_relation or "",
-            (r.cust_notes or "").replace("\n", " "),
-        ])
+    writer.writerow(CSV_HEADER)
+
+    for r in iter_report_rows(qs, archived_qs):
+        writer.writerow(csv_row(r))
 
     return response
 
+
+def csv_delta_export(user, business, since_str):
+    """
+    CSV of the business's walk-ins created or changed after the `since`
+    watermark (all of them without one), for nightly back-office syncs.
+    Report filters don't apply. The X-Export-Watermark header is the
+    `since` of the next pull.
+
+    A change is stamped before its transaction commits, so the watermark
+    trails the clock by DELTA_EXPORT_SETTLE_SECONDS; anything newer is
+    left for the next pull. Archived visits are not included.
+    """
+    since = None
+    if since_str:
+        since = parse_watermark(since_str)
+        if since is None:
+            return HttpResponseBadRequest("since must be a watermark from X-Export-Watermark.")
+
+    until = timezone.now() - timedelta(seconds=settings.DELTA_EXPORT_SETTLE_SECONDS)
+    if since is not None:
+        # Never hand out an older watermark than the client already has
+        until = max(until, since)
+
+    response = HttpResponse(
+        content_type="text/csv",
+        headers={
+            "Content-Disposition": 'attachment; filename="walkins-delta.csv"',
+            "X-Export-Watermark": format_watermark(until),
+        },
+    )
+
+    writer = csv.writer(response)
+    writer.writerow(DELTA_CSV_HEADER)
+
+    for r in iter_delta_rows(user, business, since, until):
+        writer.writerow(delta_csv_row(r))
+
+    return response
+
+
+def csv_usage_export(businesses, month_str):
+    """
+    Billing CSV: walk-ins and exports per business for one month
+    (month=YYYY-MM, default this month), read from the usage counters.
+    """
+    if month_str:
+        try:
+            month = parse_date(f"{month_str}-01") if len(month_str) == 7 else None
+        except ValueError:
+            month = None
+        if month is None:
+            return HttpResponseBadRequest("month must look like YYYY-MM.")
+    else:
+        month = month_of(timezone.localdate())
+
+    usage = monthly_usage(businesses, month)
+    response = HttpResponse(
+        content_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="usage-{month:%Y-%m}.csv"'},
+    )
+
+    writer = csv.writer(response)
+    writer.writerow(USAGE_CSV_HEADER)
+    for row in usage["rows"]:
+        writer.writerow([f"{month:%Y-%m}", row["business_id"], row["name"], row["walkins"], row["exports"]])
+
+    return response
+
+
+def html_report_walkins(business, filters, qs, archived_qs=None):
+    """
+    Printable report of every filtered walk-in (oldest first). The page
+    head is sent at once, then the table in chunks of REPORT_CHUNK_ROWS
+    rows read through a server-side cursor, so memory stays flat however
+    many rows match; the row count comes last.
+    """
+    # The body is rendered after the view returns, outside the request's
+    # tenant / replica routing: pin each queryset to its database now
+    qs = qs.using(qs.db)
+    if archived_qs is not None:
+        archived_qs = archived_qs.using(archived_qs.db)
+
+    head = loader.get_template("full_report_head.html")
+    rows = loader.get_template("full_report_rows.html")
+    foot = loader.get_template("full_report_foot.html")
+
+    def render():
+        yield head.render({
+            "business": business,
+            "filters": filters,
+            "generated_at": timezone.localtime(),
+        })
+        total = 0
+        chunk = []
+        for r in iter_report_rows(qs, archived_qs):
+            chunk.append(r)
+            if len(chunk) == REPORT_CHUNK_ROWS:
+                yield rows.render({"rows": chunk})
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            yield rows.render({"rows": chunk})
+            total += len(chunk)
+        yield foot.render({"total": total})
+
+    response = StreamingHttpResponse(render(), content_type="text/html; charset=utf-8")
+    # Let proxies (e.g. nginx) pass chunks on instead of buffering the page
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@login_required
+def export_download(request, job_id):
+    """
+    Download the file produced by a finished background export job.
+    """
+    job = get_object_or_404(
+        ExportJob, pk=job_id, owner=request.user, status=ExportJob.STATUS_DONE
+    )
+
+    path = Path(settings.MEDIA_ROOT) / job.file_name
+    if not path.is_file():
+        raise Http404("Export file no longer exists.")
+
+    content_type = "application/gzip" if job.file_format == ExportJob.FORMAT_CSV_GZ else "text/csv"
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=True,
+        filename=path.name,
+        content_type=content_type,
+    )
+
+
+# Content-hashed, so a URL's bytes never change
+@cache_control(public=True, max_age=365 * 24 * 3600, immutable=True)
+def logo_file(request, name):
+    """
+    Serve a logo thumbnail written by walkinplus_app.logos.
+    """
+    if not THUMBNAIL_NAME.match(name):
+        raise Http404("No such logo.")
+    path = Path(settings.MEDIA_ROOT) / LOGO_DIR / name
+    if not path.is_file():
+        raise Http404("No such logo.")
+    return FileResponse(open(path, "rb"), content_type=LOGO_CONTENT_TYPES[path.suffix[1:]])
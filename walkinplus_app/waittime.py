@@ -0,0 +1,185 @@
+"""
+Live wait-time estimator. Each business keeps one WaitTimeEstimate row for
+all purposes ("") plus one per visit purpose. A walk-in or clock-out only
+touches those two rows, so the estimate never scans CustomerDetails;
+batches lock and write each row once.
+"""
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import CustomerDetails, WaitTimeEstimate
+from .purposes import purpose_key
+from .routers import tenant_db
+
+ALL_PURPOSES = ""
+
+# Durations outside this range are typos / forgotten clock-outs, not samples
+MAX_VISIT_SECONDS = 12 * 60 * 60
+
+
+def _locked_rows(business_id, *purposes):
+    keys = {ALL_PURPOSES, *(purpose_key(p) for p in purposes)}
+    locked = WaitTimeEstimate.objects.select_for_update().filter(business_id=business_id, purpose__in=keys)
+
+    rows = list(locked)
+    missing = keys - {row.purpose for row in rows}
+    if missing:
+        # First visit for this purpose: create the rows, then lock them
+        WaitTimeEstimate.objects.bulk_create(
+            [WaitTimeEstimate(business_id=business_id, purpose=key) for key in missing],
+            ignore_conflicts=True,
+        )
+        rows = list(locked.all())
+    return rows
+
+
+def _ewma(old, sample, has_previous):
+    if not has_previous:
+        return sample
+    alpha = settings.WAIT_ESTIMATE_ALPHA
+    return alpha * sample + (1 - alpha) * old
+
+
+def record_walkin(business_id, purpose):
+    record_walkins(business_id, [purpose])
+
+
+def record_walkins(business_id, purposes):
+    """
+    Several walk-ins of one business (one purpose per walk-in) in one
+    locked read and one UPDATE.
+    """
+    counts = Counter(purpose_key(p) for p in purposes)
+    now = timezone.now()
+    with transaction.atomic(using=tenant_db()):
+        rows = _locked_rows(business_id, *counts)
+        for row in rows:
+            row.queue_depth += sum(counts.values()) if row.purpose == ALL_PURPOSES else counts[row.purpose]
+            row.updated_at = now
+        WaitTimeEstimate.objects.bulk_update(rows, ["queue_depth", "updated_at"])
+
+
+def record_clockout(business_id, purpose, walkin_date, clockin, clockout_at):
+    """
+    One visit closed at clockout_at (aware datetime).
+    """
+    record_clockouts(business_id, [(purpose, walkin_date, clockin, clockout_at)])
+
+
+def record_clockouts(business_id, clockouts):
+    """
+    Several closed visits of one business, as (purpose, walkin_date,
+    clockin, clockout_at) tuples: every estimate row involved is locked
+    once and all rows are written in one UPDATE, however many visits.
+    """
+    # Applied in clock-out order, as if they had been recorded one by one
+    clockouts = sorted(clockouts, key=lambda c: c[3])
+    if not clockouts:
+        return
+
+    now = timezone.now()
+    with transaction.atomic(using=tenant_db()):
+        rows = {row.purpose: row for row in _locked_rows(business_id, *(c[0] for c in clockouts))}
+        for purpose, walkin_date, clockin, clockout_at in clockouts:
+            clockin_at = timezone.make_aware(datetime.combine(walkin_date, clockin))
+            duration = (clockout_at - clockin_at).total_seconds()
+            for key in {ALL_PURPOSES, purpose_key(purpose)}:
+                _apply_clockout(rows[key], duration, clockout_at)
+        for row in rows.values():
+            row.updated_at = now
+        WaitTimeEstimate.objects.bulk_update(
+            rows.values(),
+            [
+                "queue_depth", "avg_duration_seconds", "duration_samples",
+                "avg_gap_seconds", "last_clockout_at", "updated_at",
+            ],
+        )
+
+
+def _apply_clockout(row, duration, clockout_at):
+    waiting_before = row.queue_depth
+    row.queue_depth = max(row.queue_depth - 1, 0)
+
+    if 0 <= duration <= MAX_VISIT_SECONDS:
+        row.avg_duration_seconds = _ewma(row.avg_duration_seconds, duration, row.duration_samples > 0)
+        row.duration_samples += 1
+
+    # Gap since the previous clock-out only measures queue speed if
+    # someone else was waiting the whole time (not idle / overnight)
+    if row.last_clockout_at and waiting_before > 1:
+        gap = (clockout_at - row.last_clockout_at).total_seconds()
+        if 0 <= gap <= MAX_VISIT_SECONDS:
+            row.avg_gap_seconds = _ewma(row.avg_gap_seconds, gap, row.avg_gap_seconds > 0)
+    row.last_clockout_at = clockout_at
+
+
+def _wait_minutes(row):
+    if not row.duration_samples and not row.avg_gap_seconds:
+        return None
+    per_patient = row.avg_gap_seconds or row.avg_duration_seconds
+    return round(row.queue_depth * per_patient / 60)
+
+
+def estimated_wait(business_id):
+    """
+    {"queue_depth": n, "wait_minutes": m or None, "purposes": [...]} for a
+    new walk-in, plus the same per visit purpose that has patients waiting
+    (busiest first) as {"purpose", "queue_depth", "wait_minutes"}.
+    Uses how fast the queue has been moving; falls back to the average
+    visit length (one patient at a time) until enough clock-outs are seen.
+    """
+    overall = None
+    purposes = []
+    for row in WaitTimeEstimate.objects.filter(business_id=business_id):
+        if row.purpose == ALL_PURPOSES:
+            overall = row
+        elif row.queue_depth:
+            purposes.append({
+                "purpose": row.purpose,
+                "queue_depth": row.queue_depth,
+                "wait_minutes": _wait_minutes(row),
+            })
+    if overall is None:
+        return {"queue_depth": 0, "wait_minutes": None, "purposes": []}
+
+    purposes.sort(key=lambda p: (-p["queue_depth"], p["purpose"]))
+    return {"queue_depth": overall.queue_depth, "wait_minutes": _wait_minutes(overall), "purposes": purposes}
+
+
+def resync_queue_depths(business_ids):
+    """
+    Reset queue_depth from today's open visits (one grouped query). Used by
+    batch jobs that close visits in bulk, where per-visit updates would be
+    wasteful.
+    """
+    business_ids = set(business_ids)
+    if not business_ids:
+        return
+
+    today = timezone.localdate()
+    open_counts = {}
+    rows = (
+        CustomerDetails.objects.filter(
+            business_id__in=business_ids,
+            cust_walkin_date=today,
+            cust_clockout__isnull=True,
+        )
+        .values("business_id", "cust_visit_purpose")
+        .annotate(n=Count("pk"))
+    )
+    for row in rows:
+        for key in (ALL_PURPOSES, purpose_key(row["cust_visit_purpose"])):
+            k = (row["business_id"], key)
+            open_counts[k] = open_counts.get(k, 0) + row["n"]
+
+    with transaction.atomic(using=tenant_db()):
+        for estimate in WaitTimeEstimate.objects.select_for_update().filter(business_id__in=business_ids):
+            depth = open_counts.get((estimate.business_id, estimate.purpose), 0)
+            if estimate.queue_depth != depth:
+                estimate.queue_depth = depth
+                estimate.save(update_fields=["queue_depth", "updated_at"])
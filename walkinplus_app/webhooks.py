@@ -0,0 +1,279 @@
+"""
+Outbound webhooks for walk-in events (SMS reminders, billing, ...).
+
+Events are written to an outbox table (WebhookEvent) in the same
+transaction as the walk-in change, so an event exists if and only if the
+change committed. A small in-process thread pool delivers them after the
+commit; the dispatch_webhooks command retries failures and picks up
+anything a restarted worker left behind.
+
+Each endpoint gets its due events POSTed in batches, with at most
+WEBHOOK_CONCURRENCY_PER_ENDPOINT batches in flight per endpoint, so one
+slow receiver cannot hold up the others. Failed batches are retried with
+exponential backoff. Delivery is at least once: receivers should ignore
+event ids they have already seen.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import random
+import threading
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.client import HTTPException
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import WebhookEvent
+from .routers import tenant_database, tenant_db
+from .sharding import tenant_database_aliases
+
+logger = logging.getLogger(__name__)
+
+# Longest wait between two attempts of one event
+MAX_RETRY_SECONDS = 3600
+
+# A claimed batch not finished in this time is assumed lost (worker killed)
+CLAIM_SECONDS = 300
+
+
+# ---------- OUTBOX ----------
+
+def visit_payload(visit):
+    """
+    The event data for a CustomerDetails row (or a dict of its fields).
+    """
+    if isinstance(visit, dict):
+        get = visit.get
+    else:
+        def get(name):
+            return getattr(visit, name)
+    clockout = get("cust_clockout")
+    return {
+        "visit_id": get("pk"),
+        "name": get("cust_name"),
+        "phone": get("cust_contact_number"),
+        "purpose": get("cust_visit_purpose"),
+        "walkin_date": get("cust_walkin_date").isoformat(),
+        "clockin": get("cust_clockin").isoformat(timespec="seconds"),
+        "clockout": clockout.isoformat(timespec="seconds") if clockout else None,
+    }
+
+
+def enqueue_events(business_id, event_type, visits):
+    """
+    Add one event per visit (and configured endpoint) to the outbox. Call
+    inside the transaction that makes the change; delivery starts once it
+    commits. No-op when no endpoints are configured.
+    """
+    if not settings.WEBHOOK_ENDPOINTS or not visits:
+        return
+    now = timezone.now()
+    events = []
+    for visit in visits:
+        payload = {
+            "id": uuid.uuid4().hex,   # same for every endpoint: receivers dedupe on it
+            "type": event_type,
+            "business_id": business_id,
+            "occurred_at": now.isoformat(),
+            "data": visit_payload(visit),
+        }
+        events.extend(
+            WebhookEvent(business_id=business_id, endpoint=endpoint, event_type=event_type, payload=payload)
+            for endpoint in settings.WEBHOOK_ENDPOINTS
+        )
+    WebhookEvent.objects.bulk_create(events)
+
+    database = tenant_db()
+    transaction.on_commit(lambda: get_dispatcher().kick(database), using=database)
+
+
+# ---------- DELIVERY ----------
+
+def sign(body):
+    return hmac.new(settings.WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+def post_batch(url, events):
+    """
+    POST {"events": [...]} to url; raises OSError (URLError / HTTPError) on
+    a network error or a non-2xx reply.
+    """
+    body = json.dumps({"events": events}).encode()
+    request = urllib.request.Request(url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "X-WalkinPlus-Signature": f"sha256={sign(body)}",
+    })
+    with urllib.request.urlopen(request, timeout=settings.WEBHOOK_TIMEOUT_SECONDS) as response:
+        response.read()
+
+
+def retry_delay(attempts):
+    """
+    Seconds before the next try after `attempts` failed ones: exponential,
+    capped, with jitter so a recovering endpoint isn't hit all at once.
+    """
+    delay = min(settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1), MAX_RETRY_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(endpoint):
+    """
+    Claim up to WEBHOOK_BATCH_SIZE due events of one endpoint on the current
+    tenant database. Returns the claimed rows (oldest first).
+    """
+    now = timezone.now()
+    due = list(
+        WebhookEvent.objects.filter(
+            endpoint=endpoint,
+            status=WebhookEvent.STATUS_PENDING,
+            next_attempt_at__lte=now,
+        )
+        .order_by("next_attempt_at", "pk")
+        .values_list("pk", flat=True)[:settings.WEBHOOK_BATCH_SIZE]
+    )
+    if not due:
+        return []
+
+    # Conditional UPDATE: of several dispatchers, each row goes to one
+    claim = uuid.uuid4().hex
+    WebhookEvent.objects.filter(
+        pk__in=due,
+        status=WebhookEvent.STATUS_PENDING,
+        next_attempt_at__lte=now,
+    ).update(claim=claim, next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS))
+    return list(WebhookEvent.objects.filter(claim=claim).order_by("pk"))
+
+
+def deliver_batch(endpoint, events):
+    """
+    Send claimed events to their endpoint and record the outcome.
+    """
+    try:
+        post_batch(settings.WEBHOOK_ENDPOINTS[endpoint], [event.payload for event in events])
+    except (OSError, HTTPException, ValueError) as exc:
+        error = str(exc)[:1000] or exc.__class__.__name__
+        logger.warning("Webhook delivery to %s failed: %s", endpoint, error)
+        now = timezone.now()
+        for event in events:
+            event.attempts += 1
+            event.last_error = error
+            event.claim = ""
+            if event.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+                event.status = WebhookEvent.STATUS_FAILED
+            else:
+                event.next_attempt_at = now + timedelta(seconds=retry_delay(event.attempts))
+        WebhookEvent.objects.bulk_update(
+            events, ["attempts", "last_error", "claim", "status", "next_attempt_at"]
+        )
+        return False
+
+    WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+        status=WebhookEvent.STATUS_DELIVERED,
+        attempts=F("attempts") + 1,
+        claim="",
+        last_error="",
+        delivered_at=timezone.now(),
+    )
+    return True
+
+
+def drain(endpoint, database, more_due=None):
+    """
+    Deliver due events of one endpoint on one tenant database until none
+    are left or the endpoint fails. more_due() is called when a full batch
+    was claimed, i.e. a parallel sender would find work too.
+    """
+    with tenant_database(database):
+        while True:
+            events = claim_batch(endpoint)
+            if not events:
+                return
+            if more_due is not None and len(events) == settings.WEBHOOK_BATCH_SIZE:
+                more_due()
+            if not deliver_batch(endpoint, events):
+                # Failing endpoint: leave the rest until the backoff has passed
+                return
+
+
+# ---------- DISPATCHER POOL ----------
+
+class WebhookDispatcher:
+    """
+    Thread pool that runs drain() with at most WEBHOOK_CONCURRENCY_PER_ENDPOINT
+    senders per endpoint. kick() asks for a database to be drained; a sender
+    that is already running picks the request up, so kicks never queue up.
+    """
+
+    def __init__(self, workers):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="walkinplus-webhook")
+        self._idle = threading.Condition()
+        self._senders = defaultdict(int)   # endpoint -> running senders
+        self._wanted = defaultdict(set)    # endpoint -> databases to drain
+
+    def kick(self, database=None):
+        """
+        Deliver what is due on database (default: every tenant database).
+        """
+        databases = [database] if database else tenant_database_aliases()
+        for endpoint in settings.WEBHOOK_ENDPOINTS:
+            with self._idle:
+                self._wanted[endpoint].update(databases)
+            self._start(endpoint)
+
+    def wait_idle(self, timeout=None):
+        """
+        Block until no sender is running; returns False on timeout.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not any(self._senders.values()), timeout)
+
+    def _start(self, endpoint):
+        with self._idle:
+            if self._senders[endpoint] >= settings.WEBHOOK_CONCURRENCY_PER_ENDPOINT:
+                return
+            self._senders[endpoint] += 1
+        self._pool.submit(self._send, endpoint)
+
+    def _send(self, endpoint):
+        try:
+            while True:
+                with self._idle:
+                    if not self._wanted[endpoint]:
+                        self._senders[endpoint] -= 1
+                        self._idle.notify_all()
+                        return
+                    database = self._wanted[endpoint].pop()
+
+                def more_due(database=database):
+                    with self._idle:
+                        self._wanted[endpoint].add(database)
+                    self._start(endpoint)
+
+                try:
+                    drain(endpoint, database, more_due)
+                except Exception:
+                    # Claimed rows become due again after CLAIM_SECONDS
+                    logger.exception("Webhook dispatch to %s on %s failed", endpoint, database)
+        finally:
+            # Worker threads keep their own DB connections; don't leak them
+            close_old_connections()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = WebhookDispatcher(settings.WEBHOOK_WORKERS)
+    return _dispatcher